@@ -1,5 +1,5 @@
 import React, { useEffect, useState, useRef } from 'react';
-import { initializeSocket, getSocket, sendMessage, onReceiveMessage, joinUserRoom, sendReaction, onReaction, sendTyping, onTyping, onMessageSentAck, sendSticker, requestContactsList, onCommandResponse, sendFriendRequest, onFriendRequestReceived, sendFriendAccept, sendFriendReject, onFriendAccepted, onFriendRejected, sendBlockUser, sendUnblockUser, onUserBlocked, requestContactsSync, onContactUpdated, onUserJoined, onUserOffline } from '../../services/socket';
+import { initializeSocket, getSocket, sendMessage, onReceiveMessage, joinUserRoom, sendReaction, onReaction, onMessageRecalled, sendTyping, onTyping, onMessageSentAck, sendSticker, requestContactsList, onCommandResponse, sendFriendRequest, onFriendRequestReceived, sendFriendAccept, sendFriendReject, onFriendAccepted, onFriendRejected, sendBlockUser, sendUnblockUser, onUserBlocked, requestContactsSync, onContactUpdated, onUserJoined, onUserOffline } from '../../services/socket';
 import { showToast, showSystemNotification, playSound } from '../../services/notifications';
 import api, { userAPI, messageAPI, groupAPI } from '../../services/api';
 import profileSync from '../../services/profileSync';
@@ -586,6 +586,21 @@ const ChatBox = () => {
         });
     });
 
+    // A recalled message becomes a tombstone in place (same id and position)
+    onMessageRecalled((data) => {
+      const msgId = data?.message_id;
+      if (!msgId) return;
+      setMessages((prev) => prev.map((m) => (String(m.id) === String(msgId)
+        ? { ...m, recalled: true, recalled_at: data.recalled_at, content: '', file_url: null, sticker_id: null, sticker_url: null }
+        : m)));
+      setReactions((prev) => {
+        if (!prev[msgId]) return prev;
+        const copy = { ...prev };
+        delete copy[msgId];
+        return copy;
+      });
+    });
+
     // Presence: listen for users joining/leaving to update online status in lists
     try {
       onUserJoined((payload) => {
@@ -853,20 +868,24 @@ const ChatBox = () => {
         const ev = payload?.event;
         const data = payload?.data;
 
-        // Server may send a single profile object for PROFILE_UPDATED
+        // PROFILE_UPDATED carries only the changed fields (see data.changed)
         if (ev === 'PROFILE_UPDATED' && data) {
-          const u = data;
-          const busted = cacheBustUrl(u.avatar_url);
-          // Update users list (replace or prepend)
+          const u = { ...data };
+          delete u.changed;
+          const busted = 'avatar_url' in u ? cacheBustUrl(u.avatar_url) : undefined;
+          const patch = busted === undefined ? u : { ...u, avatar_url: busted };
+          // name for the toast below: the diff only names the user when the name itself changed
+          const cached = profileSync.getLocalProfile(String(u.id)) || {};
+          const name = u.display_name || u.username || cached.display_name || cached.username;
+          // Update users list; the diff is partial, so users not in the list are left out
+          // (they are loaded with their full profile the next time the list is fetched)
           setUsers((prev) => {
             try {
               const idx = prev.findIndex((p) => String(p.id) === String(u.id));
-              if (idx !== -1) {
-                const copy = [...prev];
-                copy[idx] = { ...copy[idx], ...u, avatar_url: busted || copy[idx].avatar_url };
-                return copy;
-              }
-              return [{ id: u.id, username: u.username, display_name: u.display_name, avatar_url: busted, status: u.status }, ...prev];
+              if (idx === -1) return prev;
+              const copy = [...prev];
+              copy[idx] = { ...copy[idx], ...u, avatar_url: busted || copy[idx].avatar_url };
+              return copy;
             } catch (e) {
               return prev;
             }
@@ -875,35 +894,39 @@ const ChatBox = () => {
           // Update selected user view if open
           try {
             if (selectedUser && String(selectedUser.id) === String(u.id)) {
-              setSelectedUser((s) => ({ ...s, ...u, avatar_url: busted }));
+              setSelectedUser((s) => ({ ...s, ...patch }));
             }
           } catch (e) {}
 
           // If this is current user, refresh local profile cache
           try {
             if (String(currentUserId) === String(u.id)) {
-              setCurrentUserProfile((p) => ({ ...p, ...u, avatar_url: busted }));
+              setCurrentUserProfile((p) => ({ ...p, ...patch }));
             }
-            // persist to local profile cache so other tabs pick it up
-            try { profileSync.saveLocalProfile(String(u.id), { ...u, avatar_url: busted }); } catch (e) {}
+            // persist to local profile cache so other tabs pick it up (merged: the update is partial)
+            try { profileSync.saveLocalProfile(String(u.id), { ...(profileSync.getLocalProfile(String(u.id)) || {}), ...patch }); } catch (e) {}
           } catch (e) {}
 
           // Force-update any DOM <img> elements for this user to ensure browser reloads image immediately
-          try {
-            const finalSrc = buildAvatarSrc(busted);
-            const imgs = Array.from(document.querySelectorAll(`img[data-user-id="${u.id}"]` || []));
-            imgs.forEach((img) => {
-              try {
-                img.src = finalSrc;
-                try { console.log('[AVATAR] forced reload for user ->', u.id, finalSrc); } catch (e) {}
-                try { setLastAvatarReload({ id: u.id, url: finalSrc, ts: Date.now() }); } catch (e) {}
-              } catch (e) {}
-            });
-          } catch (e) {}
+          if (busted !== undefined) {
+            try {
+              const finalSrc = buildAvatarSrc(busted);
+              const imgs = Array.from(document.querySelectorAll(`img[data-user-id="${u.id}"]` || []));
+              imgs.forEach((img) => {
+                try {
+                  img.src = finalSrc;
+                  try { console.log('[AVATAR] forced reload for user ->', u.id, finalSrc); } catch (e) {}
+                  try { setLastAvatarReload({ id: u.id, url: finalSrc, ts: Date.now() }); } catch (e) {}
+                } catch (e) {}
+              });
+            } catch (e) {}
+          }
 
           // Show subtle notification
-          showToast('Hồ sơ', `${u.display_name || u.username} đã cập nhật hồ sơ`);
-          showSystemNotification('Hồ sơ', `${u.display_name || u.username} đã cập nhật hồ sơ`);
+          if (name) {
+            showToast('Hồ sơ', `${name} đã cập nhật hồ sơ`);
+            showSystemNotification('Hồ sơ', `${name} đã cập nhật hồ sơ`);
+          }
 
           return;
         }
@@ -57,9 +57,11 @@ const MessageBubble = ({ message, isSent, onReply, onReaction, onEmojiHover, onR
   };
 
   const emoticons = ['❤️', '😂', '😮', '😢', '🔥', '👍'];
+  // Recalled messages arrive as tombstones (no content, file or sticker)
+  const isSticker = message.message_type === 'sticker' && !message.recalled;
 
   return (
-    <div className={`message-bubble ${isSent ? 'sent' : 'received'} ${message.message_type === 'sticker' ? 'sticker-bubble' : ''}`}
+    <div className={`message-bubble ${isSent ? 'sent' : 'received'} ${isSticker ? 'sticker-bubble' : ''}`}
       onMouseEnter={() => setShowActions(true)}
       onMouseLeave={() => setShowActions(false)}
     >
@@ -77,8 +79,10 @@ const MessageBubble = ({ message, isSent, onReply, onReaction, onEmojiHover, onR
         </div>
       )}
 
-  <div className={`message-content ${message.message_type === 'sticker' ? 'sticker-content' : ''}`}>
-        {message.message_type === 'sticker' ? (
+  <div className={`message-content ${isSticker ? 'sticker-content' : ''}`}>
+        {message.recalled ? (
+          <div style={{ fontStyle: 'italic', opacity: 0.7 }}>Tin nhắn đã được thu hồi</div>
+        ) : isSticker ? (
           // Hiển thị sticker: không còn nền bọc, chỉ show ảnh lớn hơn
           <div style={{ display: 'inline-block' }}>
             <img
@@ -250,7 +254,7 @@ const MessageBubble = ({ message, isSent, onReply, onReaction, onEmojiHover, onR
       </div>
 
       {/* Show reactions if any */}
-      {message.reactions && Object.keys(message.reactions).length > 0 && (
+      {!message.recalled && message.reactions && Object.keys(message.reactions).length > 0 && (
         <div style={{ marginTop: '4px', fontSize: '14px' }}>
           {Object.entries(message.reactions).map(([emoji, users]) => (
             <span key={emoji} style={{ marginRight: '4px' }}>
@@ -261,7 +265,7 @@ const MessageBubble = ({ message, isSent, onReply, onReaction, onEmojiHover, onR
       )}
 
       {/* Action buttons */}
-      {showActions && (
+      {showActions && !message.recalled && (
         <div style={{
           position: 'absolute',
           top: '-40px',
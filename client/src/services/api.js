@@ -175,7 +175,8 @@ export const authAPI = {
 
 // User APIs
 export const userAPI = {
-  getUsers: () => api.get('/users'),
+  // keyset pages: pass the previous response's X-Next-Cursor header as afterId
+  getUsers: ({ afterId, limit, fields } = {}) => api.get('/users', { params: { after_id: afterId, limit, fields } }),
   searchUsers: (q) => api.get('/users/search', { params: { q } }),
   getSuggestions: (limit = 10) => api.get('/users/suggestions', { params: { limit } }),
   getUserById: (userId) => api.get(`/users/${userId}`),
@@ -195,6 +196,11 @@ export const groupAPI = {
 };
 
 // Message APIs (Bổ sung phần thiếu này)
+export const presenceAPI = {
+  // { presence: { "<id>": { online, last_seen } } }
+  getPresence: (ids) => api.get('/presence', { params: { ids: ids.join(',') } }),
+};
+
 export const messageAPI = {
   getConversations: () => api.get('/messages/conversations'),
   getMessages: (userId) => api.get(`/messages/${userId}`),
@@ -64,6 +64,21 @@ export const initializeSocket = () => {
     console.error('❌ [SOCKET] Connection error:', error);
   });
 
+  // The server may coalesce fan-out events into one `batch` frame
+  // ({ events: [{ event, data }, ...] }); replay them to the normal listeners.
+  socket.on('batch', (frame) => {
+    const events = (frame && frame.events) || [];
+    events.forEach(({ event, data }) => {
+      socket.listeners(event).forEach((listener) => {
+        try {
+          listener(data);
+        } catch (e) {
+          console.error(`[SOCKET] Error in ${event} listener (batch):`, e);
+        }
+      });
+    });
+  });
+
   return socket;
 };
 
@@ -119,7 +134,10 @@ export const joinUserRoom = (userId) => {
     return;
   }
   if (isDev) console.debug(`[JOIN] ✅ Socket connected, emitting join event...`);
-  sock.emit('join', { user_id: userId });
+  // the server only attaches the socket to user-<id> when the token belongs to that user
+  const token = localStorage.getItem('token') || sessionStorage.getItem('token');
+  // 'batch': this client unpacks coalesced `batch` frames (see initializeSocket)
+  sock.emit('join', { user_id: userId, token, capabilities: ['batch'] });
   if (isDev) console.debug(`[JOIN] ✅ Join event emitted for user_id: ${userId}\n`);
 };
 
@@ -226,6 +244,16 @@ export const onReaction = (callback) => {
   });
 };
 
+// Lắng nghe thu hồi tin nhắn: { message_id, recalled_at }
+export const onMessageRecalled = (callback) => {
+  const sock = getSocket();
+  sock.off('message_recalled');
+  sock.on('message_recalled', (data) => {
+    if (isDev) console.debug('[RECALLED]', data);
+    callback(data);
+  });
+};
+
 // Lắng nghe typing indicator (setup once, auto-cleanup old listeners)
 export const onTyping = (callback) => {
   const sock = getSocket();
@@ -249,6 +277,22 @@ export const onUserJoined = (callback) => {
   sock.on('user_joined', callback);
 };
 
+// Presence subscription: one `presence_snapshot` ({ presence: { id: { online, last_seen } } })
+// followed by a `presence_diff` ({ user_id, online, last_seen }) for every change.
+export const subscribePresence = (ids, onSnapshot, onDiff) => {
+  const sock = getSocket();
+  sock.off('presence_snapshot');
+  sock.off('presence_diff');
+  sock.on('presence_snapshot', (data) => onSnapshot && onSnapshot(data.presence || {}));
+  sock.on('presence_diff', (diff) => onDiff && onDiff(diff));
+  sock.emit('presence_subscribe', { ids });
+};
+
+export const unsubscribePresence = (ids = null) => {
+  const sock = getSocket();
+  sock.emit('presence_unsubscribe', ids ? { ids } : {});
+};
+
 // Send friend request using the command pattern
 export const sendFriendRequest = ({ target_user_id = null, target_phone = null, token = null }) => {
   const cmd = { action: 'FRIEND_REQUEST', data: {}, token };
@@ -322,11 +366,27 @@ export const requestContactsSync = (contacts = [], token = null) => {
   sendCommand({ action: 'CONTACTS_SYNC', data: { contacts }, token });
 };
 
+// Delta sync against the `hash` returned by the last CONTACTS_SYNC_RESULT.
+// A result with `resync: true` means the server needs the full list again.
+export const requestContactsSyncDelta = ({ hash, added = [], removed = [] }, token = null) => {
+  sendCommand({ action: 'CONTACTS_SYNC', data: { hash, added, removed }, token });
+};
+
+// Highest profile_version seen per user id; PROFILE_UPDATED carries only the
+// changed fields, so an older or repeated version must not overwrite newer data.
+const profileVersions = new Map();
+
 export const onContactUpdated = (callback) => {
   const sock = getSocket();
   sock.off('contact_updated');
   sock.on('contact_updated', (data) => {
     if (isDev) console.debug('[CONTACT_UPDATED]', data);
+    const profile = data && data.event === 'PROFILE_UPDATED' ? data.data : null;
+    if (profile && profile.profile_version != null) {
+      const key = String(profile.id);
+      if (profile.profile_version <= (profileVersions.get(key) || 0)) return;
+      profileVersions.set(key, profile.profile_version);
+    }
     callback(data);
   });
 };
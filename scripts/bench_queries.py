@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Repeatable query benchmark for the storage layer.
+
+Runs the read endpoints through the Flask test client against a SQLite file
+(normally produced by scripts/generate_synthetic_data.py) and reports, per
+endpoint:
+- latency p50/p95/max over --iterations requests
+- number of SQL statements issued per request (N+1 patterns show up here)
+- the EXPLAIN QUERY PLAN of each distinct statement, and an estimate of rows
+  scanned: full `SCAN <table>` steps (no index) count the whole table
+
+  python3 scripts/bench_queries.py --db /tmp/bench.db --iterations 20 --json before.json
+
+Endpoints: GET /messages, /messages/conversations, /friends, /users/search,
+/users/suggestions. The benchmark only reads; it never writes to the database.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from bench_stats import percentile
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SERVER_DIR = os.path.join(ROOT_DIR, 'server')
+
+
+def load_app(db_path):
+    os.environ['CHAT_DB_PATH'] = db_path
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('METRICS_ENABLED', 'false')
+    sys.path.insert(0, SERVER_DIR)
+    from app import app
+    return app
+
+
+class StatementRecorder:
+    """Collect the SQL statements executed while `active` is set."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.active = False
+        self.statements = []
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active:
+            self.statements.append((statement, parameters))
+
+
+def explain(engine, statement, parameters, table_rows):
+    """Return (plan lines, estimated rows scanned) for one statement."""
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+        plan = [row[-1] for row in cur.fetchall()]
+    except Exception as e:
+        return [f'(explain failed: {e})'], 0
+    finally:
+        raw.close()
+    scanned = 0
+    for line in plan:
+        m = re.match(r'SCAN (?:TABLE )?"?(\w+)"?', line)
+        if m and 'INDEX' not in line:
+            scanned += table_rows.get(m.group(1), 0)
+    return plan, scanned
+
+
+def pick_fixtures(engine):
+    """Pick realistic arguments: the chattiest pair and the best connected user."""
+    from sqlalchemy import text
+    with engine.connect() as conn:
+        pair = conn.execute(text('SELECT sender_id, receiver_id FROM message GROUP BY sender_id, receiver_id '
+                                 'ORDER BY COUNT(*) DESC LIMIT 1')).fetchone()
+        user = conn.execute(text("SELECT user_id FROM friend WHERE status = 'accepted' GROUP BY user_id "
+                                 'ORDER BY COUNT(*) DESC LIMIT 1')).fetchone()
+        tables = [r[0] for r in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))]
+        table_rows = {t: conn.execute(text(f'SELECT COUNT(*) FROM "{t}"')).scalar() for t in tables}
+    if not pair or not user:
+        raise SystemExit('database has no messages/friendships; run scripts/generate_synthetic_data.py first')
+    return pair, user[0], table_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark read endpoints against a SQLite file')
+    parser.add_argument('--db', required=True, help='SQLite file to benchmark')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=50, help='limit param for GET /messages')
+    parser.add_argument('--search', default='User 12', help='q param for /users/search')
+    parser.add_argument('--show-plans', action='store_true', help='Print the full query plans')
+    parser.add_argument('--json', dest='json_path', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    app = load_app(os.path.abspath(args.db))
+    from config.database import db
+    from models.user_model import User
+    from services.auth_service import create_token_for_user
+
+    with app.app_context():
+        engine = db.engine
+        (a, b), uid, table_rows = pick_fixtures(engine)
+        token = create_token_for_user(db.session.get(User, uid))
+    recorder = StatementRecorder(engine)
+    headers = {'Authorization': f'Bearer {token}'}
+    cases = [
+        ('GET /messages', f'/messages?sender_id={a}&receiver_id={b}&limit={args.limit}', {}),
+        ('GET /messages (no limit)', f'/messages?sender_id={a}&receiver_id={b}', {}),
+        ('GET /messages/conversations', '/messages/conversations', headers),
+        ('GET /friends', '/friends', headers),
+        ('GET /users/search', f'/users/search?q={args.search}', {}),
+        ('GET /users/suggestions', '/users/suggestions?limit=20', headers),
+    ]
+    print(f'Fixtures: pair=({a}, {b}) user={uid}; rows: ' +
+          ', '.join(f'{t}={n:,}' for t, n in sorted(table_rows.items()) if n))
+
+    client = app.test_client()
+    results = []
+    for name, url, hdrs in cases:
+        timings = []
+        status = None
+        for i in range(args.iterations):
+            recorder.active = i == 0
+            started = time.perf_counter()
+            resp = client.get(url, headers=hdrs)
+            timings.append(time.perf_counter() - started)
+            recorder.active = False
+            status = resp.status_code
+        distinct = {}
+        for stmt, params in recorder.statements:
+            distinct.setdefault(stmt, params)
+        plans, scanned = [], 0
+        with app.app_context():
+            for stmt, params in distinct.items():
+                plan, rows = explain(engine, stmt, params, table_rows)
+                plans.append({'sql': ' '.join(stmt.split())[:200], 'plan': plan, 'est_rows_scanned': rows})
+                scanned += rows
+        result = {
+            'endpoint': name,
+            'status': status,
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'max_ms': round(max(timings) * 1000, 2),
+            'statements': len(recorder.statements),
+            'est_rows_scanned': scanned,
+            'plans': plans,
+        }
+        recorder.statements = []
+        results.append(result)
+        print(f"{name:<30} status={status} p50={result['p50_ms']:>8}ms p95={result['p95_ms']:>8}ms "
+              f"statements={result['statements']:<5} est_rows_scanned={scanned:,}")
+        if args.show_plans:
+            for p in plans:
+                print(f"    {p['sql']}")
+                for line in p['plan']:
+                    print(f'      -> {line}')
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as fh:
+            json.dump({'db': os.path.abspath(args.db), 'iterations': args.iterations, 'results': results}, fh, indent=2)
+        print(f'Results written to {args.json_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Compare the threaded dev server (`python app.py`) with the production entry
+point (`python serve.py`, gevent) under the same socket load.
+
+For each mode the script starts the backend on a scratch SQLite file, runs
+scripts/bench_socket_load.py against it with identical parameters, samples the
+server's RSS and OS thread count while the load runs, then stops it:
+
+  python3 scripts/bench_server_modes.py --users 100 --rate 2 --duration 30
+  python3 scripts/bench_server_modes.py --modes threading,gevent,eventlet --json modes.json
+
+Only Linux is supported for the RSS/thread sampling (/proc); latencies work anywhere.
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SERVER_DIR = os.path.join(ROOT_DIR, 'server')
+LOAD_SCRIPT = os.path.join(ROOT_DIR, 'scripts', 'bench_socket_load.py')
+
+MODES = {
+    'threading': ['app.py'],
+    'gevent': ['serve.py'],
+    'eventlet': ['serve.py'],
+}
+
+
+def wait_for_port(port, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def proc_stats(pid):
+    """(rss_mb, threads) from /proc, or (None, None) elsewhere."""
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            fields = dict(line.split(':', 1) for line in fh if ':' in line)
+        return int(fields['VmRSS'].split()[0]) / 1024.0, int(fields['Threads'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def run_mode(mode, args, workdir):
+    db_path = os.path.join(workdir, f'{mode}.db')
+    if args.db:
+        shutil.copyfile(args.db, db_path)
+    env = dict(os.environ, CHAT_DB_PATH=db_path, BACKEND_PORT=str(args.port), BACKEND_HOST='127.0.0.1',
+               SOCKETIO_ASYNC_MODE=mode, AUTO_INIT_DB='true', LOG_LEVEL='WARNING', ENABLE_NGROK='false')
+    log_path = os.path.join(workdir, f'{mode}.log')
+    with open(log_path, 'w') as log:
+        server = subprocess.Popen([sys.executable] + MODES[mode], cwd=SERVER_DIR, env=env,
+                                  stdout=log, stderr=subprocess.STDOUT)
+    samples = []
+    stop = threading.Event()
+    try:
+        if not wait_for_port(args.port, args.startup_timeout):
+            raise RuntimeError(f'{mode}: server did not start, see {log_path}')
+
+        def sample():
+            while not stop.wait(1.0):
+                samples.append(proc_stats(server.pid))
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        out = os.path.join(workdir, f'{mode}.json')
+        url = f'http://127.0.0.1:{args.port}'
+        subprocess.run([sys.executable, LOAD_SCRIPT, '--url', url, '--users', str(args.users),
+                        '--rate', str(args.rate), '--duration', str(args.duration),
+                        '--prefix', f'modes_{mode}', '--json', out], check=True)
+        with open(out, encoding='utf-8') as fh:
+            result = json.load(fh)
+    finally:
+        stop.set()
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    rss = [s[0] for s in samples if s[0] is not None]
+    threads = [s[1] for s in samples if s[1] is not None]
+    result.update(mode=mode, peak_rss_mb=round(max(rss), 1) if rss else None,
+                  peak_threads=max(threads) if threads else None)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket latency: dev server vs production entry point')
+    parser.add_argument('--modes', default='threading,gevent', help='Comma separated: ' + ','.join(MODES))
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=2.0)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--db', help='Optional SQLite file to start from (copied per mode)')
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    parser.add_argument('--json', dest='json_path', help='Write all results to this JSON file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_modes_')
+    results = []
+    try:
+        for mode in args.modes.split(','):
+            print(f'\n##### {mode} #####')
+            results.append(run_mode(mode, args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    cols = [('mode', lambda r: r['mode']), ('msg/s', lambda r: r['throughput_msg_s']),
+            ('ack p50', lambda r: r['ack']['p50_ms']), ('ack p99', lambda r: r['ack']['p99_ms']),
+            ('dlv p50', lambda r: r['delivery']['p50_ms']), ('dlv p99', lambda r: r['delivery']['p99_ms']),
+            ('lost', lambda r: r['sent'] - r['delivered']), ('rss MB', lambda r: r['peak_rss_mb']),
+            ('threads', lambda r: r['peak_threads'])]
+    print('\n' + '  '.join(f'{name:>10}' for name, _ in cols))
+    for r in results:
+        print('  '.join(f'{str(get(r)):>10}' for _, get in cols))
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+        print(f'Results written to {args.json_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Socket load test: N simulated users chatting against a running backend.
+
+Every simulated user registers (if needed), logs in, connects a python-socketio
+client, emits `join` and then sends `send_message` to the next user at a fixed
+rate. For each message we record:
+- ack latency:      send -> `message_sent_ack` on the sender socket
+- delivery latency: send -> `receive_message` on the receiver socket
+
+At the end the script prints throughput and p50/p95/p99/max for both. Use
+`--json` to save the results and `--compare` to diff against a saved run, e.g.
+before and after a change to server/sockets/chat_events.py:
+
+  python3 scripts/bench_socket_load.py --users 50 --rate 2 --duration 30 --json before.json
+  python3 scripts/bench_socket_load.py --users 50 --rate 2 --duration 30 --compare before.json
+
+Configure the target via --url or the BACKEND_URL env var (default http://localhost:5000).
+Requires `requests` and `python-socketio[client]` (websocket-client).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import socketio
+
+from bench_stats import percentile
+
+BENCH_PREFIX = 'bench:'
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000.0, 2) if v is not None else None
+    return {
+        'count': len(values),
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1] if values else None),
+    }
+
+
+class Stats:
+    """Shared, lock protected counters for all simulated users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent_at = {}
+        self.sent = 0
+        self.ack_errors = 0
+        self.ack_latencies = []
+        self.delivery_latencies = []
+
+    def record_send(self, client_message_id):
+        with self.lock:
+            self.sent_at[client_message_id] = time.perf_counter()
+            self.sent += 1
+
+    def record_ack(self, data):
+        now = time.perf_counter()
+        with self.lock:
+            start = self.sent_at.get(data.get('client_message_id'))
+            if start is None:
+                return
+            if data.get('status') == 'sent':
+                self.ack_latencies.append(now - start)
+            else:
+                self.ack_errors += 1
+
+    def record_delivery(self, data):
+        now = time.perf_counter()
+        content = data.get('content') or ''
+        if not content.startswith(BENCH_PREFIX):
+            return
+        with self.lock:
+            start = self.sent_at.get(content[len(BENCH_PREFIX):])
+            if start is not None:
+                self.delivery_latencies.append(now - start)
+
+
+def login(http, base_url, username, password):
+    try:
+        http.post(f'{base_url}/register', json={'username': username, 'password': password,
+                                                  'display_name': username}, timeout=30)
+    except requests.RequestException:
+        pass
+    resp = http.post(f'{base_url}/login', json={'username': username, 'password': password}, timeout=30)
+    if resp.status_code != 200:
+        raise RuntimeError(f'login failed for {username}: {resp.status_code} {resp.text[:200]}')
+    body = resp.json()
+    return body.get('user_info', {}).get('id'), body.get('token')
+
+
+class SimulatedUser:
+    def __init__(self, index, user_id, token, stats, socket_url):
+        self.index = index
+        self.user_id = user_id
+        self.token = token
+        self.stats = stats
+        self.socket_url = socket_url
+        self.joined = threading.Event()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('connect', self._on_connect)
+        self.sio.on('user_joined', self._on_joined)
+        self.sio.on('message_sent_ack', stats.record_ack)
+        self.sio.on('receive_message', stats.record_delivery)
+
+    def _on_connect(self):
+        self.sio.emit('join', {'user_id': self.user_id, 'token': self.token})
+
+    def _on_joined(self, data):
+        if str(data.get('user_id')) == str(self.user_id):
+            self.joined.set()
+
+    def connect(self):
+        self.sio.connect(self.socket_url, transports=['websocket'])
+
+    def run(self, receiver_id, rate, deadline):
+        interval = 1.0 / rate
+        seq = 0
+        next_at = time.perf_counter()
+        while time.perf_counter() < deadline:
+            client_message_id = f'{self.index}-{seq}'
+            self.stats.record_send(client_message_id)
+            self.sio.emit('send_message', {
+                'sender_id': self.user_id,
+                'receiver_id': receiver_id,
+                'content': BENCH_PREFIX + client_message_id,
+                'client_message_id': client_message_id,
+            })
+            seq += 1
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def close(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+
+def print_comparison(result, baseline):
+    print('\n=== Compared with baseline ===')
+    for section in ('ack', 'delivery'):
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'):
+            new, old = result[section].get(key), baseline.get(section, {}).get(key)
+            if new is None or not old:
+                continue
+            print(f'{section:>8} {key:<7} {old:>9.2f} -> {new:>9.2f} ms ({(new - old) / old * 100:+.1f}%)')
+    old_tp, new_tp = baseline.get('throughput_msg_s'), result['throughput_msg_s']
+    if old_tp:
+        print(f'throughput        {old_tp:>9.2f} -> {new_tp:>9.2f} msg/s ({(new_tp - old_tp) / old_tp * 100:+.1f}%)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket send/receive latency benchmark')
+    parser.add_argument('--url', default=os.environ.get('BACKEND_URL', 'http://localhost:5000'), help='Backend base URL')
+    parser.add_argument('--socket-url', default=os.environ.get('SOCKET_URL'), help='Socket URL (defaults to --url)')
+    parser.add_argument('--users', type=int, default=10, help='Number of simulated users')
+    parser.add_argument('--rate', type=float, default=1.0, help='Messages per second sent by each user')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of sending')
+    parser.add_argument('--drain', type=float, default=5.0, help='Seconds to wait for outstanding ACKs/deliveries')
+    parser.add_argument('--prefix', default='bench_user', help='Username prefix for the simulated users')
+    parser.add_argument('--password', default='P@ssw0rd123', help='Password for the simulated users')
+    parser.add_argument('--json', dest='json_path', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file written by a previous --json run')
+    args = parser.parse_args()
+
+    if args.users < 2:
+        parser.error('--users must be at least 2 (each user messages the next one)')
+    socket_url = args.socket_url or args.url
+    stats = Stats()
+
+    print(f'Logging in {args.users} users against {args.url} ...')
+    http = requests.Session()
+    http.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=32))
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        accounts = list(pool.map(lambda i: login(http, args.url, f'{args.prefix}_{i}', args.password), range(args.users)))
+
+    users = [SimulatedUser(i, uid, token, stats, socket_url) for i, (uid, token) in enumerate(accounts)]
+    print(f'Connecting {len(users)} sockets to {socket_url} ...')
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        list(pool.map(lambda u: u.connect(), users))
+    for u in users:
+        if not u.joined.wait(10):
+            print(f'warning: user {u.user_id} did not confirm join', file=sys.stderr)
+
+    print(f'Sending for {args.duration:.0f}s at {args.rate} msg/s per user ...')
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = []
+    for i, u in enumerate(users):
+        receiver_id = users[(i + 1) % len(users)].user_id
+        t = threading.Thread(target=u.run, args=(receiver_id, args.rate, deadline), daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    send_elapsed = time.perf_counter() - started
+
+    drain_until = time.perf_counter() + args.drain
+    while time.perf_counter() < drain_until:
+        with stats.lock:
+            if len(stats.ack_latencies) + stats.ack_errors >= stats.sent and len(stats.delivery_latencies) >= stats.sent:
+                break
+        time.sleep(0.1)
+    for u in users:
+        u.close()
+
+    with stats.lock:
+        result = {
+            'users': args.users,
+            'rate_per_user': args.rate,
+            'duration_s': round(send_elapsed, 2),
+            'sent': stats.sent,
+            'acked': len(stats.ack_latencies),
+            'ack_errors': stats.ack_errors,
+            'delivered': len(stats.delivery_latencies),
+            'throughput_msg_s': round(len(stats.ack_latencies) / send_elapsed, 2) if send_elapsed else 0.0,
+            'ack': summarize(stats.ack_latencies),
+            'delivery': summarize(stats.delivery_latencies),
+        }
+
+    print('\n=== Results ===')
+    print(f"sent={result['sent']} acked={result['acked']} ack_errors={result['ack_errors']} "
+          f"delivered={result['delivered']} lost={result['sent'] - result['delivered']}")
+    print(f"throughput={result['throughput_msg_s']} msg/s over {result['duration_s']}s")
+    for section in ('ack', 'delivery'):
+        s = result[section]
+        print(f"{section:>8}: p50={s['p50_ms']}ms p95={s['p95_ms']}ms p99={s['p99_ms']}ms max={s['max_ms']}ms (n={s['count']})")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as fh:
+            json.dump(result, fh, indent=2)
+        print(f'Results written to {args.json_path}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fh:
+            print_comparison(result, json.load(fh))
+
+
+if __name__ == '__main__':
+    main()
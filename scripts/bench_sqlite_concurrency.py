@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Concurrent read/write throughput of SQLite with and without the storage profile.
+
+Copies a source database (e.g. one made by scripts/generate_synthetic_data.py)
+once per profile, then runs writer threads inserting messages (one commit per
+message, like `send_message`) next to reader threads running the GET /messages
+history query, for a fixed duration:
+
+- default: rollback journal (journal_mode=DELETE, synchronous=FULL)
+- wal:     the server profile from config/database.py (WAL, synchronous=NORMAL,
+           busy_timeout, mmap_size, cache_size, temp_store)
+
+  python3 scripts/bench_sqlite_concurrency.py --db /tmp/bench.db --writers 2 --readers 8 --duration 10
+
+Reports writes/s, reads/s, latency percentiles and `database is locked` errors.
+The source database is never modified.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+from config.database import apply_sqlite_pragmas, sqlite_profile_from_config  # noqa: E402
+from bench_stats import percentile  # noqa: E402
+
+READ_SQL = ('SELECT id, sender_id, receiver_id, content, timestamp FROM message '
+            'WHERE (sender_id = ? AND receiver_id = ?) OR (sender_id = ? AND receiver_id = ?) '
+            'ORDER BY timestamp DESC LIMIT 50')
+WRITE_SQL = ("INSERT INTO message (sender_id, receiver_id, content, message_type, timestamp) "
+             "VALUES (?, ?, ?, 'text', ?)")
+
+PROFILES = {
+    'default': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'wal': sqlite_profile_from_config({}),
+}
+
+
+def connect(path, profile):
+    # 5s timeout mirrors the sqlite3 module default, so both profiles wait on locks the same way
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+    apply_sqlite_pragmas(conn, profile)
+    return conn
+
+
+def run_profile(name, profile, source, args, pair):
+    workdir = tempfile.mkdtemp(prefix=f'sqlite_bench_{name}_')
+    path = os.path.join(workdir, 'bench.db')
+    shutil.copyfile(source, path)
+    connect(path, profile).close()  # switch the copy's journal mode up front
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {'reads': [], 'writes': [], 'read_errors': 0, 'write_errors': 0}
+    a, b = pair
+
+    def writer(idx):
+        conn = connect(path, profile)
+        n = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                conn.execute(WRITE_SQL, (a, b, f'bench write {idx}-{n}', datetime.utcnow().isoformat(sep=' ')))
+                conn.commit()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    stats['writes'].append(elapsed)
+            except sqlite3.OperationalError:
+                conn.rollback()
+                with lock:
+                    stats['write_errors'] += 1
+            n += 1
+        conn.close()
+
+    def reader():
+        conn = connect(path, profile)
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                conn.execute(READ_SQL, (a, b, b, a)).fetchall()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    stats['reads'].append(elapsed)
+            except sqlite3.OperationalError:
+                with lock:
+                    stats['read_errors'] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    ms = lambda v: round(v * 1000.0, 2)
+    return {
+        'profile': name,
+        'writes_s': round(len(stats['writes']) / args.duration, 1),
+        'reads_s': round(len(stats['reads']) / args.duration, 1),
+        'write_p50_ms': ms(percentile(stats['writes'], 50, 0.0)),
+        'write_p95_ms': ms(percentile(stats['writes'], 95, 0.0)),
+        'read_p50_ms': ms(percentile(stats['reads'], 50, 0.0)),
+        'read_p95_ms': ms(percentile(stats['reads'], 95, 0.0)),
+        'write_errors': stats['write_errors'],
+        'read_errors': stats['read_errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite concurrent read/write benchmark')
+    parser.add_argument('--db', required=True, help='Source SQLite file (copied, never modified)')
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--profiles', default='default,wal', help='Comma separated: ' + ','.join(PROFILES))
+    args = parser.parse_args()
+
+    src = sqlite3.connect(args.db)
+    pair = src.execute('SELECT sender_id, receiver_id FROM message GROUP BY sender_id, receiver_id '
+                       'ORDER BY COUNT(*) DESC LIMIT 1').fetchone() or (1, 2)
+    src.close()
+
+    results = []
+    for name in args.profiles.split(','):
+        print(f'Running profile {name!r}: {args.writers} writers, {args.readers} readers, {args.duration:.0f}s ...')
+        results.append(run_profile(name, PROFILES[name], args.db, args, pair))
+
+    cols = ['profile', 'writes_s', 'reads_s', 'write_p50_ms', 'write_p95_ms', 'read_p50_ms', 'read_p95_ms',
+            'write_errors', 'read_errors']
+    print('\n' + '  '.join(f'{c:>13}' for c in cols))
+    for r in results:
+        print('  '.join(f'{str(r[c]):>13}' for c in cols))
+
+
+if __name__ == '__main__':
+    main()
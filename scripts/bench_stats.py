@@ -0,0 +1,14 @@
+"""Statistics shared by the benchmark scripts in this folder."""
+import math
+
+
+def percentile(values, pct, default=None):
+    """Nearest-rank percentile: the smallest value with at least `pct`% of the samples at or below it.
+
+    `values` need not be sorted; `default` is returned for an empty list.
+    """
+    if not values:
+        return default
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, math.ceil(pct / 100.0 * len(values)) - 1))
+    return values[k]
@@ -1,30 +1,46 @@
+#!/usr/bin/env python3
 """
-Download images from Zalo sticker pack pages into a local folder.
+Download images from Zalo sticker pack pages into a local folder, one sub-folder per pack.
 
 Usage:
   python3 scripts/download_zalo_stickers.py urls.txt --out ./downloads/stickers
   or
-  python3 scripts/download_zalo_stickers.py https://... https://...
+  python3 scripts/download_zalo_stickers.py https://... https://... --workers 16
 
-The script will try to extract any image URLs (png/jpg/webp/gif/svg) found in the HTML for each pack
-and download them. Zalo pages may load assets dynamically; this script uses a best-effort regex
-and optional BeautifulSoup pass to collect image links.
+The script extracts image URLs (png/jpg/webp/gif) from the HTML of each pack
+page (regex, plus a BeautifulSoup pass when installed) and downloads them into
+<out>/<pack>/, where <pack> is the last path segment of the page URL. Zalo pages
+may load assets dynamically; such pages report that no images were found.
+
+Pages and images are fetched by a thread pool (--workers) over one pooled
+`requests.Session` that retries connection errors and 429/5xx answers with
+exponential backoff (honouring Retry-After). Progress is kept in
+<out>/.download_manifest.json: the ETag/Last-Modified of every page and image,
+so a re-run (or a run resumed after a crash) sends conditional requests and
+skips whatever answers 304 Not Modified. Files already on disk that the
+manifest does not know are kept as they are.
 
 After download you can run:
   python3 scripts/import_stickers.py ./downloads/stickers --created-by 1
 
 Requirements:
   pip install requests beautifulsoup4
-
-Note: I cannot run network requests from inside this workspace; run this script locally on your machine.
 """
 
-import sys
+import argparse
+import hashlib
+import json
 import os
 import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlparse
+
 import requests
-from urllib.parse import urlparse
-from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 try:
     from bs4 import BeautifulSoup
@@ -32,7 +48,9 @@ try:
 except Exception:
     HAVE_BS4 = False
 
-IMG_EXT_RE = re.compile(r'https?://[^"\'\)\s>]+\.(?:png|jpg|jpeg|webp|gif|svg)')
+IMG_EXT_RE = re.compile(r'https?://[^"\'\)\s>]+\.(?:png|jpg|jpeg|webp|gif)')
+MANIFEST_NAME = '.download_manifest.json'
+USER_AGENT = 'Mozilla/5.0 (compatible; vietnam-chat-sticker-downloader)'
 
 
 def collect_image_urls(html, base_url=None):
@@ -47,89 +65,212 @@ def collect_image_urls(html, base_url=None):
             src = img.get('src') or img.get('data-src') or img.get('data-original')
             if not src:
                 continue
-            # resolve relative
-            if src.startswith('//'):
-                src = 'https:' + src
-            if base_url and src.startswith('/'):
-                parsed = urlparse(base_url)
-                src = f"{parsed.scheme}://{parsed.netloc}{src}"
+            # resolve relative (and protocol-relative) links against the page
+            if base_url:
+                src = urljoin(base_url, src)
             if IMG_EXT_RE.match(src):
                 urls.add(src)
     return sorted(urls)
 
 
-def download_url(url, dest_folder):
+def make_session(workers, retries, backoff):
+    """Session with a connection pool sized for `workers` threads and retry/backoff on transient errors."""
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                  status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(['GET', 'HEAD']),
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def pack_name(url):
+    """Folder name for a pack page: its last path segment, else its host."""
+    parsed = urlparse(url)
+    segment = [s for s in parsed.path.split('/') if s]
+    name = segment[-1] if segment else parsed.netloc
+    return re.sub(r'[^\w.-]+', '_', name).strip('._') or 'pack'
+
+
+class Manifest:
+    """Resume state: validators and local file of every fetched URL, saved atomically."""
+
+    def __init__(self, path, save_every=50):
+        self.path = path
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._dirty = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                self.data = json.load(fh)
+        except (OSError, ValueError):
+            self.data = {'pages': {}, 'files': {}}
+
+    def get(self, kind, url):
+        with self._lock:
+            return dict(self.data[kind].get(url) or {})
+
+    def put(self, kind, url, entry):
+        with self._lock:
+            self.data[kind][url] = entry
+            self._dirty += 1
+            if self._dirty >= self.save_every:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(self.data, fh, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        self._dirty = 0
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def validators(resp):
+    return {'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}
+
+
+def fetch_page(session, manifest, url, timeout):
+    """Image URLs of a pack page; a 304 reuses the list stored in the manifest."""
+    entry = manifest.get('pages', url)
+    resp = session.get(url, headers=conditional_headers(entry) if entry.get('images') else {}, timeout=timeout)
+    if resp.status_code == 304:
+        return entry['images'], True
+    resp.raise_for_status()
+    images = collect_image_urls(resp.text, base_url=url)
+    manifest.put('pages', url, dict(validators(resp), images=images))
+    return images, False
+
+
+class FileNames:
+    """Local file names for image URLs; a different URL with the same basename gets a hash suffix."""
+
+    def __init__(self, manifest):
+        self.owner = {e['file']: u for u, e in manifest.data['files'].items() if e.get('file')}
+        self.known = {u: e['file'] for u, e in manifest.data['files'].items() if e.get('file')}
+
+    def assign(self, url, folder):
+        if url in self.known:
+            return self.known[url]
+        name = os.path.basename(urlparse(url).path) or 'img.png'
+        dest = os.path.join(folder, name)
+        if self.owner.get(dest, url) != url:
+            stem, ext = os.path.splitext(name)
+            dest = os.path.join(folder, f'{stem}_{hashlib.sha1(url.encode()).hexdigest()[:8]}{ext}')
+        self.owner[dest] = url
+        self.known[url] = dest
+        return dest
+
+
+def download_image(session, manifest, url, dest, timeout):
+    """Returns 'saved', 'not-modified', 'exists' or 'failed'."""
+    entry = manifest.get('files', url)
+    headers = {}
+    if os.path.exists(dest):
+        if not entry.get('etag') and not entry.get('last_modified'):
+            # on disk from an older run without validators: keep it
+            manifest.put('files', url, dict(entry, file=dest))
+            return 'exists'
+        headers = conditional_headers(entry)
     try:
-        r = requests.get(url, stream=True, timeout=15)
-        r.raise_for_status()
+        with session.get(url, headers=headers, stream=True, timeout=timeout) as resp:
+            if resp.status_code == 304:
+                return 'not-modified'
+            resp.raise_for_status()
+            tmp = f'{dest}.part'
+            size = 0
+            with open(tmp, 'wb') as f:
+                for chunk in resp.iter_content(64 * 1024):
+                    if chunk:
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp, dest)
+            manifest.put('files', url, dict(validators(resp), file=dest, size=size))
     except Exception as e:
-        print(f"  [x] Failed to download {url}: {e}")
-        return False
-    # derive filename
-    p = urlparse(url)
-    name = os.path.basename(p.path)
-    if not name:
-        name = f"img_{abs(hash(url))}.png"
-    dest = os.path.join(dest_folder, name)
-    # avoid re-download
-    if os.path.exists(dest):
-        print(f"  [-] Skipping existing: {name}")
-        return True
-    with open(dest, 'wb') as f:
-        for chunk in r.iter_content(8192):
-            if chunk:
-                f.write(chunk)
-    print(f"  [+] Saved {name}")
-    return True
+        print(f'  [x] Failed to download {url}: {e}')
+        return 'failed'
+    return 'saved'
 
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('Usage: python3 scripts/download_zalo_stickers.py <url1> <url2> ... OR a file with URLs (one per line)')
-        sys.exit(1)
-
-    args = sys.argv[1:]
-    out = './downloads/stickers'
-    # check for --out
-    if '--out' in args:
-        i = args.index('--out')
-        if i + 1 < len(args):
-            out = args[i+1]
-            del args[i:i+2]
-
-    # if first arg is a file path, read URLs from file
-    urls = []
+def read_urls(args):
+    # a single argument naming a file: read URLs from it, one per line
     if len(args) == 1 and os.path.isfile(args[0]):
         with open(args[0], 'r') as fh:
-            for line in fh:
-                line = line.strip()
-                if not line or line.startswith('#'): continue
-                urls.append(line)
-    else:
-        urls = args
-
-    Path(out).mkdir(parents=True, exist_ok=True)
-
-    print(f'Downloading to {out}...')
-    for u in urls:
-        print(f'Processing: {u}')
-        try:
-            r = requests.get(u, timeout=15)
-            r.raise_for_status()
-            html = r.text
-        except Exception as e:
-            print(f'  [x] Failed to fetch {u}: {e}')
-            continue
-
-        imgs = collect_image_urls(html, base_url=u)
-        if not imgs:
-            print('  [!] No image links found via regex/HTML scan. The page may load assets dynamically via JS.')
-            print('      Try opening the page in a browser and saving images manually, or enable a headless browser.')
-            continue
-
-        print(f'  Found {len(imgs)} candidate images. Attempting to download...')
-        for img in imgs:
-            download_url(img, out)
-
-    print('\nDone. If you want to import into server DB run:')
-    print('  python3 scripts/import_stickers.py', out, '--created-by <user_id>')
+            return [line.strip() for line in fh if line.strip() and not line.strip().startswith('#')]
+    return args
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download sticker images from Zalo sticker pack pages')
+    parser.add_argument('urls', nargs='+', help='Pack page URLs, or one file with a URL per line')
+    parser.add_argument('--out', default='./downloads/stickers', help='Output folder (one sub-folder per pack)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent requests')
+    parser.add_argument('--retries', type=int, default=4, help='Retries per request on errors and 429/5xx')
+    parser.add_argument('--backoff', type=float, default=0.5, help='Backoff factor between retries, in seconds')
+    parser.add_argument('--timeout', type=float, default=15, help='Connect/read timeout per request, in seconds')
+    args = parser.parse_args()
+
+    urls = read_urls(args.urls)
+    os.makedirs(args.out, exist_ok=True)
+    manifest = Manifest(os.path.join(args.out, MANIFEST_NAME))
+    session = make_session(args.workers, args.retries, args.backoff)
+    names = FileNames(manifest)
+    counts = {'saved': 0, 'not-modified': 0, 'exists': 0, 'failed': 0}
+    started = time.perf_counter()
+
+    print(f'Downloading {len(urls)} packs to {args.out} with {args.workers} workers...')
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        pages = {pool.submit(fetch_page, session, manifest, u, args.timeout): u for u in urls}
+        downloads = []
+        # packs share images (and a page may repeat one): every URL is downloaded once,
+        # so two workers never write the same .part file
+        submitted = set()
+        for fut in as_completed(pages):
+            url = pages[fut]
+            try:
+                imgs, cached = fut.result()
+            except Exception as e:
+                print(f'  [x] Failed to fetch {url}: {e}')
+                continue
+            if not imgs:
+                print(f'  [!] {url}: no image links found via regex/HTML scan. The page may load assets dynamically via JS.')
+                continue
+            folder = os.path.join(args.out, pack_name(url))
+            os.makedirs(folder, exist_ok=True)
+            print(f'  {url}: {len(imgs)} images{" (page not modified)" if cached else ""}')
+            fresh = [img for img in dict.fromkeys(imgs) if img not in submitted]
+            submitted.update(fresh)
+            downloads += [pool.submit(download_image, session, manifest, img, names.assign(img, folder), args.timeout)
+                          for img in fresh]
+
+        for i, fut in enumerate(as_completed(downloads), 1):
+            counts[fut.result()] += 1
+            if i % 50 == 0 or i == len(downloads):
+                print(f'\r  images: {i:,}/{len(downloads):,}', end='', flush=True)
+        if downloads:
+            print()
+    manifest.save()
+
+    print(f'Done in {time.perf_counter() - started:.1f}s: {counts["saved"]} saved, '
+          f'{counts["not-modified"]} not modified, {counts["exists"]} already on disk, {counts["failed"]} failed.')
+    print('If you want to import into server DB run:')
+    print('  python3 scripts/import_stickers.py', args.out, '--created-by <user_id>')
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
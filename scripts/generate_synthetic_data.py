@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Fill a SQLite database with synthetic chat data for load and query benchmarks.
+
+The schema is created from the server models (db.create_all) and then rows are
+inserted with batched `executemany` calls on a raw sqlite3 connection, so
+millions of messages take seconds rather than hours. Volumes are configurable:
+
+  python3 scripts/generate_synthetic_data.py --db /tmp/bench.db \
+      --users 20000 --friends-per-user 40 --blocks-per-user 1 \
+      --groups 500 --group-size 20 --messages 2000000 --reactions 200000
+
+All users share the password `password` (hashed once). The generator refuses to
+write into the default development database (server/storage/chatapp.db).
+Use scripts/bench_queries.py against the generated file afterwards.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SERVER_DIR = os.path.join(ROOT_DIR, 'server')
+DEFAULT_DB = os.path.join(SERVER_DIR, 'storage', 'chatapp.db')
+
+REACTIONS = ['❤️', '😂', '👍', '😮', '😢', '😡']
+WORDS = ('xin chào bạn khỏe không hôm nay trời đẹp quá đi ăn trưa nhé ok cảm ơn '
+         'hẹn gặp lại mai nhé tối nay họp lúc mấy giờ vậy gửi file giúp mình').split()
+
+
+def create_schema(db_path):
+    """Create all tables from the server models on the target file."""
+    os.environ['CHAT_DB_PATH'] = db_path
+    sys.path.insert(0, SERVER_DIR)
+    from flask import Flask
+    from config.database import db
+    from config.schema import import_models
+    # import models so the metadata is populated
+    import_models()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+
+
+def batched_insert(conn, sql, rows, batch_size, label):
+    """Insert an iterable of row tuples in batches, printing progress."""
+    batch = []
+    total = 0
+    started = time.perf_counter()
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            conn.commit()
+            total += len(batch)
+            batch.clear()
+            print(f'\r  {label}: {total:,}', end='', flush=True)
+    if batch:
+        conn.executemany(sql, batch)
+        conn.commit()
+        total += len(batch)
+    elapsed = time.perf_counter() - started
+    print(f'\r  {label}: {total:,} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f}/s)')
+    return total
+
+
+def gen_users(n, password_hash, now, rng):
+    for i in range(1, n + 1):
+        created = now - timedelta(days=rng.randint(0, 720))
+        phone = f'+849{i:08d}'
+        yield (f'synth_{i}', password_hash, f'Synthetic User {i}', phone, 'offline', created.isoformat(sep=' '))
+
+
+def gen_friendships(n_users, per_user, now, rng, pairs_out):
+    """Yield accepted/pending friendships; accepted pairs are collected for messaging."""
+    seen = set()
+    for uid in range(1, n_users + 1):
+        for _ in range(per_user // 2 or 1):
+            # mostly local clusters (ids close together) plus some random long links
+            if rng.random() < 0.7:
+                other = uid + rng.randint(1, 200)
+            else:
+                other = rng.randint(1, n_users)
+            if other == uid or other > n_users:
+                continue
+            key = (min(uid, other), max(uid, other))
+            if key in seen:
+                continue
+            seen.add(key)
+            status = 'accepted' if rng.random() < 0.9 else 'pending'
+            if status == 'accepted':
+                pairs_out.append(key)
+            yield (uid, other, status, (now - timedelta(days=rng.randint(0, 365))).isoformat(sep=' '))
+
+
+def gen_blocks(n_users, per_user, now, rng):
+    seen = set()
+    for uid in range(1, n_users + 1):
+        for _ in range(per_user):
+            target = rng.randint(1, n_users)
+            if target == uid or (uid, target) in seen:
+                continue
+            seen.add((uid, target))
+            yield (uid, target, now.isoformat(sep=' '))
+
+
+def gen_groups(n_groups, n_users, now, rng):
+    for gid in range(1, n_groups + 1):
+        yield (f'Nhóm {gid}', rng.randint(1, n_users), now.isoformat(sep=' '))
+
+
+def gen_group_members(n_groups, n_users, size, rng):
+    for gid in range(1, n_groups + 1):
+        members = rng.sample(range(1, n_users + 1), min(size, n_users))
+        for idx, uid in enumerate(members):
+            yield (gid, uid, 'owner' if idx == 0 else 'member')
+
+
+def gen_messages(n_messages, pairs, days, now, rng):
+    """Messages over friend pairs with a skewed distribution (a few very chatty pairs)."""
+    start = now - timedelta(days=days)
+    step = (days * 86400.0) / max(1, n_messages)
+    for i in range(n_messages):
+        # skewed pick: low indices (chatty pairs) are chosen much more often
+        a, b = pairs[min(len(pairs) - 1, int(len(pairs) * rng.random() ** 3))]
+        if rng.random() < 0.5:
+            a, b = b, a
+        ts = start + timedelta(seconds=i * step)
+        kind = rng.random()
+        if kind < 0.03:
+            yield (a, b, None, 'https://example.invalid/sticker.webp', None, 'sticker', 'synthetic', 'https://example.invalid/sticker.webp', ts.isoformat(sep=' '))
+        elif kind < 0.05:
+            yield (a, b, None, 'report.pdf', '/uploads/files/report.pdf', 'file', None, None, ts.isoformat(sep=' '))
+        else:
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 14)))
+            yield (a, b, None, text, None, 'text', None, None, ts.isoformat(sep=' '))
+
+
+def gen_reactions(n_reactions, n_messages, n_users, now, rng):
+    for _ in range(n_reactions):
+        yield (rng.randint(1, n_messages), rng.randint(1, n_users), rng.choice(REACTIONS), now.isoformat(sep=' '))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic chat data in a SQLite file')
+    parser.add_argument('--db', required=True, help='Target SQLite file (created if missing)')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--friends-per-user', type=int, default=30)
+    parser.add_argument('--blocks-per-user', type=int, default=1)
+    parser.add_argument('--groups', type=int, default=200)
+    parser.add_argument('--group-size', type=int, default=15)
+    parser.add_argument('--messages', type=int, default=500000)
+    parser.add_argument('--reactions', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=365, help='Spread messages over this many past days')
+    parser.add_argument('--batch-size', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fresh', action='store_true', help='Delete the target file first')
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    if db_path == os.path.abspath(DEFAULT_DB):
+        parser.error('refusing to write synthetic data into the development database')
+    if args.fresh and os.path.exists(db_path):
+        os.remove(db_path)
+
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    print(f'Creating schema in {db_path}')
+    create_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    # bulk load settings: this is a throwaway benchmark file, durability does not matter
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-200000')
+    if conn.execute('SELECT COUNT(*) FROM user').fetchone()[0]:
+        parser.error('target database already has users; pass --fresh to regenerate')
+
+    started = time.perf_counter()
+    password_hash = generate_password_hash('password')
+    batched_insert(conn, 'INSERT INTO user (username, password_hash, display_name, phone_number, status, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                   gen_users(args.users, password_hash, now, rng), args.batch_size, 'users')
+    pairs = []
+    batched_insert(conn, 'INSERT INTO friend (user_id, friend_id, status, created_at) VALUES (?, ?, ?, ?)',
+                   gen_friendships(args.users, args.friends_per_user, now, rng, pairs), args.batch_size, 'friendships')
+    batched_insert(conn, 'INSERT INTO block (user_id, target_id, created_at) VALUES (?, ?, ?)',
+                   gen_blocks(args.users, args.blocks_per_user, now, rng), args.batch_size, 'blocks')
+    batched_insert(conn, 'INSERT INTO "group" (name, owner_id, created_at) VALUES (?, ?, ?)',
+                   gen_groups(args.groups, args.users, now, rng), args.batch_size, 'groups')
+    batched_insert(conn, 'INSERT INTO group_member (group_id, user_id, role) VALUES (?, ?, ?)',
+                   gen_group_members(args.groups, args.users, args.group_size, rng), args.batch_size, 'group members')
+    if pairs and args.messages:
+        batched_insert(conn, 'INSERT INTO message (sender_id, receiver_id, group_id, content, file_url, message_type, sticker_id, sticker_url, timestamp) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       gen_messages(args.messages, pairs, args.days, now, rng), args.batch_size, 'messages')
+        batched_insert(conn, 'INSERT INTO message_reaction (message_id, user_id, reaction_type, created_at) VALUES (?, ?, ?, ?)',
+                       gen_reactions(args.reactions, args.messages, args.users, now, rng), args.batch_size, 'reactions')
+    conn.execute('ANALYZE')
+    conn.close()
+    print(f'Done in {time.perf_counter() - started:.1f}s: {db_path} ({os.path.getsize(db_path) / 1e6:.1f} MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,67 +1,246 @@
+#!/usr/bin/env python3
 """
-Simple import script to copy a local folder of sticker images into server storage
-and create Sticker DB records. Usage:
+Import a folder of sticker images into the sticker catalog.
 
-python3 scripts/import_stickers.py /path/to/folder --created-by 1
+  python3 scripts/import_stickers.py ./downloads/stickers --created-by 1
+  python3 scripts/import_stickers.py ./downloads/stickers --pack Quby --workers 8 --max-side 256
 
-The script will copy files into server/storage/uploads/stickers and create rows in
-`sticker` table. It requires the project's virtualenv / dependencies available.
-"""
+Each sub-folder becomes a pack named after it (files directly in the source
+folder go into a pack named after the folder itself) unless --pack is given.
+The pipeline:
+
+1. hash every file (SHA-256) in a process pool; files whose hash was already
+   imported, or that repeat another file of this run, are skipped
+2. optimize the rest in the same pool: scale down to --max-side pixels and
+   re-encode as WebP (animated GIF/WebP stay animated); an image that comes out
+   bigger than the original is kept as is, one over --max-bytes is rejected
+3. write each result once under its content hash (storage/uploads/stickers,
+   served from /stickers/files/<sha256>.<ext>, see server/services/sticker_catalog.py)
+4. insert the rows with batched commits of --batch-size, printing progress
 
+Optimization needs Pillow (`pip install Pillow`); without it, or with
+--format keep, files are imported unchanged. SVG files are skipped (the
+catalog only takes raster images). The target database is the app's
+(CHAT_DB_PATH or server/storage/chatapp.db) unless --db is given; the schema
+is upgraded first.
+"""
+import argparse
+import hashlib
+import io
 import os
 import sys
-import shutil
-from pathlib import Path
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('Usage: python3 scripts/import_stickers.py /path/to/folder [--created-by ID]')
-        sys.exit(1)
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SERVER_DIR = os.path.join(ROOT_DIR, 'server')
+# at import time, so pool workers started with `spawn` find the server packages too
+sys.path.insert(0, SERVER_DIR)
 
-    src = Path(sys.argv[1])
-    if not src.exists() or not src.is_dir():
-        print('Source folder does not exist or is not a directory')
-        sys.exit(1)
+try:
+    from PIL import Image, ImageSequence
+    HAVE_PIL = True
+except Exception:
+    HAVE_PIL = False
 
-    created_by = None
-    if '--created-by' in sys.argv:
-        i = sys.argv.index('--created-by')
-        if i + 1 < len(sys.argv):
-            created_by = sys.argv[i+1]
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif')
+# quality steps tried, in order, until the result fits in --max-bytes
+QUALITY_FLOOR = 40
+QUALITY_STEP = 15
 
-    # Ensure we run with project root on sys.path
-    project_root = Path(__file__).resolve().parents[1]
-    sys.path.insert(0, str(project_root))
 
-    from config.database import db
-    from models.sticker_model import Sticker
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return path, digest.hexdigest()
+
+
+def _encode_webp(im, max_side, quality):
+    """WebP bytes of `im` scaled to fit max_side; animated images keep every frame."""
+    out = io.BytesIO()
+    if getattr(im, 'is_animated', False):
+        frames, durations = [], []
+        for frame in ImageSequence.Iterator(im):
+            frame = frame.convert('RGBA')
+            frame.thumbnail((max_side, max_side))
+            frames.append(frame)
+            durations.append(frame.info.get('duration', im.info.get('duration', 100)))
+        frames[0].save(out, 'WEBP', save_all=True, append_images=frames[1:], duration=durations,
+                       loop=im.info.get('loop', 0), quality=quality, method=4)
+    else:
+        frame = im.convert('RGBA' if im.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        frame.thumbnail((max_side, max_side))
+        frame.save(out, 'WEBP', quality=quality, method=4)
+    return out.getvalue()
+
+
+def optimize(data, ext, fmt, max_side, quality, max_bytes):
+    """(bytes, ext) to store for one image, or raise ValueError when it cannot fit max_bytes."""
+    if fmt == 'webp' and HAVE_PIL:
+        with Image.open(io.BytesIO(data)) as im:
+            oversized = max(im.size) > max_side
+            out = _encode_webp(im, max_side, quality)
+            # a small PNG can beat WebP; keep the original when it is already within the caps
+            if len(out) < len(data) or oversized:
+                data, ext = out, '.webp'
+            while max_bytes and len(data) > max_bytes and quality - QUALITY_STEP >= QUALITY_FLOOR:
+                quality -= QUALITY_STEP
+                data, ext = _encode_webp(im, max_side, quality), '.webp'
+    if max_bytes and len(data) > max_bytes:
+        raise ValueError(f'{len(data)} bytes after optimization (limit {max_bytes})')
+    return data, ext
+
+
+def process_file(task):
+    """Pool worker: optimize one file and store it under its content hash."""
+    path, source_hash, fmt, max_side, quality, max_bytes = task
+    from services.sticker_catalog import store_file
+    try:
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        out, ext = optimize(data, os.path.splitext(path)[1].lower(), fmt, max_side, quality, max_bytes)
+        digest, file_url = store_file(out, ext)
+    except Exception as e:
+        return {'path': path, 'error': f'{type(e).__name__}: {e}'}
+    return {'path': path, 'source_hash': source_hash, 'content_hash': digest, 'file_url': file_url,
+            'in_bytes': len(data), 'out_bytes': len(out)}
+
+
+def collect_files(src, pack):
+    """[(path, pack name)] for every image below `src`, in a stable order."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(src):
+        dirnames.sort()
+        name = pack or os.path.basename(os.path.abspath(dirpath))
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                found.append((os.path.join(dirpath, filename), name))
+    return found
+
+
+def progress(label, done, total, started):
+    elapsed = time.perf_counter() - started
+    rate = done / elapsed if elapsed else 0
+    print(f'\r  {label}: {done:,}/{total:,} ({rate:,.0f}/s)', end='', flush=True)
+
+
+def create_app(db_path):
+    if db_path:
+        os.environ['CHAT_DB_PATH'] = os.path.abspath(db_path)
     from flask import Flask
+    from config.database import db, init_sqlite_profile
+    from config.settings import Config
 
     app = Flask(__name__)
-    base_dir = str(project_root / 'server')
-    db_path = os.path.join(base_dir, 'storage', 'chatapp.db')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config.from_object(Config)
     db.init_app(app)
+    init_sqlite_profile(app)
+    return app
+
 
-    uploads_dir = Path(base_dir) / 'storage' / 'uploads' / 'stickers'
-    uploads_dir.mkdir(parents=True, exist_ok=True)
-
-    copied = 0
-    with app.app_context():
-        for f in src.iterdir():
-            if not f.is_file():
-                continue
-            if f.suffix.lower() not in ['.png', '.jpg', '.jpeg', '.webp', '.gif', '.svg']:
-                continue
-            dest = uploads_dir / f.name
-            # avoid clobbering existing
-            if dest.exists():
-                print(f'Skipping existing: {dest.name}')
-                continue
-            shutil.copy2(str(f), str(dest))
-            file_url = f'/uploads/files/stickers/{dest.name}'
-            s = Sticker(name=dest.name, file_url=file_url, created_by=created_by)
-            db.session.add(s)
-            copied += 1
+def main():
+    parser = argparse.ArgumentParser(description='Import a folder of sticker images into the sticker catalog')
+    parser.add_argument('src', help='Folder with images; sub-folders become packs')
+    parser.add_argument('--pack', help='Put every sticker into this pack instead')
+    parser.add_argument('--created-by', type=int, help='User id recorded on the rows')
+    parser.add_argument('--db', help='SQLite file (default: CHAT_DB_PATH or server/storage/chatapp.db)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--batch-size', type=int, default=500, help='Rows per commit')
+    parser.add_argument('--format', choices=('webp', 'keep'), default='webp', help='Re-encode as WebP or keep files as is')
+    parser.add_argument('--max-side', type=int, default=512, help='Scale images down to fit this many pixels')
+    parser.add_argument('--quality', type=int, default=80, help='WebP quality (lowered to fit --max-bytes)')
+    parser.add_argument('--max-bytes', type=int, default=512 * 1024, help='Reject stickers larger than this (0: no limit)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.src):
+        parser.error(f'{args.src} is not a directory')
+    if args.format == 'webp' and not HAVE_PIL:
+        print('Pillow is not installed; importing files unchanged (pip install Pillow to optimize them)')
+
+    app = create_app(args.db)
+    from config.database import db
+    from config.schema import upgrade_schema
+    from models.sticker_model import Sticker
+    from services.sticker_catalog import get_or_create_pack
+
+    started = time.perf_counter()
+    files = collect_files(args.src, args.pack)
+    print(f'Found {len(files):,} images in {args.src}')
+    stats = Counter()
+    with app.app_context(), ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        upgrade_schema()
+        known_sources = {h for (h,) in db.session.query(Sticker.source_hash).filter(Sticker.source_hash.isnot(None))}
+        known_content = {h for (h,) in db.session.query(Sticker.content_hash).filter(Sticker.content_hash.isnot(None))}
+        chunksize = max(1, min(64, len(files) // (args.workers * 4) or 1))
+
+        # 1. hash; skip content that was imported before or repeats within this run
+        pack_of = dict(files)
+        todo = []
+        step = time.perf_counter()
+        for i, (path, source_hash) in enumerate(pool.map(sha256_file, pack_of, chunksize=chunksize), 1):
+            if source_hash in known_sources:
+                stats['duplicate'] += 1
+            else:
+                known_sources.add(source_hash)
+                todo.append((path, source_hash, args.format, args.max_side, args.quality, args.max_bytes))
+            if i % 200 == 0 or i == len(files):
+                progress('hashed', i, len(files), step)
+        print()
+
+        # 2-4. optimize and store in the pool, insert in batched commits here
+        packs = {}
+        batch = []
+        step = time.perf_counter()
+        now = datetime.utcnow()
+        for i, result in enumerate(pool.map(process_file, todo, chunksize=chunksize), 1):
+            if 'error' in result:
+                stats['failed'] += 1
+                print(f'\n  [x] {result["path"]}: {result["error"]}')
+            elif result['content_hash'] in known_content:
+                # different source bytes that optimize to an image we already have
+                stats['duplicate'] += 1
+            else:
+                known_content.add(result['content_hash'])
+                name = pack_of[result['path']]
+                if name not in packs:
+                    packs[name] = get_or_create_pack(name, source='import').id
+                batch.append({
+                    'name': os.path.splitext(os.path.basename(result['path']))[0],
+                    'file_url': result['file_url'],
+                    'content_hash': result['content_hash'],
+                    'source_hash': result['source_hash'],
+                    'pack_id': packs[name],
+                    'created_by': args.created_by,
+                    'created_at': now,
+                })
+                stats['in_bytes'] += result['in_bytes']
+                stats['out_bytes'] += result['out_bytes']
+            if len(batch) >= args.batch_size:
+                db.session.bulk_insert_mappings(Sticker, batch)
+                db.session.commit()
+                stats['imported'] += len(batch)
+                batch.clear()
+            if i % 100 == 0 or i == len(todo):
+                progress('optimized', i, len(todo), step)
+        if batch:
+            db.session.bulk_insert_mappings(Sticker, batch)
+            stats['imported'] += len(batch)
+        if packs:
+            from models.sticker_pack_model import StickerPack
+            StickerPack.query.filter(StickerPack.id.in_(packs.values())).update(
+                {'updated_at': datetime.utcnow()}, synchronize_session=False)
         db.session.commit()
-    print(f'Done. Copied and inserted {copied} stickers.')
+        print()
+
+    saved = stats['in_bytes'] - stats['out_bytes']
+    print(f'Done in {time.perf_counter() - started:.1f}s: imported {stats["imported"]:,} into {len(packs)} packs, '
+          f'skipped {stats["duplicate"]:,} duplicates, {stats["failed"]:,} failed; '
+          f'{stats["in_bytes"] / 1e6:.1f} MB -> {stats["out_bytes"] / 1e6:.1f} MB ({saved / 1e6:.1f} MB saved)')
+
+
+if __name__ == '__main__':
+    main()
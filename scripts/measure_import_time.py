@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Measure how long a fresh worker takes to import the backend (`import app`).
+
+Each run is a new interpreter started with `-X importtime`, like a worker
+boot. The script reports the median wall time and the slowest top-level
+imports by cumulative time. With --budget-ms it exits with status 1 when
+the median goes over the budget, so it can guard CI or deploys:
+
+  python3 scripts/measure_import_time.py --runs 5 --budget-ms 400
+  python3 scripts/measure_import_time.py --auto-init-db   # include schema/seed work
+
+AUTO_INIT_DB is false by default here (the production setting), and the app
+points at a scratch SQLite file so the development database is not touched.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SERVER_DIR = os.path.join(ROOT_DIR, 'server')
+
+PROBE = ('import time; t = time.perf_counter(); import app; '
+         'print("WALL_MS", (time.perf_counter() - t) * 1000.0)')
+
+
+def run_once(env):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=SERVER_DIR, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f'import failed:\n{proc.stderr[-2000:]}')
+    wall = float(next(line.split()[1] for line in proc.stdout.splitlines() if line.startswith('WALL_MS')))
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = line.replace('import time:', '|').split('|')
+        # one leading space at the top level, two more per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((int(cumulative_us), depth, name.strip()))
+    return wall, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure backend import time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='Show this many slowest imports')
+    parser.add_argument('--budget-ms', type=float, help='Fail when the median wall time exceeds this')
+    parser.add_argument('--auto-init-db', action='store_true', help='Run schema creation and seeding on import')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='import_time_')
+    env = dict(os.environ, CHAT_DB_PATH=os.path.join(workdir, 'import_time.db'), LOG_LEVEL='WARNING',
+               AUTO_INIT_DB='true' if args.auto_init_db else 'false')
+    walls = []
+    modules = []
+    for _ in range(args.runs):
+        wall, modules = run_once(env)
+        walls.append(wall)
+
+    median = statistics.median(walls)
+    print(f'import app: median {median:.0f} ms, min {min(walls):.0f} ms, max {max(walls):.0f} ms over {args.runs} runs')
+    # the import under the `app` entry (depth 1) is what the app itself pulls in
+    top = sorted((m for m in modules if m[1] == 1), reverse=True)[:args.top]
+    print('\nSlowest imports directly under app (last run, cumulative):')
+    for cumulative_us, _depth, name in top:
+        print(f'  {cumulative_us / 1000.0:8.1f} ms  {name}')
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f'\nOver budget: {median:.0f} ms > {args.budget_ms:.0f} ms', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
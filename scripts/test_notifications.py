@@ -87,7 +87,7 @@ def main():
     @sio.event
     def connect():
         print('Socket connected, sid=', sio.sid)
-        sio.emit('join', {'user_id': user_id})
+        sio.emit('join', {'user_id': user_id, 'token': token})
 
     @sio.event
     def disconnect():
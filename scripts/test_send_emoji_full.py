@@ -82,7 +82,7 @@ ack_received = None
 @sio.on('connect')
 def on_connect():
     print('Socket connected, sid=', sio.sid)
-    sio.emit('join', {'user_id': user_id})
+    sio.emit('join', {'user_id': user_id, 'token': token})
 
 @sio.on('message_sent_ack')
 def on_ack(data):
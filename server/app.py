@@ -9,11 +9,11 @@ import sys, os
 sys.path.insert(0, os.path.dirname(__file__))
 
 from config.settings import Config
-from config.database import db, migrate
-from services.network_setup import start_ngrok
+from config.database import db, init_migrate, init_sqlite_profile, serialize_session_writes
+from config.schema import init_database, register_cli
 import logging
 import os
-from utils.logging_helpers import LoggingDedupFilter
+from utils.logging_helpers import configure_logging
 
 # Initialize Flask app
 # Serve client build (if present) as static files so the same public URL can serve frontend + API
@@ -25,13 +25,45 @@ else:
 app.config.from_object(Config)
 
 # Initialize extensions
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=app.config['SOCKETIO_ASYNC_MODE'])
+from services.async_compat import configure as configure_async
+configure_async(socketio.async_mode)
+from services.emit_buffer import emit_buffer
+emit_buffer.init_app(socketio, app.config)
+from services.presence import presence
+presence.init_app(app.config)
+from services.social_graph import social_graph
+social_graph.init_app(app.config)
+from services.profile_cache import profile_cache
+profile_cache.init_app(app.config)
+from services.call_sessions import call_registry
+call_registry.init_app(app.config)
+from services.dead_letter import dead_letters
+dead_letters.init_app(app.config)
+
+# Instrumentation: must wrap `socketio.on` before the event modules register handlers.
+# Set METRICS_ENABLED=false to skip it entirely.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+if METRICS_ENABLED:
+    from services.metrics import instrument_app, instrument_socketio, instrument_sqlalchemy
+    instrument_socketio(socketio)
+    instrument_app(app)
+    instrument_sqlalchemy()
 
 # Enable official Flask-CORS for production deployment
-CORS(app, supports_credentials=True, origins=["http://localhost:3000", "https://vietnam-chat-1qte-e5ocjphaf-pducviet.vercel.app"])
+# Pagination and sync headers must be exposed or the browser hides them from the client
+CORS(app, supports_credentials=True, origins=["http://localhost:3000", "https://vietnam-chat-1qte-e5ocjphaf-pducviet.vercel.app"],
+     expose_headers=['X-Next-Cursor', 'X-Sync-Time'])
 
 db.init_app(app)
-migrate.init_app(app, db)
+# Flask-Migrate (alembic) is only needed for `flask db ...`
+if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+    init_migrate(app)
+# WAL, synchronous=NORMAL, busy_timeout, mmap/cache sizes on every pooled SQLite connection
+init_sqlite_profile(app)
+# greenlets must not wait for each other inside SQLite's (hub blocking) busy handler
+if socketio.async_mode in ('gevent', 'eventlet'):
+    serialize_session_writes()
 
 # Register blueprints
 from routes.auth.register import auth_register_bp
@@ -46,6 +78,8 @@ from routes.groups import groups_bp
 from routes.uploads import uploads_bp
 from routes.stickers import stickers_bp
 from routes.auth.me import auth_me_bp
+from routes.metrics import metrics_bp
+from routes.presence import presence_bp
 
 app.register_blueprint(auth_register_bp)
 app.register_blueprint(auth_login_bp)
@@ -59,47 +93,20 @@ app.register_blueprint(groups_bp)
 app.register_blueprint(uploads_bp)
 app.register_blueprint(stickers_bp)
 app.register_blueprint(auth_me_bp)
-
-# Ensure DB tables exist for development convenience (creates missing tables).
-with app.app_context():
-    # Import models to ensure SQLAlchemy metadata is populated before create_all
-    try:
-        from models.user_model import User
-        from models.friend_model import Friend
-        from models.group_model import Group
-        from models.message_model import Message
-        from models.sticker_model import Sticker
-    except Exception:
-        # If imports fail, log and continue; create_all may still create available tables
-        app.logger.debug('Model import failed during create_all prep')
+app.register_blueprint(presence_bp)
+if METRICS_ENABLED:
+    app.register_blueprint(metrics_bp)
+
+# Schema creation and demo seeding run on import only when AUTO_INIT_DB is true
+# (development default). Production workers use `flask --app app init-db` instead.
+register_cli(app)
+from services.suggestions import register_cli as register_suggestions_cli
+register_suggestions_cli(app)
+if str(app.config.get('AUTO_INIT_DB', 'true')).lower() == 'true':
     try:
-        db.create_all()
-        # Add file_url column if it doesn't exist (for existing databases)
-        from sqlalchemy import inspect
-        inspector = inspect(db.engine)
-        columns = [col['name'] for col in inspector.get_columns('message')]
-        if 'file_url' not in columns:
-            try:
-                with db.engine.connect() as conn:
-                    conn.execute(db.text('ALTER TABLE message ADD COLUMN file_url VARCHAR(500)'))
-                    conn.commit()
-                app.logger.info('Added file_url column to message table')
-            except Exception as e:
-                app.logger.debug(f'Could not add file_url column: {e}')
+        init_database(app, seed=True)
     except Exception as e:
-        app.logger.warning(f"Could not create tables automatically: {e}")
-    # If DB is empty, create a few demo users for development convenience
-    try:
-        from models.user_model import User
-        if User.query.count() == 0:
-            from services.auth_service import register_user
-            register_user('alice', 'password', display_name='Alice Nguyễn')
-            register_user('bob', 'password', display_name='Bob Trần')
-            register_user('carol', 'password', display_name='Carol Lê')
-            app.logger.info('Created demo users: alice, bob, carol')
-    except Exception:
-        # ignore seeding errors in production
-        pass
+        app.logger.warning(f"Could not initialize database automatically: {e}")
 
 # Register socket events
 from sockets.chat_events import register_chat_events
@@ -129,18 +136,37 @@ def serve_client(path):
         return send_from_directory(CLIENT_BUILD_DIR, requested)
     return send_from_directory(CLIENT_BUILD_DIR, 'index.html')
 
-# Logging setup: concise format with timestamp, level, module, message
+# Logging setup: concise format with timestamp, level, module, message.
+# Records are handed to a background QueueListener so socket/request handlers
+# never block on stdout or file writes.
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
-logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
-logger = logging.getLogger(__name__)
 
 # Add deduplication filter to reduce repeated identical messages (default 5s)
 try:
     dedup_seconds = int(os.environ.get('LOG_DEDUP_SECONDS', '5'))
 except Exception:
     dedup_seconds = 5
-root_logger = logging.getLogger()
-root_logger.addFilter(LoggingDedupFilter(window_seconds=dedup_seconds))
+try:
+    log_queue_size = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+except Exception:
+    log_queue_size = 10000
+try:
+    diag_sample_every = int(os.environ.get('LOG_DIAG_SAMPLE_EVERY', '100'))
+except Exception:
+    diag_sample_every = 100
+try:
+    dedup_max_entries = int(os.environ.get('LOG_DEDUP_MAX_ENTRIES', '2048'))
+except Exception:
+    dedup_max_entries = 2048
+configure_logging(
+    level=LOG_LEVEL,
+    dedup_seconds=dedup_seconds,
+    log_file=os.environ.get('LOG_FILE') or None,
+    queue_size=log_queue_size,
+    sample_every=diag_sample_every,
+    dedup_max_entries=dedup_max_entries,
+)
+logger = logging.getLogger(__name__)
 
 # Reduce noisy logs from pyngrok unless explicitly debugging
 logging.getLogger('pyngrok').setLevel(logging.ERROR)
@@ -158,6 +184,7 @@ if __name__ == "__main__":
 
         # Only attempt to start ngrok if explicitly enabled via env var.
         if os.environ.get('ENABLE_NGROK', 'false').lower() == 'true':
+            from services.network_setup import start_ngrok
             public_url = start_ngrok(app, port=port)
             # Log a concise ngrok info line instead of large ASCII banner
             logger.info("NGROK public URL: %s", public_url)
@@ -176,6 +203,14 @@ if __name__ == "__main__":
     except Exception:
         port = 5000
     host = os.environ.get('BACKEND_HOST', '0.0.0.0')
+    from services.sqlite_maintenance import start_wal_checkpointer
+    start_wal_checkpointer(app, socketio)
+    from services.message_archive import start_message_archiver
+    start_message_archiver(app, socketio)
+    from services.message_sweeper import start_recall_sweeper
+    start_recall_sweeper(app, socketio)
+    from services.dead_letter import start_dead_letter_retrier
+    start_dead_letter_retrier(app, socketio)
     # Newer Flask-SocketIO versions raise an error when running with the
     # Werkzeug dev server. For local development we allow it explicitly.
     socketio.run(app, host=host, port=port, debug=False, allow_unsafe_werkzeug=True)
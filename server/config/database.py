@@ -1,5 +1,110 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from sqlalchemy import event
+import logging
+
+logger = logging.getLogger(__name__)
 
 db = SQLAlchemy()
-migrate = Migrate()
\ No newline at end of file
+
+
+def init_migrate(app):
+    """Attach Flask-Migrate for the `flask db` commands.
+
+    Flask-Migrate pulls in alembic (~100ms of imports), so app.py only calls
+    this when running under the `flask` CLI.
+    """
+    from flask_migrate import Migrate
+    return Migrate(app, db)
+
+
+def sqlite_profile_from_config(config):
+    """Build the per-connection SQLite pragma profile from app config."""
+    return {
+        'journal_mode': config.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': config.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'mmap_size': int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': int(config.get('SQLITE_CACHE_SIZE', -64000)),
+        'temp_store': config.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+
+
+def apply_sqlite_pragmas(dbapi_connection, profile):
+    """Apply a pragma profile to a raw sqlite3 connection.
+
+    Values come from config, not from users, but are still validated because
+    PRAGMA statements cannot take bound parameters.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name in ('busy_timeout', 'journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store'):
+            value = profile.get(name)
+            if value is None:
+                continue
+            if not str(value).lstrip('-').isalnum():
+                raise ValueError(f'invalid value for PRAGMA {name}: {value!r}')
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_sqlite_profile(app):
+    """Apply the SQLite storage profile to every pooled connection of `db.engine`.
+
+    No-op for non-SQLite databases or when SQLITE_PROFILE_ENABLED is false.
+    Must run before the first connection is opened.
+    """
+    if str(app.config.get('SQLITE_PROFILE_ENABLED', 'true')).lower() != 'true':
+        return
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+        profile = sqlite_profile_from_config(app.config)
+
+        @event.listens_for(engine, 'connect')
+        def _on_connect(dbapi_connection, connection_record):
+            apply_sqlite_pragmas(dbapi_connection, profile)
+
+        logger.debug('SQLite profile enabled: %s', profile)
+
+
+def serialize_session_writes():
+    """Under gevent/eventlet, let one greenlet at a time hold a session write transaction.
+
+    sqlite3 calls are blocking C calls that monkey patching cannot make
+    cooperative: a greenlet waiting in SQLite's busy handler keeps the hub, so
+    a greenlet holding the write lock that yielded mid-transaction (an emit, an
+    S3 call) never gets to commit, and every connection stalls for up to
+    busy_timeout. A patched, hence cooperative, lock is taken at the first
+    write of a session transaction (a flush or an ORM INSERT/UPDATE/DELETE) and
+    released when the transaction ends, so writers queue on the hub instead.
+
+    Writers in other processes are still waited for inside SQLite; serve.py
+    keeps SQLITE_BUSY_TIMEOUT_MS short to bound that stall.
+    """
+    import threading
+    from sqlalchemy.orm import Session
+
+    lock = threading.RLock()
+
+    def _acquire(session):
+        if not session.info.get('write_lock'):
+            lock.acquire()
+            session.info['write_lock'] = True
+
+    @event.listens_for(Session, 'before_flush')
+    def _before_flush(session, flush_context, instances):
+        _acquire(session)
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _on_execute(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            _acquire(orm_execute_state.session)
+
+    @event.listens_for(Session, 'after_transaction_end')
+    def _after_transaction_end(session, transaction):
+        if transaction.parent is None and session.info.pop('write_lock', False):
+            lock.release()
+
+    logger.debug('session writes serialized for the greenlet hub')
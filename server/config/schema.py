@@ -0,0 +1,186 @@
+"""Schema creation, in-place upgrades and demo data, kept out of import time.
+
+`python app.py` still runs `init_database()` on import when AUTO_INIT_DB is
+true (the development default). serve.py and worker processes set it to false
+and rely on the CLI instead:
+
+    cd server
+    flask --app app init-db           # create tables, add missing columns/indexes
+    flask --app app init-db --seed    # ... and create the demo users
+    flask --app app seed-demo
+
+Additive schema changes for existing databases (new columns, new indexes)
+go into `upgrade_schema()`, which must stay idempotent.
+"""
+import logging
+import os
+from datetime import datetime
+
+import click
+from sqlalchemy import inspect, text
+
+from config.database import db
+
+logger = logging.getLogger(__name__)
+
+# (table, column, DDL type) added after the table first shipped
+ADDED_COLUMNS = [
+    ('message', 'file_url', 'VARCHAR(500)'),
+    ('contact_sync', 'contacts_hash', 'VARCHAR(64)'),
+    ('user', 'profile_version', 'INTEGER NOT NULL DEFAULT 1'),
+    ('contact_sync', 'matches_json', "TEXT DEFAULT '{}'"),
+    ('message', 'recalled', 'BOOLEAN NOT NULL DEFAULT 0'),
+    ('message', 'recalled_at', 'DATETIME'),
+    ('sticker', 'pack_id', 'INTEGER REFERENCES sticker_pack(id)'),
+    ('sticker', 'content_hash', 'VARCHAR(64)'),
+    ('sticker', 'source_hash', 'VARCHAR(64)'),
+]
+
+DEMO_USERS = [
+    ('alice', 'password', 'Alice Nguyễn'),
+    ('bob', 'password', 'Bob Trần'),
+    ('carol', 'password', 'Carol Lê'),
+]
+
+
+def import_models():
+    """Import every model module so `db.metadata` knows all tables."""
+    from models import (user_model, friend_model, block_model, group_model, message_model,  # noqa: F401
+                        message_reaction_model, message_archive_model, sticker_model, sticker_pack_model,
+                        contact_sync_model, friend_suggestion_model, upload_model)
+
+
+def upgrade_schema():
+    """Create missing tables, then add columns and indexes that create_all skips. Needs an app context."""
+    import_models()
+    db.create_all()
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if column not in {c['name'] for c in inspector.get_columns(table)}:
+                conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}'))
+                logger.info('Added %s column to %s table', column, table)
+        if 'ix_user_phone_number' not in {i['name'] for i in inspector.get_indexes('user')}:
+            normalize_phone_numbers(conn)
+        adopt_unpacked_stickers(conn)
+        rehash_legacy_stickers(conn)
+        # archive partitions select every Message column, so they need the new ones too
+        from services.message_archive import upgrade_partitions
+        upgrade_partitions(conn)
+        # create_all skips tables that already exist, so add new indexes explicitly
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def normalize_phone_numbers(conn):
+    """Rewrite stored phone numbers to E.164 before the unique index is built.
+
+    Invalid numbers become NULL. When several accounts share a number, the
+    oldest account keeps it and the others are cleared (and logged), since
+    the unique index cannot be created otherwise.
+    """
+    from utils.phone import normalize_phone
+    rows = conn.execute(text('SELECT id, phone_number FROM "user" WHERE phone_number IS NOT NULL ORDER BY id')).all()
+    owners = {}
+    updates = []
+    for user_id, raw in rows:
+        phone = normalize_phone(raw)
+        if phone and phone in owners:
+            logger.warning('Phone %s of user %s already belongs to user %s; clearing it', phone, user_id, owners[phone])
+            phone = None
+        elif phone:
+            owners[phone] = user_id
+        if phone != raw:
+            updates.append({'id': user_id, 'phone': phone})
+    if updates:
+        conn.execute(text('UPDATE "user" SET phone_number = :phone WHERE id = :id'), updates)
+    logger.info('Normalized %s of %s stored phone numbers', len(updates), len(rows))
+    return len(updates)
+
+
+def adopt_unpacked_stickers(conn):
+    """Put stickers that predate packs into the default pack, so every sticker is listed by the manifest."""
+    from services.sticker_catalog import DEFAULT_PACK_NAME
+    if not conn.execute(text('SELECT 1 FROM sticker WHERE pack_id IS NULL LIMIT 1')).first():
+        return 0
+    pack_id = conn.execute(text('SELECT id FROM sticker_pack WHERE name = :name'), {'name': DEFAULT_PACK_NAME}).scalar()
+    if pack_id is None:
+        now = datetime.utcnow()
+        pack_id = conn.execute(text('INSERT INTO sticker_pack (name, source, created_at, updated_at) '
+                                    'VALUES (:name, :source, :now, :now)'),
+                               {'name': DEFAULT_PACK_NAME, 'source': 'upload', 'now': now}).lastrowid
+    moved = conn.execute(text('UPDATE sticker SET pack_id = :pack WHERE pack_id IS NULL'), {'pack': pack_id}).rowcount
+    logger.info('Moved %s stickers without a pack into "%s"', moved, DEFAULT_PACK_NAME)
+    return moved
+
+
+def rehash_legacy_stickers(conn):
+    """Give stickers uploaded before content addressing a hashed, immutable `/stickers/files/` URL.
+
+    The old file stays where it is: sent messages keep linking its
+    `/uploads/files/stickers/<name>` URL. Files that are missing or of a type
+    no longer accepted (.svg) keep their old URL and a NULL content_hash.
+    """
+    from services.sticker_catalog import STICKER_EXTENSIONS, content_hash, sticker_dir, store_file
+    legacy_prefix = '/uploads/files/stickers/'
+    rows = conn.execute(text('SELECT id, file_url FROM sticker WHERE content_hash IS NULL AND file_url LIKE :prefix'),
+                        {'prefix': legacy_prefix + '%'}).all()
+    if not rows:
+        return 0
+    taken = {h for (h,) in conn.execute(text('SELECT content_hash FROM sticker WHERE content_hash IS NOT NULL'))}
+    moved = 0
+    for sticker_id, url in rows:
+        name = os.path.basename(url[len(legacy_prefix):])
+        ext = os.path.splitext(name)[1].lower()
+        path = os.path.join(sticker_dir(), name)
+        if ext not in STICKER_EXTENSIONS or not os.path.isfile(path):
+            logger.warning('Sticker %s keeps its legacy URL %s (missing file or unsupported type)', sticker_id, url)
+            continue
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        digest, file_url = store_file(data, ext, content_hash(data))
+        # identical images share the hashed file; only the first row owns the (unique) hash
+        owned = digest if digest not in taken else None
+        taken.add(digest)
+        conn.execute(text('UPDATE sticker SET file_url = :url, content_hash = :hash, source_hash = :source '
+                          'WHERE id = :id'), {'url': file_url, 'hash': owned, 'source': digest, 'id': sticker_id})
+        moved += 1
+    logger.info('Moved %s of %s legacy stickers to content-addressed URLs', moved, len(rows))
+    return moved
+
+
+def seed_demo_users():
+    """Create the demo accounts when the user table is empty. Returns the number created."""
+    from models.user_model import User
+    from services.auth_service import register_user
+    if User.query.count():
+        return 0
+    for username, password, display_name in DEMO_USERS:
+        register_user(username, password, display_name=display_name)
+    logger.info('Created demo users: %s', ', '.join(u for u, _, _ in DEMO_USERS))
+    return len(DEMO_USERS)
+
+
+def init_database(app, seed=True):
+    """Upgrade the schema and optionally seed demo users inside an app context."""
+    with app.app_context():
+        upgrade_schema()
+        if seed:
+            seed_demo_users()
+
+
+def register_cli(app):
+    @app.cli.command('init-db')
+    @click.option('--seed/--no-seed', default=False, help='Also create the demo users.')
+    def init_db_command(seed):
+        """Create tables and apply additive schema upgrades."""
+        init_database(app, seed=seed)
+        click.echo('Database schema is up to date.')
+
+    @app.cli.command('seed-demo')
+    def seed_demo_command():
+        """Create the demo users (alice, bob, carol) if there are no users."""
+        with app.app_context():
+            created = seed_demo_users()
+        click.echo(f'Created {created} demo users.')
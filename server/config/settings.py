@@ -2,10 +2,63 @@ import os
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'supersecretkey')
-    # Use absolute path to storage folder to avoid relative path issues
-    DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'storage', 'chatapp.db')
+    # Use absolute path to storage folder to avoid relative path issues.
+    # CHAT_DB_PATH points the app at another SQLite file (benchmarks, synthetic data).
+    DB_PATH = os.path.abspath(os.environ.get('CHAT_DB_PATH') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'storage', 'chatapp.db'))
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_PATH}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite storage profile applied on every pooled connection (see config/database.py).
+    # WAL lets readers run while the single writer commits.
+    SQLITE_PROFILE_ENABLED = os.environ.get('SQLITE_PROFILE_ENABLED', 'true')
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # negative = KiB, ~64MB
+    SQLITE_TEMP_STORE = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+    # Background WAL checkpointing: PASSIVE every interval, TRUNCATE once the WAL grows past the limit
+    SQLITE_CHECKPOINT_INTERVAL = int(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', 60))
+    SQLITE_WAL_TRUNCATE_BYTES = int(os.environ.get('SQLITE_WAL_TRUNCATE_BYTES', 64 * 1024 * 1024))
+    # Messages older than MESSAGE_ARCHIVE_AFTER_DAYS move to monthly message_archive_YYYYMM tables
+    MESSAGE_ARCHIVE_ENABLED = os.environ.get('MESSAGE_ARCHIVE_ENABLED', 'true')
+    MESSAGE_ARCHIVE_AFTER_DAYS = int(os.environ.get('MESSAGE_ARCHIVE_AFTER_DAYS', 90))
+    MESSAGE_ARCHIVE_INTERVAL = int(os.environ.get('MESSAGE_ARCHIVE_INTERVAL', 3600))
+    MESSAGE_ARCHIVE_BATCH_SIZE = int(os.environ.get('MESSAGE_ARCHIVE_BATCH_SIZE', 500))
+    # Reactions and attachments of recalled messages are removed by a background sweeper
+    RECALL_SWEEP_INTERVAL = int(os.environ.get('RECALL_SWEEP_INTERVAL', 600))
+    RECALL_SWEEP_BATCH_SIZE = int(os.environ.get('RECALL_SWEEP_BATCH_SIZE', 500))
+    # send_message inserts that fail on a busy database wait in a dead-letter journal (services/dead_letter.py)
+    DEAD_LETTER_PATH = os.environ.get('DEAD_LETTER_PATH', '')  # default: <DB_PATH without .db>.dead_letter.jsonl
+    DEAD_LETTER_MAX_BYTES = int(os.environ.get('DEAD_LETTER_MAX_BYTES', 16 * 1024 * 1024))
+    DEAD_LETTER_FLUSH_MS = int(os.environ.get('DEAD_LETTER_FLUSH_MS', 50))
+    DEAD_LETTER_RETRY_SECONDS = float(os.environ.get('DEAD_LETTER_RETRY_SECONDS', 2))
+    DEAD_LETTER_BATCH_SIZE = int(os.environ.get('DEAD_LETTER_BATCH_SIZE', 200))
+    # Window for coalescing fan-out emits into `batch` frames (services/emit_buffer.py); 0 disables
+    EMIT_BATCH_WINDOW_MS = int(os.environ.get('EMIT_BATCH_WINDOW_MS', 20))
+    # A disconnect only becomes `user_offline` for friends if the user has not rejoined within this many seconds
+    PRESENCE_GRACE_SECONDS = float(os.environ.get('PRESENCE_GRACE_SECONDS', 5))
+    # An unchanged contacts hash skips the phone lookup unless the last full match is older than this
+    CONTACTS_RESYNC_SECONDS = int(os.environ.get('CONTACTS_RESYNC_SECONDS', 86400))
+    # Cached friend sets for mutual-friend counts (services/social_graph.py)
+    SOCIAL_GRAPH_CACHE_SIZE = int(os.environ.get('SOCIAL_GRAPH_CACHE_SIZE', 10000))
+    SOCIAL_GRAPH_TTL_SECONDS = float(os.environ.get('SOCIAL_GRAPH_TTL_SECONDS', 300))
+    # Serialized profiles for /users/me, /auth/me, /users/<id> and login: 'memory' or 'redis' (REDIS_URL)
+    PROFILE_CACHE_BACKEND = os.environ.get('PROFILE_CACHE_BACKEND', 'memory')
+    PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', 10000))
+    PROFILE_CACHE_TTL_SECONDS = float(os.environ.get('PROFILE_CACHE_TTL_SECONDS', 600))
+    # Bearer token for GET /metrics; when empty only local, non-forwarded requests may scrape it
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    # Comma separated usernames allowed to use GET /users/export
+    ADMIN_USERNAMES = os.environ.get('ADMIN_USERNAMES', '')
+    # Profile changes also reach users messaged within this many days (0: friends only)
+    PROFILE_FANOUT_PEER_DAYS = float(os.environ.get('PROFILE_FANOUT_PEER_DAYS', 7))
+    # Unanswered calls stop ringing after this many seconds; group calls are capped at CALL_MAX_PARTICIPANTS
+    CALL_RING_TIMEOUT_SECONDS = float(os.environ.get('CALL_RING_TIMEOUT_SECONDS', 45))
+    CALL_MAX_PARTICIPANTS = int(os.environ.get('CALL_MAX_PARTICIPANTS', 16))
+    # Create/upgrade tables and seed demo users when app.py is imported (dev); serve.py defaults to false
+    AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', 'true')
+    # Socket.IO worker model: 'threading' for `python app.py`; serve.py defaults to 'gevent'
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'jwtsecretkey')
     OTP_EXPIRE_SECONDS = 300
@@ -8,6 +8,11 @@ class Block(db.Model):
     target_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_block_user', 'user_id'),
+        db.Index('ix_block_target', 'target_id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
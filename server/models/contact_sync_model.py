@@ -5,8 +5,13 @@ import json
 
 class ContactSync(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # sorted, normalized phone numbers of the last sync
     contacts_json = db.Column(db.Text, default='[]')
+    # utils.phone.contacts_hash of contacts_json; clients echo it back with deltas
+    contacts_hash = db.Column(db.String(64))
+    # {phone: user_id} for the numbers in contacts_json that belong to a user
+    matches_json = db.Column(db.Text, default='{}')
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def get_contacts(self):
@@ -18,10 +23,21 @@ class ContactSync(db.Model):
     def set_contacts(self, contacts):
         self.contacts_json = json.dumps(contacts)
 
+    def get_matches(self):
+        try:
+            matches = json.loads(self.matches_json or '{}')
+            return matches if isinstance(matches, dict) else {}
+        except Exception:
+            return {}
+
+    def set_matches(self, matches):
+        self.matches_json = json.dumps(matches, sort_keys=True)
+
     def to_dict(self):
         return {
             'id': self.id,
             'user_id': self.user_id,
             'contacts': self.get_contacts(),
+            'hash': self.contacts_hash,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
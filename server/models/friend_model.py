@@ -9,6 +9,12 @@ class Friend(db.Model):
     status = db.Column(db.String(32), default='pending')  # pending, accepted, rejected
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # friend lists and pending requests are read from both ends of the edge
+        db.Index('ix_friend_user_status', 'user_id', 'status'),
+        db.Index('ix_friend_friend_status', 'friend_id', 'status'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
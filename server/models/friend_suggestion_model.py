@@ -0,0 +1,36 @@
+from config.database import db
+from datetime import datetime
+
+
+class FriendSuggestion(db.Model):
+    """Precomputed "people you may know" score of `candidate_id` for `user_id` (see services/suggestions.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    mutual_count = db.Column(db.Integer, nullable=False, default=0)
+    # 1 when the candidate's phone number is in the user's synced address book
+    contact_match = db.Column(db.Integer, nullable=False, default=0)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'candidate_id', name='uq_friend_suggestion_pair'),
+        # top-K read: WHERE user_id = ? ORDER BY score DESC
+        db.Index('ix_friend_suggestion_rank', 'user_id', 'score'),
+    )
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'candidate_id': self.candidate_id,
+            'mutual_count': self.mutual_count,
+            'contact_match': bool(self.contact_match),
+            'score': self.score,
+        }
+
+
+class FriendSuggestionScored(db.Model):
+    """Users whose suggestions were computed at least once, including those that got no rows."""
+    __tablename__ = 'friend_suggestion_scored'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    scored_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
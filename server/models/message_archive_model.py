@@ -0,0 +1,27 @@
+from config.database import db
+
+
+class ArchivePartition(db.Model):
+    """One monthly `message_archive_YYYYMM` table and its id range (see services/message_archive.py).
+
+    Written by the archiver in the transaction that moves the rows, so every
+    worker process sees a new partition, or a grown range, as soon as it commits.
+    """
+    __tablename__ = 'message_archive_partition'
+    name = db.Column(db.String(32), primary_key=True)
+    min_id = db.Column(db.Integer, nullable=False)
+    max_id = db.Column(db.Integer, nullable=False)
+
+
+class ArchiveHead(db.Model):
+    """Newest archived message of each conversation, per participant.
+
+    `peer` is the other user's id, or minus the group id for group messages,
+    so the conversation list finds archived-only conversations without
+    scanning the partitions.
+    """
+    __tablename__ = 'message_archive_head'
+    user_id = db.Column(db.Integer, primary_key=True)
+    peer = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, nullable=False)
+    table_name = db.Column(db.String(32), nullable=False)
@@ -12,11 +12,23 @@ class Message(db.Model):
     sticker_id = db.Column(db.String(255), nullable=True)  # Giphy ID or custom pack ID
     sticker_url = db.Column(db.String(500), nullable=True)  # URL for sticker image
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # recall leaves a tombstone: content is blanked, attachments and reactions go with the sweeper
+    recalled = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    recalled_at = db.Column(db.DateTime, nullable=True)
 
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
     group = db.relationship('Group', foreign_keys=[group_id], backref='group_messages')
 
+    __table_args__ = (
+        # conversation history (both directions) and the archiver's age cutoff
+        db.Index('ix_message_pair', 'sender_id', 'receiver_id'),
+        db.Index('ix_message_receiver', 'receiver_id'),
+        db.Index('ix_message_timestamp', 'timestamp'),
+        # tombstones for the recall sweeper
+        db.Index('ix_message_recalled_at', 'recalled_at'),
+    )
+
     def __repr__(self):
         return f'<Message {self.id}>'
 
@@ -10,5 +10,9 @@ class MessageReaction(db.Model):
     reaction_type = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_message_reaction_message', 'message_id'),
+    )
+
     def __repr__(self):
         return f'<MessageReaction {self.id} msg={self.message_id} user={self.user_id} reaction={self.reaction_type}>'
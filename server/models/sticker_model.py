@@ -7,14 +7,27 @@ class Sticker(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=True)
     file_url = db.Column(db.String(500), nullable=False)
+    pack_id = db.Column(db.Integer, db.ForeignKey('sticker_pack.id'), nullable=True)
+    # sha256 of the image bytes; new files are stored and served under this name
+    content_hash = db.Column(db.String(64), nullable=True)
+    # sha256 of the file as imported, before optimization; lets re-imports skip known files
+    source_hash = db.Column(db.String(64), nullable=True)
     created_by = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # per-pack keyset pages: WHERE pack_id = ? AND id > ? ORDER BY id
+        db.Index('ix_sticker_pack', 'pack_id', 'id'),
+        db.Index('ix_sticker_content_hash', 'content_hash', unique=True),
+        db.Index('ix_sticker_source_hash', 'source_hash'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
             'name': self.name,
             'file_url': self.file_url,
+            'pack_id': self.pack_id,
             'created_by': self.created_by,
             'created_at': self.created_at.isoformat() if self.created_at else None,
         }
@@ -0,0 +1,22 @@
+from datetime import datetime
+from config.database import db
+
+
+class StickerPack(db.Model):
+    """A named group of stickers; the catalog manifest lists one entry per pack (see services/sticker_catalog.py)."""
+    __tablename__ = 'sticker_pack'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False, unique=True)
+    # where the pack came from, e.g. 'zalo' or 'upload'
+    source = db.Column(db.String(50), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'source': self.source,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
@@ -0,0 +1,20 @@
+from datetime import datetime
+from config.database import db
+
+
+class Upload(db.Model):
+    """A chat attachment stored by POST /uploads/file or /uploads/presigned-url, and who uploaded it.
+
+    The recall sweeper only deletes files recorded here, and only for a
+    message from the same user, so a `file_url` sent by a client can never
+    make it delete someone else's file.
+    """
+    __tablename__ = 'upload'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    file_url = db.Column(db.String(500), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_upload_file_url', 'file_url', unique=True),
+    )
@@ -9,8 +9,11 @@ class User(db.Model):
     display_name = db.Column(db.String(120))
     gender = db.Column(db.String(16))
     birthdate = db.Column(db.Date)
-    phone_number = db.Column(db.String(32))
+    # E.164 (see utils.phone.normalize_phone); unique so lookups hit ix_user_phone_number
+    phone_number = db.Column(db.String(32), unique=True, index=True)
     status = db.Column(db.String(32), default='offline')
+    # bumped on every profile change; clients and services/profile_cache.py drop older copies
+    profile_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
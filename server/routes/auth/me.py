@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from services.auth_service import decode_token
-from models.user_model import User
+from services.profile_cache import profile_cache, with_status
 
 auth_me_bp = Blueprint('auth_me', __name__, url_prefix='/auth/me')
 
@@ -13,17 +13,7 @@ def auth_me():
     payload = decode_token(token)
     if not payload or not payload.get('user_id'):
         return jsonify({'error': 'Unauthorized'}), 401
-    user = User.query.get(payload['user_id'])
-    if not user:
+    profile = profile_cache.get(payload['user_id'])
+    if not profile:
         return jsonify({'error': 'User not found'}), 404
-
-    return jsonify({
-        'id': user.id,
-        'username': user.username,
-        'display_name': user.display_name if getattr(user, 'display_name', None) else user.username,
-        'avatar_url': user.avatar_url,
-        'status': user.status,
-        'gender': getattr(user, 'gender', None),
-        'birthdate': user.birthdate.isoformat() if getattr(user, 'birthdate', None) and hasattr(user.birthdate, 'isoformat') else (user.birthdate if user.birthdate else None),
-        'phone_number': getattr(user, 'phone_number', None),
-    })
+    return jsonify(with_status(profile))
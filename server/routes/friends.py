@@ -4,6 +4,9 @@ from models.user_model import User
 from models.friend_model import Friend
 from models.block_model import Block
 from config.database import db
+from services import suggestions
+from services.social_graph import social_graph
+from services.user_loader import user_loader
 
 friends_bp = Blueprint('friends', __name__, url_prefix='/friends')
 
@@ -42,12 +45,11 @@ def list_friend_requests():
         return jsonify({'error': 'Unauthorized'}), 401
     # incoming requests where friend_id == uid and status == pending
     rels = Friend.query.filter_by(friend_id=uid, status='pending').all()
-    user_ids = [r.user_id for r in rels]
-    users = User.query.filter(User.id.in_(user_ids)).all() if user_ids else []
+    users = user_loader.load_many(r.user_id for r in rels)
     # include the friend relation id so the client can accept by id (or by user id)
     result = []
     for r in rels:
-        u = next((u for u in users if u.id == r.user_id), None)
+        u = users.get(r.user_id)
         if u:
             result.append({'rel_id': r.id, 'user_id': u.id, 'username': u.username, 'display_name': getattr(u, 'display_name', None)})
     return jsonify(result)
@@ -100,6 +102,8 @@ def accept_friend(other_id):
         return jsonify({'error': 'No friend request found'}), 404
     rel.status = 'accepted'
     db.session.commit()
+    social_graph.invalidate(rel.user_id, rel.friend_id)
+    suggestions.friendship_added(rel.user_id, rel.friend_id)
     return jsonify({'success': True})
 
 
@@ -119,8 +123,14 @@ def remove_friend(other_id):
 
     # Delete the relationship
     try:
+        was_friend = rel.status == 'accepted'
         db.session.delete(rel)
         db.session.commit()
+        if was_friend:
+            social_graph.invalidate(uid, other_id)
+            suggestions.friendship_removed(uid, other_id)
+        else:
+            suggestions.relation_dropped(uid, other_id)
         return jsonify({'success': True, 'message': 'Friend removed'})
     except Exception as e:
         db.session.rollback()
@@ -2,6 +2,9 @@ from flask import Blueprint, request, jsonify
 from models.message_model import Message
 from config.database import db
 from sqlalchemy import or_
+from services.message_archive import conversation_pair, latest_per_peer, page_messages
+from services.user_loader import user_loader
+from datetime import datetime, timezone
 import os
 from werkzeug.utils import secure_filename
 import time
@@ -12,18 +15,80 @@ logger = logging.getLogger(__name__)
 messages_bp = Blueprint('messages', __name__, url_prefix='/messages')
 
 
+def _serialize_message(m):
+    """Message dict for hot Message objects and archived rows alike.
+
+    A recalled message is a tombstone: same id and timestamp, no content,
+    attachment or sticker, `recalled` true.
+    """
+    recalled = bool(getattr(m, 'recalled', False))
+    recalled_at = getattr(m, 'recalled_at', None)
+    return {
+        'id': m.id,
+        'sender_id': m.sender_id,
+        'receiver_id': m.receiver_id,
+        'content': '' if recalled else m.content,
+        'file_url': None if recalled else m.file_url,
+        'message_type': m.message_type,
+        'sticker_id': None if recalled else m.sticker_id,
+        'sticker_url': None if recalled else m.sticker_url,
+        'timestamp': m.timestamp.isoformat() if m.timestamp else None,
+        'recalled': recalled,
+        'recalled_at': recalled_at.isoformat() if recalled_at else None,
+    }
+
+
+def _preview(m):
+    """Conversation list preview for a message."""
+    if getattr(m, 'recalled', False):
+        return '[Recalled]'
+    if m.message_type == 'sticker':
+        return '[Sticker]'
+    if m.file_url:
+        return '[File] '
+    return m.content
+
+
+def _parse_since(value):
+    """Naive UTC datetime from an ISO 8601 string, or None when it does not parse."""
+    try:
+        ts = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _paged_response(rows, limit):
+    """JSON list in chronological order; X-Next-Cursor holds the before_id for the older page."""
+    rows = sorted(rows, key=lambda m: (m.timestamp or datetime.min, m.id))
+    resp = jsonify([_serialize_message(m) for m in rows])
+    if limit and len(rows) >= limit:
+        resp.headers['X-Next-Cursor'] = str(min(m.id for m in rows))
+    return resp
+
+
 @messages_bp.route('', methods=['GET'])
 def get_messages():
-    """Return messages between two users (both directions).
+    """Return messages between two users (both directions), oldest first.
+
+    Reads span the hot table and the monthly archive partitions.
 
     Query params:
       - sender_id: required
       - receiver_id: required
       - limit: optional int to cap number of messages (most recent)
+      - before_id: optional id cursor; only messages older than it (next page
+        comes back in the X-Next-Cursor header)
+      - since: optional ISO timestamp (the previous response's X-Sync-Time);
+        only messages sent, edited or recalled after it. Recalled messages
+        come back as tombstones, so a client that was offline can apply
+        recalls without re-downloading the history.
     """
     sender_id = request.args.get('sender_id')
     receiver_id = request.args.get('receiver_id')
-    logger.info("[MESSAGES] sender=%s receiver=%s", sender_id, receiver_id)
+    logger.debug("[MESSAGES] sender=%s receiver=%s", sender_id, receiver_id)
     if not sender_id or not receiver_id:
         logger.warning("[MESSAGES] Missing sender_id or receiver_id")
         return jsonify({'error': 'Missing sender_id or receiver_id'}), 400
@@ -36,35 +101,64 @@ def get_messages():
         return jsonify({'error': 'sender_id and receiver_id must be integers'}), 400
 
     limit = request.args.get('limit', type=int)
+    before_id = request.args.get('before_id', type=int)
+    since = None
+    if request.args.get('since'):
+        since = _parse_since(request.args['since'])
+        if since is None:
+            return jsonify({'error': 'since must be an ISO 8601 timestamp'}), 400
 
+    # taken before reading, so nothing committed during the read is skipped by the next sync
+    sync_time = datetime.utcnow()
     # messages where (sender=a and receiver=b) OR (sender=b and receiver=a)
-    query = Message.query.filter(
-        or_(
-            (Message.sender_id == a) & (Message.receiver_id == b),
-            (Message.sender_id == b) & (Message.receiver_id == a),
-        )
-    ).order_by(Message.timestamp.asc())
-
-    if limit:
-        msgs = query.limit(limit).all()
-    else:
-        msgs = query.all()
-
-    response_data = [
-        {
-            'id': m.id,
-            'sender_id': m.sender_id,
-            'receiver_id': m.receiver_id,
-            'content': m.content,
-            'file_url': m.file_url,
-            'message_type': m.message_type,
-            'sticker_id': m.sticker_id,
-            'sticker_url': m.sticker_url,
-            'timestamp': m.timestamp.isoformat()
-        } for m in msgs
-    ]
-    logger.info("[MESSAGES] count=%s", len(response_data))
-    return jsonify(response_data)
+    where = conversation_pair(a, b)
+    if since is not None:
+        pair = where
+
+        def where(t):
+            return pair(t) & or_(t.c.timestamp > since, t.c.recalled_at > since)
+
+    msgs = page_messages(where, limit=limit, before_id=before_id)
+    logger.debug("[MESSAGES] count=%s", len(msgs))
+    resp = _paged_response(msgs, limit)
+    resp.headers['X-Sync-Time'] = sync_time.isoformat()
+    return resp
+
+
+@messages_bp.route('/search', methods=['GET'])
+def search_messages():
+    """Full-history text search in the caller's conversations (hot and archived).
+
+    Requires Authorization: Bearer <token>
+
+    Query params:
+      - q: required text to look for in message content
+      - peer_id: optional, restrict to the 1:1 conversation with this user
+      - limit: optional, default 50, max 200
+      - before_id: optional id cursor, as for GET /messages
+    """
+    from services.auth_service import decode_token
+
+    auth = request.headers.get('Authorization', '')
+    payload = decode_token(auth.split(' ', 1)[1]) if auth.startswith('Bearer ') else None
+    uid = payload.get('user_id') if payload else None
+    if not uid:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'Missing q'}), 400
+    peer_id = request.args.get('peer_id', type=int)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    before_id = request.args.get('before_id', type=int)
+    pattern = '%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+    def where(t):
+        scope = conversation_pair(uid, peer_id)(t) if peer_id else or_(t.c.sender_id == uid, t.c.receiver_id == uid)
+        return scope & t.c.content.like(pattern, escape='\\')
+
+    msgs = page_messages(where, limit=limit, before_id=before_id)
+    return _paged_response(msgs, limit)
 
 
 @messages_bp.route('/conversations', methods=['GET'])
@@ -74,7 +168,6 @@ def get_conversations():
     Requires Authorization: Bearer <token>
     """
     from services.auth_service import decode_token
-    from models.user_model import User
     from models.group_model import Group
 
     auth = request.headers.get('Authorization', '')
@@ -103,30 +196,34 @@ def get_conversations():
             key = ('user', other)
 
         if key not in conv_map:
-            # Show a friendly preview depending on message type
-            if m.message_type == 'sticker':
-                preview = '[Sticker]'
-            elif m.file_url:
-                preview = '[File] '
-            else:
-                preview = m.content
-
             conv_map[key] = {
                 'type': key[0],
                 'id': key[1],
-                'last_message': preview,
+                'last_message': _preview(m),
                 'last_ts': m.timestamp.isoformat(),
             }
 
-    # Enrich with display names
+    # Conversations whose messages were all archived still belong in the list
+    for key, m in latest_per_peer(uid, conv_map.keys()).items():
+        conv_map[key] = {
+            'type': key[0],
+            'id': key[1],
+            'last_message': _preview(m),
+            'last_ts': m.timestamp.isoformat() if m.timestamp else None,
+        }
+
+    # Enrich with display names: one query for all peers, one for all groups
+    users = user_loader.load_many(v['id'] for v in conv_map.values() if v['type'] == 'user')
+    group_ids = [v['id'] for v in conv_map.values() if v['type'] != 'user']
+    groups = {grp.id: grp for grp in Group.query.filter(Group.id.in_(group_ids))} if group_ids else {}
     result = []
     for k, v in conv_map.items():
         if v['type'] == 'user':
-            u = User.query.get(v['id'])
+            u = users.get(v['id'])
             v['display_name'] = (u.display_name or u.username) if u else None
             v['username'] = u.username if u else None
         else:
-            g = Group.query.get(v['id'])
+            g = groups.get(v['id'])
             v['group_name'] = g.name if g else f'Group {v["id"]}'
         result.append(v)
 
@@ -0,0 +1,29 @@
+import hmac
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from services.metrics import render_metrics
+
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/metrics')
+
+LOOPBACK = ('127.0.0.1', '::1')
+
+
+def _allowed():
+    """METRICS_TOKEN set: require `Authorization: Bearer <token>`. Unset: local scrapers only.
+
+    Tunnels such as ngrok connect from localhost too, so a request that carries
+    X-Forwarded-For is never treated as local.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        auth = request.headers.get('Authorization', '')
+        return auth.startswith('Bearer ') and hmac.compare_digest(auth[7:].strip(), token)
+    return request.remote_addr in LOOPBACK and 'X-Forwarded-For' not in request.headers
+
+
+@metrics_bp.route('', methods=['GET'])
+def metrics():
+    """Expose counters, gauges and latency histograms in Prometheus text format."""
+    if not _allowed():
+        return jsonify({'error': 'forbidden'}), 403
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,35 @@
+from flask import Blueprint, jsonify, request
+from routes.friends import current_user_from_request
+from services.presence import MAX_SUBSCRIPTIONS_PER_SID, as_user_id, presence
+from services.social_graph import social_graph
+
+presence_bp = Blueprint('presence', __name__, url_prefix='/presence')
+
+
+@presence_bp.route('', methods=['GET'])
+def get_presence():
+    """Bulk presence from the in-memory registry (no database access).
+
+    Requires Authorization: Bearer <token>
+
+    Query params:
+      - ids: comma separated user ids (at most 1000)
+
+    Returns { presence: { "<id>": { online, last_seen } } } for the ids that
+    are the caller's friends; other ids are left out. For live updates
+    use the `presence_subscribe` socket event, which sends the same snapshot
+    followed by `presence_diff` events.
+    """
+    caller = as_user_id(current_user_from_request(request))
+    if not caller:
+        return jsonify({'error': 'Unauthorized'}), 401
+    raw = [part.strip() for part in (request.args.get('ids') or '').split(',') if part.strip()]
+    if not raw:
+        return jsonify({'error': 'Missing ids'}), 400
+    if len(raw) > MAX_SUBSCRIPTIONS_PER_SID:
+        return jsonify({'error': f'At most {MAX_SUBSCRIPTIONS_PER_SID} ids per request'}), 400
+    ids = [as_user_id(i) for i in raw]
+    if any(not isinstance(uid, int) for uid in ids):
+        return jsonify({'error': 'ids must be integers'}), 400
+    friends = social_graph.friends_of(caller)
+    return jsonify({'presence': presence.snapshot(uid for uid in ids if uid in friends)})
@@ -1,25 +1,107 @@
 import os
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+import re
+from flask import Blueprint, request, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
 from config.database import db
 from models.sticker_model import Sticker
+from models.sticker_pack_model import StickerPack
+from services.sticker_catalog import (STICKER_EXTENSIONS, add_sticker, build_manifest, get_or_create_pack,
+                                      pack_page, pack_stats, pack_version, sticker_dir)
 
 stickers_bp = Blueprint('stickers', __name__, url_prefix='/stickers')
 
-# ensure upload folder exists
-def _ensure_folder(path):
-    os.makedirs(path, exist_ok=True)
+# content-addressed names only: anything else is not immutable
+_HASHED_NAME_RE = re.compile(r'^[0-9a-f]{64}\.(?:png|jpe?g|gif|webp)$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _page_args(default=100, maximum=500):
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = min(max(request.args.get('limit', default, type=int), 1), maximum)
+    return after_id, limit
+
+
+def _revalidated(resp, etag):
+    """Attach a strong ETag and answer 304 when the client's If-None-Match still matches."""
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
 
 
 @stickers_bp.route('/', methods=['GET'])
 def list_stickers():
-    stickers = Sticker.query.order_by(Sticker.id.desc()).all()
-    return jsonify([s.to_dict() for s in stickers])
+    """All stickers, newest first, one keyset page at a time.
+
+    Query params:
+      - before_id: return stickers with a smaller id (the previous page's X-Next-Cursor)
+      - limit: optional, default 100, max 500
+
+    Pickers should use GET /stickers/manifest and GET /stickers/packs/<id> instead.
+    """
+    before_id = request.args.get('before_id', type=int)
+    _, limit = _page_args()
+    query = Sticker.query.order_by(Sticker.id.desc())
+    if before_id:
+        query = query.filter(Sticker.id < before_id)
+    stickers = query.limit(limit).all()
+    resp = jsonify([s.to_dict() for s in stickers])
+    if len(stickers) >= limit:
+        resp.headers['X-Next-Cursor'] = str(stickers[-1].id)
+    return resp
+
+
+@stickers_bp.route('/manifest', methods=['GET'])
+def sticker_manifest():
+    """Compact catalog: {version, packs: [{id, name, count, cover_url, version}]}.
+
+    The ETag is the manifest `version`; send it back in If-None-Match to get
+    a 304 while nothing changed. Refetch a pack's pages only when its own
+    `version` differs from the cached one.
+    """
+    manifest = build_manifest()
+    return _revalidated(jsonify(manifest), manifest['version'])
+
+
+@stickers_bp.route('/packs/<int:pack_id>', methods=['GET'])
+def list_pack(pack_id):
+    """One page of a pack's stickers in id order: [{id, name, url}].
+
+    Query params:
+      - after_id: return stickers with a larger id (the previous page's X-Next-Cursor)
+      - limit: optional, default 100, max 500
+
+    Pages carry an ETag derived from the pack version, so If-None-Match works here too.
+    """
+    pack = db.session.get(StickerPack, pack_id)
+    if pack is None:
+        return jsonify({'error': 'pack not found'}), 404
+    after_id, limit = _page_args()
+    version = pack_version(pack, *pack_stats(pack))
+    rows = pack_page(pack_id, after_id, limit)
+    resp = jsonify(rows)
+    if len(rows) >= limit:
+        resp.headers['X-Next-Cursor'] = str(rows[-1]['id'])
+    return _revalidated(resp, f'{version}-{after_id}-{limit}')
+
+
+@stickers_bp.route('/files/<name>', methods=['GET'])
+def serve_sticker(name):
+    """Hash-named sticker file; the name changes with the content, so it may be cached forever."""
+    if not _HASHED_NAME_RE.match(name):
+        return jsonify({'error': 'not found'}), 404
+    resp = send_from_directory(sticker_dir(), name, max_age=IMMUTABLE_MAX_AGE)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
 
 
 @stickers_bp.route('/upload', methods=['POST'])
 def upload_sticker():
-    # multipart form: file, optional name, optional created_by
+    """multipart form: file, optional name, optional pack (pack name) or pack_id, optional created_by.
+
+    The file is stored under its content hash; uploading an image that is
+    already in the catalog returns the existing sticker (200 instead of 201).
+    """
     if 'file' not in request.files:
         return jsonify({'error': 'no file provided'}), 400
     f = request.files['file']
@@ -27,25 +109,22 @@ def upload_sticker():
         return jsonify({'error': 'empty filename'}), 400
 
     filename = secure_filename(f.filename)
-    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-    uploads_dir = os.path.join(base_dir, 'storage', 'uploads', 'stickers')
-    _ensure_folder(uploads_dir)
-
-    dest_path = os.path.join(uploads_dir, filename)
-    f.save(dest_path)
-
-    # construct a relative URL that the client can request via uploads files route
-    # Use /uploads/files/stickers/<filename> so it maps under the existing uploads blueprint
-    file_url = f'/uploads/files/stickers/{filename}'
-
-    name = request.form.get('name') or filename
-    created_by = request.form.get('created_by')
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in STICKER_EXTENSIONS:
+        return jsonify({'error': 'unsupported file type', 'allowed': list(STICKER_EXTENSIONS)}), 400
 
-    sticker = Sticker(name=name, file_url=file_url, created_by=created_by)
-    db.session.add(sticker)
-    db.session.commit()
+    pack_id = request.form.get('pack_id', type=int)
+    if pack_id:
+        pack = db.session.get(StickerPack, pack_id)
+        if pack is None:
+            return jsonify({'error': 'pack not found'}), 404
+    else:
+        pack = get_or_create_pack(request.form.get('pack'), source='upload')
 
-    return jsonify({'sticker': sticker.to_dict()})
+    name = request.form.get('name') or os.path.splitext(filename)[0]
+    created_by = request.form.get('created_by', type=int)
+    sticker, created = add_sticker(f.read(), ext, pack, name=name, created_by=created_by)
+    return jsonify({'sticker': sticker.to_dict(), 'duplicate': not created}), 201 if created else 200
 
 
 @stickers_bp.route('/<int:sticker_id>', methods=['GET'])
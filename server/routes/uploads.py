@@ -1,12 +1,19 @@
 from flask import Blueprint, request, jsonify, current_app, send_from_directory
 from werkzeug.utils import secure_filename
 import os
-import boto3
-from botocore.exceptions import ClientError
 from services.auth_service import decode_token
+from services.async_compat import run_blocking
+from config.database import db
+from models.upload_model import Upload
 
 uploads_bp = Blueprint('uploads', __name__, url_prefix='/uploads')
 
+
+def _record_upload(user_id, file_url):
+    """Remember who stored `file_url`; the recall sweeper only deletes recorded attachments."""
+    db.session.add(Upload(user_id=user_id, file_url=file_url))
+    db.session.commit()
+
 # Ensure uploads directory exists
 def _uploads_dir():
     base = os.path.join(os.path.dirname(__file__), '..', 'storage', 'uploads')
@@ -31,6 +38,7 @@ def get_s3_client():
             current_app.logger.info('S3 credentials not configured; skipping S3 client creation')
             return None
 
+        import boto3  # heavy import; only paid once S3 is actually configured and used
         return boto3.client(
             's3',
             aws_access_key_id=access_key,
@@ -89,6 +97,8 @@ def generate_presigned_url():
     if not s3_client:
         return jsonify({'error': 'S3 not configured'}), 500
 
+    from botocore.exceptions import ClientError
+
     try:
         # Generate presigned POST URL for upload
         # Include 'acl' field so uploaded objects are public-read and can be viewed
@@ -109,6 +119,7 @@ def generate_presigned_url():
 
         # Generate the public file URL
         file_url = f'https://{bucket}.s3.{region}.amazonaws.com/{key}'
+        _record_upload(user_id, file_url)
 
         return jsonify({
             'upload_url': presigned_post['url'],
@@ -172,14 +183,19 @@ def upload_file():
             key = f'uploads/user{user_id}/{timestamp}_{unique_id}_{secure_name}'
             region = current_app.config.get('AWS_S3_REGION', 'ap-southeast-1')
             
-            s3_client.upload_fileobj(
+            from boto3.s3.transfer import TransferConfig
+            # One worker thread does the whole transfer (no s3transfer thread fan-out)
+            # so the event loop is never blocked by the upload.
+            run_blocking(
+                s3_client.upload_fileobj,
                 file,
                 bucket,
                 key,
                 ExtraArgs={
                     'ContentType': file.content_type or 'application/octet-stream',
                     'ACL': 'public-read'
-                }
+                },
+                Config=TransferConfig(use_threads=False)
             )
             
             file_url = f'https://{bucket}.s3.{region}.amazonaws.com/{key}'
@@ -191,6 +207,7 @@ def upload_file():
             file.save(dest)
             file_url = f'/uploads/files/{filename}'
             current_app.logger.info(f"[UPLOADS] File saved locally: {filename} -> {file_url}")
+        _record_upload(user_id, file_url)
         
         return jsonify({
             'file_url': file_url,
@@ -1,25 +1,125 @@
-from flask import Blueprint, jsonify, request
+import json
+
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
 from models.user_model import User
 from config.database import db
 from services.auth_service import decode_token
+from utils.phone import normalize_phone
+from services.social_graph import social_graph
+from services.user_loader import user_loader
+from services.profile_cache import profile_cache, public_profile, serialize_profile, with_status
+from services.presence import presence
+from services.profile_fanout import changed_fields, publish_profile_update
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 
 users_bp = Blueprint('users', __name__, url_prefix='/users')
 
 
+def _caller_id():
+    """User id from an optional Bearer token, or None."""
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer '):
+        return None
+    payload = decode_token(auth.split(' ', 1)[1])
+    return payload.get('user_id') if payload else None
+
+
+# columns GET /users may return; the export may also return the private ones
+PUBLIC_USER_FIELDS = ('id', 'username', 'display_name', 'avatar_url', 'status', 'created_at')
+EXPORT_USER_FIELDS = PUBLIC_USER_FIELDS + ('gender', 'birthdate', 'phone_number', 'profile_version')
+DEFAULT_LIST_FIELDS = ('id', 'username', 'display_name', 'avatar_url', 'status')
+EXPORT_BATCH_SIZE = 1000
+
+
+def _requested_fields(allowed, default):
+    """Validated `fields` query param (comma separated), or None when it names an unknown field."""
+    raw = request.args.get('fields')
+    if not raw:
+        return default
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    if not fields or any(f not in allowed for f in fields):
+        return None
+    return fields
+
+
+def _user_rows(fields, after_id, limit):
+    """Projected (no ORM objects) user rows with id > after_id, in id order, as dicts."""
+    # id keeps the keyset order; username backs the display_name fallback
+    columns = tuple(dict.fromkeys(('id',) + fields + (('username',) if 'display_name' in fields else ())))
+    query = db.session.query(*(getattr(User, c) for c in columns)).filter(User.id > after_id).order_by(User.id)
+    rows = []
+    for values in query.limit(limit):
+        row = dict(zip(columns, values))
+        out = {}
+        for field in fields:
+            value = row[field]
+            if field == 'display_name':
+                value = value or row['username']
+            elif hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            out[field] = value
+        rows.append((row['id'], out))
+    return rows
+
+
 @users_bp.route('', methods=['GET'])
 def get_users():
-    """Return all users (small apps only)."""
-    users = User.query.all()
-    return jsonify([
-        {
-            'id': u.id,
-            'username': u.username,
-            'display_name': u.display_name if getattr(u, 'display_name', None) else u.username,
-            'avatar_url': u.avatar_url,
-            'status': u.status
-        } for u in users
-    ])
+    """List users in id order, one keyset page at a time.
+
+    Query params:
+      - after_id: return users with a larger id (the previous page's X-Next-Cursor)
+      - limit: optional, default 100, max 1000
+      - fields: comma separated subset of id, username, display_name, avatar_url,
+        status, created_at (default: id, username, display_name, avatar_url, status)
+
+    The X-Next-Cursor response header is set while more users may follow.
+    """
+    fields = _requested_fields(PUBLIC_USER_FIELDS, DEFAULT_LIST_FIELDS)
+    if fields is None:
+        return jsonify({'error': 'Unknown field', 'allowed': list(PUBLIC_USER_FIELDS)}), 400
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    rows = _user_rows(fields, after_id, limit)
+    resp = jsonify([row for _, row in rows])
+    if len(rows) >= limit:
+        resp.headers['X-Next-Cursor'] = str(rows[-1][0])
+    return resp
+
+
+@users_bp.route('/export', methods=['GET'])
+def export_users():
+    """Stream every user as NDJSON (one JSON object per line) for admin exports.
+
+    Requires a Bearer token of a user listed in ADMIN_USERNAMES. Accepts
+    `fields` like GET /users, plus gender, birthdate, phone_number and
+    profile_version. Rows are read in keyset batches, so memory stays flat
+    however many users there are.
+    """
+    caller_id = _caller_id()
+    caller = profile_cache.get(caller_id) if caller_id else None
+    if not caller:
+        return jsonify({'error': 'Unauthorized'}), 401
+    admins = {u.strip() for u in str(current_app.config.get('ADMIN_USERNAMES', '')).split(',') if u.strip()}
+    if caller['username'] not in admins:
+        return jsonify({'error': 'Forbidden'}), 403
+    fields = _requested_fields(EXPORT_USER_FIELDS, EXPORT_USER_FIELDS)
+    if fields is None:
+        return jsonify({'error': 'Unknown field', 'allowed': list(EXPORT_USER_FIELDS)}), 400
+
+    def generate():
+        after_id = 0
+        while True:
+            rows = _user_rows(fields, after_id, EXPORT_BATCH_SIZE)
+            if not rows:
+                return
+            yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for _, row in rows)
+            after_id = rows[-1][0]
+            if len(rows) < EXPORT_BATCH_SIZE:
+                return
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=users.ndjson'})
 
 
 @users_bp.route('/me', methods=['PATCH'])
@@ -37,6 +137,7 @@ def update_me():
     user = User.query.get(payload['user_id'])
     if not user:
         return jsonify({'error': 'User not found'}), 404
+    before = serialize_profile(user)
 
     data = request.get_json() or {}
     display_name = data.get('display_name')
@@ -56,7 +157,13 @@ def update_me():
         user.gender = gender
         changed = True
     if phone_number is not None:
-        user.phone_number = phone_number
+        # stored as E.164 so the unique index answers contact sync and phone lookups
+        phone = normalize_phone(phone_number) if str(phone_number).strip() else None
+        if str(phone_number).strip() and not phone:
+            return jsonify({'error': 'Invalid phone number'}), 400
+        if phone and User.query.filter(User.phone_number == phone, User.id != user.id).first():
+            return jsonify({'error': 'Phone number already in use'}), 409
+        user.phone_number = phone
         changed = True
     if birthdate is not None:
         # accept ISO date YYYY-MM-DD or fallback to string
@@ -69,95 +176,33 @@ def update_me():
             user.birthdate = birthdate
         changed = True
 
+    if changed and not changed_fields(before, serialize_profile(user)):
+        # the same values were sent again: no new version, nothing to fan out
+        changed = False
     if changed:
         try:
+            user.profile_version = (user.profile_version or 1) + 1
             db.session.add(user)
             db.session.commit()
-            # Debug log for profile update
+            after = serialize_profile(user)
+            profile_cache.put(after)
+            # Realtime update: changed fields only, to the user's other sessions, friends and recent peers
             try:
-                current_app.logger.info(f"[USERS] User {user.id} profile updated. avatar_url={user.avatar_url}")
-            except Exception:
-                pass
-            # Emit realtime update to friends so they see new avatar/profile immediately
-            try:
-                # import here to avoid circular imports at module import time
-                from app import socketio
-                from models.friend_model import Friend
-                # collect friend ids in both directions
-                outgoing = Friend.query.filter_by(user_id=user.id, status='accepted').all() or []
-                incoming = Friend.query.filter_by(friend_id=user.id, status='accepted').all() or []
-                friend_ids = set()
-                for f in outgoing:
-                    friend_ids.add(f.friend_id)
-                for f in incoming:
-                    friend_ids.add(f.user_id)
-
-                payload = {
-                    'event': 'PROFILE_UPDATED',
-                    'data': {
-                        'id': user.id,
-                        'username': user.username,
-                        'display_name': user.display_name if getattr(user, 'display_name', None) else user.username,
-                        'avatar_url': user.avatar_url,
-                        'status': user.status,
-                    }
-                }
-
-                # Emit to the user's own room (useful for multi-tab) and to each friend's room
-                # Diagnostic: log current user_sockets mapping so we can tell which users are connected
-                try:
-                    from sockets import chat_events as _chat_events
-                    current_map = getattr(_chat_events, 'user_sockets', {}) or {}
-                    try:
-                        current_app.logger.info(f"[USERS][DIAG] current user_sockets keys={list(current_map.keys())}")
-                        # show a compact mapping of user_id -> sid for debugging
-                        for k, v in list(current_map.items())[:50]:
-                            current_app.logger.debug(f"[USERS][DIAG] mapping {k} -> {v}")
-                    except Exception:
-                        current_app.logger.debug('[USERS][DIAG] failed logging user_sockets mapping')
-                except Exception:
-                    # best-effort only
-                    try:
-                        current_app.logger.debug('[USERS][DIAG] chat_events not importable')
-                    except Exception:
-                        pass
-                try:
-                    current_app.logger.info(f"[USERS] Emitting PROFILE_UPDATED for user {user.id} to user-{user.id} and {len(friend_ids)} friends")
-                    socketio.emit('contact_updated', payload, room=f'user-{user.id}')
-                except Exception as e:
-                    current_app.logger.exception(f"[USERS] Failed emitting to own room: {e}")
-
-                for fid in friend_ids:
-                    try:
-                        current_app.logger.debug(f"[USERS] Emitting PROFILE_UPDATED for user {user.id} to friend room user-{fid}")
-                        socketio.emit('contact_updated', payload, room=f'user-{fid}')
-                    except Exception as e:
-                        current_app.logger.exception(f"[USERS] Failed emitting to friend {fid}: {e}")
-                # As a fallback, also broadcast the update to all connected clients.
-                # This ensures clients that for some reason didn't join rooms still receive profile updates.
-                try:
-                    current_app.logger.info(f"[USERS] Broadcasting PROFILE_UPDATED for user {user.id} to all connected clients as fallback")
-                    socketio.emit('contact_updated', payload)
-                except Exception as e:
-                    current_app.logger.exception(f"[USERS] Failed broadcasting PROFILE_UPDATED: {e}")
+                publish_profile_update(before, after)
             except Exception:
                 # Do not fail the request if emitting realtime updates fails
-                pass
+                current_app.logger.exception('[USERS] profile fan-out failed for user %s', user.id)
+        except IntegrityError:
+            # another account took the number between the check above and the commit
+            db.session.rollback()
+            return jsonify({'error': 'Phone number already in use'}), 409
         except Exception as e:
+            db.session.rollback()
             # log and return error to client so frontend can show more info
             current_err = str(e)
             return jsonify({'error': 'DB update failed', 'detail': current_err}), 500
 
-    return jsonify({
-        'id': user.id,
-        'username': user.username,
-        'display_name': user.display_name,
-        'avatar_url': user.avatar_url,
-        'status': user.status,
-        'gender': user.gender,
-        'birthdate': user.birthdate.isoformat() if getattr(user, 'birthdate', None) and hasattr(user.birthdate, 'isoformat') else (user.birthdate if user.birthdate else None),
-        'phone_number': user.phone_number,
-    })
+    return jsonify(with_status(serialize_profile(user)))
 
 
 @users_bp.route('/me', methods=['GET'])
@@ -170,20 +215,10 @@ def get_me():
     payload = decode_token(token)
     if not payload or not payload.get('user_id'):
         return jsonify({'error': 'Unauthorized'}), 401
-    user = User.query.get(payload['user_id'])
-    if not user:
+    profile = profile_cache.get(payload['user_id'])
+    if not profile:
         return jsonify({'error': 'User not found'}), 404
-
-    return jsonify({
-        'id': user.id,
-        'username': user.username,
-        'display_name': user.display_name if getattr(user, 'display_name', None) else user.username,
-        'avatar_url': user.avatar_url,
-        'status': user.status,
-        'gender': getattr(user, 'gender', None),
-        'birthdate': user.birthdate.isoformat() if getattr(user, 'birthdate', None) and hasattr(user.birthdate, 'isoformat') else (user.birthdate if user.birthdate else None),
-        'phone_number': getattr(user, 'phone_number', None),
-    })
+    return jsonify(with_status(profile))
 
 
 @users_bp.route('/<int:user_id>', methods=['GET'])
@@ -202,50 +237,39 @@ def get_user_by_id(user_id):
         if payload:
             caller_id = payload.get('user_id')
 
-    user = User.query.get(user_id)
-    if not user:
+    cached = profile_cache.get(user_id)
+    if not cached:
         return jsonify({'error': 'User not found'}), 404
 
     # determine friendship status if caller authenticated
     is_friend = False
     mutuals = 0
-    try:
-        if caller_id and caller_id != user_id:
-            from models.friend_model import Friend
-            # check accepted relationship
-            rel = Friend.query.filter(((Friend.user_id == caller_id) & (Friend.friend_id == user_id)) | ((Friend.user_id == user_id) & (Friend.friend_id == caller_id)), Friend.status == 'accepted').first()
-            is_friend = bool(rel)
-            # compute mutual friends count (simple approach)
-            my_rels = Friend.query.filter(((Friend.user_id == caller_id) | (Friend.friend_id == caller_id)), Friend.status == 'accepted').all()
-            their_rels = Friend.query.filter(((Friend.user_id == user_id) | (Friend.friend_id == user_id)), Friend.status == 'accepted').all()
-            my_ids = set([r.friend_id if r.user_id == caller_id else r.user_id for r in my_rels])
-            their_ids = set([r.friend_id if r.user_id == user_id else r.user_id for r in their_rels])
-            mutuals = len(my_ids.intersection(their_ids))
-    except Exception:
-        # be resilient — if Friend model unavailable, fall back to defaults
-        is_friend = False
-        mutuals = 0
-
-    profile = {
-        'id': user.id,
-        'username': user.username,
-        'display_name': user.display_name if getattr(user, 'display_name', None) else user.username,
-        'avatar_url': user.avatar_url,
+    if caller_id and caller_id != user_id:
+        is_friend = social_graph.is_friend(caller_id, user_id)
+        mutuals = social_graph.mutuals(caller_id, [user_id])[user_id]
+
+    presence_state = presence.state(user_id)
+    profile = public_profile(cached)
+    profile.update({
         # Not yet implemented fields — return None so frontend can handle gracefully
-        'cover_url': getattr(user, 'cover_url', None) if hasattr(user, 'cover_url') else None,
-        'status_msg': getattr(user, 'status_msg', None) if hasattr(user, 'status_msg') else None,
-        'last_seen': getattr(user, 'last_seen', None).isoformat() if getattr(user, 'last_seen', None) and hasattr(user.last_seen, 'isoformat') else (getattr(user, 'last_seen', None) if getattr(user, 'last_seen', None) else None),
-        'presence': getattr(user, 'status', None),
+        'cover_url': None,
+        'status_msg': None,
+        'last_seen': presence_state['last_seen'],
+        'presence': 'online' if presence_state['online'] else 'offline',
         'is_friend': is_friend,
         'mutuals': mutuals,
-    }
+    })
 
     return jsonify(profile), 200
 
 
 @users_bp.route('/search', methods=['GET'])
 def search_users():
-    """Search users by username. Query param: q (partial match)."""
+    """Search users by username. Query param: q (partial match).
+
+    With a Bearer token every result also carries `mutuals`, the number of
+    friends shared with the caller.
+    """
     q = request.args.get('q', '').strip()
     if not q:
         return jsonify([])
@@ -255,7 +279,13 @@ def search_users():
     results = User.query.filter(
         (User.username.ilike(like)) | (getattr(User, 'display_name', User.username).ilike(like))
     ).limit(50).all()
-    return jsonify([{'id': u.id, 'username': u.username, 'display_name': (u.display_name or u.username), 'avatar_url': u.avatar_url, 'status': u.status} for u in results])
+    rows = [{'id': u.id, 'username': u.username, 'display_name': (u.display_name or u.username), 'avatar_url': u.avatar_url, 'status': u.status} for u in results]
+    caller_id = _caller_id()
+    if caller_id and rows:
+        counts = social_graph.mutuals(caller_id, [row['id'] for row in rows])
+        for row in rows:
+            row['mutuals'] = counts[row['id']]
+    return jsonify(rows)
 
 
 @users_bp.route('/suggestions', methods=['GET'])
@@ -277,15 +307,25 @@ def user_suggestions():
         users = User.query.limit(limit).all()
         return jsonify([{'id': u.id, 'username': u.username, 'avatar_url': u.avatar_url, 'status': u.status} for u in users])
 
-    # Get IDs of users to exclude: self and existing friends
-    # We'll import Friend here to avoid circular imports at top-level
-    from models.friend_model import Friend
-    rels = Friend.query.filter((Friend.user_id == uid) | (Friend.friend_id == uid)).all()
-    exclude_ids = {uid}
-    for r in rels:
-        exclude_ids.add(r.user_id)
-        exclude_ids.add(r.friend_id)
-
-    # Find users not in exclude_ids
-    suggestions = User.query.filter(~User.id.in_(list(exclude_ids))).limit(limit).all()
-    return jsonify([{'id': u.id, 'username': u.username, 'avatar_url': u.avatar_url, 'status': u.status} for u in suggestions])
+    # Precomputed ranking (services/suggestions.py); users never scored are computed once here
+    from services import suggestions
+    rows = suggestions.top_suggestions(uid, limit)
+    if not rows and not suggestions.is_scored(uid):
+        suggestions.rebuild_for_user(uid)
+        rows = suggestions.top_suggestions(uid, limit)
+    users = user_loader.load_many(r.candidate_id for r in rows)
+    result = []
+    for r in rows:
+        u = users.get(r.candidate_id)
+        if u:
+            result.append({'id': u.id, 'username': u.username, 'avatar_url': u.avatar_url, 'status': u.status,
+                           'contact_match': bool(r.contact_match)})
+    if len(result) < limit:
+        # new users without friends-of-friends still get someone to add
+        fill = suggestions.fill_candidates(uid, limit - len(result), skip={row['id'] for row in result})
+        result.extend({'id': u.id, 'username': u.username, 'avatar_url': u.avatar_url, 'status': u.status,
+                       'contact_match': False} for u in fill)
+    counts = social_graph.mutuals(uid, [row['id'] for row in result])
+    for row in result:
+        row['mutuals'] = counts[row['id']]
+    return jsonify(result)
@@ -0,0 +1,94 @@
+"""Production entry point: Flask-SocketIO on gevent (or eventlet) instead of the Werkzeug dev server.
+
+    cd server && python serve.py
+    SOCKETIO_ASYNC_MODE=eventlet python serve.py
+
+Every connection is a greenlet, so one process holds thousands of idle
+websockets instead of one OS thread each. The standard library is monkey
+patched before anything else is imported, which makes sockets, locks, queues
+and `threading` (the logging QueueListener, background tasks) cooperative.
+
+Database sessions: Flask-SQLAlchemy scopes `db.session` to the active app
+context, and app contexts live in contextvars, which greenlet gives each
+greenlet its own copy of. Flask-SocketIO pushes a fresh request context per
+event, so every socket event and HTTP request gets its own session, removed
+again on teardown. CPU-bound calls (password hashing, S3 uploads) go through
+`services.async_compat.run_blocking` to the framework's thread pool.
+
+SQLite calls block the hub too. Greenlets of this process never wait on each
+other inside SQLite: session writes are serialized by a cooperative lock
+(config.database.serialize_session_writes). Another process holding the write
+lock is still waited for in SQLite's busy handler with the hub blocked, so
+SQLITE_BUSY_TIMEOUT_MS defaults to 1000 here instead of 5000: a longer wait
+stalls every connection of the worker, a shorter one turns more contention
+into `database is locked` errors (which send_message parks in the
+dead-letter journal and replays).
+
+Env: BACKEND_HOST, BACKEND_PORT, ENABLE_NGROK like app.py, plus
+SOCKETIO_ASYNC_MODE (gevent | eventlet, default gevent), AUTO_INIT_DB
+(default false here: run `flask --app app init-db` once per deploy) and
+SQLITE_BUSY_TIMEOUT_MS (default 1000 here).
+"""
+import os
+
+ASYNC_MODE = os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent').lower()
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+else:
+    raise SystemExit(f'serve.py needs SOCKETIO_ASYNC_MODE=gevent or eventlet, not {ASYNC_MODE!r}; '
+                     'use `python app.py` for the threaded dev server')
+
+import logging  # noqa: E402
+
+# Schema work belongs to `flask --app app init-db`, not to every worker boot
+os.environ.setdefault('AUTO_INIT_DB', 'false')
+# A busy wait inside SQLite blocks the whole hub; see the module docstring
+os.environ.setdefault('SQLITE_BUSY_TIMEOUT_MS', '1000')
+
+
+def raise_open_file_limit():
+    """Lift the soft RLIMIT_NOFILE to the hard limit: each websocket holds a file descriptor."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError, OSError):
+        return None
+
+
+def main():
+    from app import app, socketio
+    from services.sqlite_maintenance import start_wal_checkpointer
+    from services.message_archive import start_message_archiver
+    from services.message_sweeper import start_recall_sweeper
+    from services.dead_letter import start_dead_letter_retrier
+
+    logger = logging.getLogger('serve')
+    port = int(os.environ.get('BACKEND_PORT', '5000'))
+    host = os.environ.get('BACKEND_HOST', '0.0.0.0')
+
+    if os.environ.get('ENABLE_NGROK', 'false').lower() == 'true':
+        try:
+            from services.network_setup import start_ngrok
+            public_url = start_ngrok(app, port=port)
+            logger.info("NGROK public URL: %s", public_url)
+        except Exception as e:
+            logger.exception("Ngrok connection failed: %s", str(e))
+
+    start_wal_checkpointer(app, socketio)
+    start_message_archiver(app, socketio)
+    start_recall_sweeper(app, socketio)
+    start_dead_letter_retrier(app, socketio)
+    nofile = raise_open_file_limit()
+    logger.info('Serving on %s:%s with async_mode=%s (open file limit %s)', host, port, socketio.async_mode, nofile)
+    socketio.run(app, host=host, port=port, debug=False, log_output=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Helpers that keep blocking work off the event loop under eventlet/gevent.
+
+Under the production entry point (serve.py) every socket connection and
+request is a greenlet on a single hub. Network I/O is cooperative after monkey
+patching, but CPU-bound C calls (password hashing) and libraries that block
+outside the patched socket layer stall every connected client until they
+return. `run_blocking` hands such calls to the async framework's native
+thread pool; under the threaded dev server it simply calls the function.
+
+`configure(socketio.async_mode)` is called once from app.py.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+_async_mode = 'threading'
+
+
+def configure(async_mode):
+    global _async_mode
+    _async_mode = async_mode or 'threading'
+    logger.debug('async mode: %s', _async_mode)
+
+
+def async_mode():
+    return _async_mode
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Run `fn(*args, **kwargs)` in a worker thread when on a greenlet hub and return its result."""
+    if _async_mode == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args, kwargs)
+    if _async_mode == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
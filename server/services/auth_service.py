@@ -4,21 +4,25 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
 from flask import current_app
+from services.async_compat import run_blocking
 
 blacklist = set()
 
 def register_user(username, password, display_name=None):
     if User.query.filter_by(username=username).first():
         return {'success': False, 'error': 'Username already exists'}
-    password_hash = generate_password_hash(password)
+    # hashing is deliberately slow CPU work; keep it off the greenlet hub
+    password_hash = run_blocking(generate_password_hash, password)
     user = User(username=username, password_hash=password_hash, display_name=(display_name or username))
     db.session.add(user)
     db.session.commit()
+    from services.profile_cache import profile_cache, serialize_profile
+    profile_cache.put(serialize_profile(user))
     return {'success': True, 'message': 'User registered'}
 
 def login_user(username, password):
     user = User.query.filter_by(username=username).first()
-    if not user or not check_password_hash(user.password_hash, password):
+    if not user or not run_blocking(check_password_hash, user.password_hash, password):
         return {'success': False, 'error': 'Invalid credentials'}
     payload = {
         'user_id': user.id,
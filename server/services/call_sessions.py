@@ -0,0 +1,232 @@
+"""In-memory registry of WebRTC call sessions for targeted signaling.
+
+A call has an initiator, the users still being rung (`invited`) and the
+users in the call (`participants`, each bound to the socket that joined).
+`signal` frames (offers, answers, ICE candidates) are routed only to the
+other participants of the sender's call, so relaying costs
+O(participants) instead of a broadcast to every connected socket.
+
+A call ends when fewer than two people are left in it or being rung, e.g.
+the callee rejects a 1:1 call, the last peer hangs up, or nobody answered
+within CALL_RING_TIMEOUT_SECONDS. Sockets that disconnect leave their calls
+(see `drop_sid`). Calls live in process memory, like the presence
+registry, so every side of a call must reach the same server process.
+"""
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class CallError(Exception):
+    """A call request that cannot be honoured; `code` goes back to the client."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+class CallSession:
+    __slots__ = ('id', 'initiator', 'group_id', 'invited', 'participants', 'created')
+
+    def __init__(self, initiator, sid, invited, group_id, ring_deadline):
+        self.id = uuid.uuid4().hex
+        self.initiator = initiator
+        self.group_id = group_id
+        self.invited = {uid: ring_deadline for uid in invited}  # user_id -> monotonic ring deadline
+        self.participants = {initiator: sid}  # user_id -> sid in the call
+        self.created = time.monotonic()
+
+    @property
+    def ended(self):
+        return not self.participants or len(self.participants) + len(self.invited) < 2
+
+    def to_dict(self):
+        return {
+            'call_id': self.id,
+            'initiator': self.initiator,
+            'group_id': self.group_id,
+            'participants': sorted(self.participants),
+            'invited': sorted(self.invited),
+        }
+
+
+class CallRegistry:
+    def __init__(self, ring_timeout=45.0, max_participants=16):
+        self.ring_timeout = ring_timeout
+        self.max_participants = max_participants
+        self._lock = threading.Lock()
+        self._calls = {}      # call_id -> CallSession
+        self._sid_calls = {}  # sid -> call_ids it participates in
+        self._sweeper = None
+        self.started = 0
+
+    def init_app(self, config):
+        self.ring_timeout = max(1.0, float(config.get('CALL_RING_TIMEOUT_SECONDS', 45)))
+        self.max_participants = max(2, int(config.get('CALL_MAX_PARTICIPANTS', 16)))
+
+    def _session(self, call_id):
+        call = self._calls.get(call_id)
+        if call is None:
+            raise CallError('unknown_call')
+        return call
+
+    def _end(self, call):
+        self._calls.pop(call.id, None)
+        for sid in call.participants.values():
+            ids = self._sid_calls.get(sid)
+            if ids is not None:
+                ids.discard(call.id)
+                if not ids:
+                    del self._sid_calls[sid]
+
+    def _remove_participant(self, call, user_id):
+        sid = call.participants.pop(user_id, None)
+        ids = self._sid_calls.get(sid)
+        if ids is not None:
+            ids.discard(call.id)
+            if not ids:
+                del self._sid_calls[sid]
+
+    def start(self, caller_id, sid, invitees, group_id=None):
+        """Open a call from `caller_id` (on socket `sid`) ringing `invitees`. Returns the session."""
+        invitees = [uid for uid in dict.fromkeys(invitees) if uid != caller_id]
+        if not invitees:
+            raise CallError('no_invitees')
+        if len(invitees) + 1 > self.max_participants:
+            raise CallError('too_many_participants')
+        with self._lock:
+            if self._sid_calls.get(sid):
+                raise CallError('busy')
+            call = CallSession(caller_id, sid, invitees, group_id, time.monotonic() + self.ring_timeout)
+            self._calls[call.id] = call
+            self._sid_calls.setdefault(sid, set()).add(call.id)
+            self.started += 1
+            return call
+
+    def accept(self, call_id, user_id, sid):
+        """Move a rung user into the call on socket `sid`. Returns the session."""
+        with self._lock:
+            call = self._session(call_id)
+            if user_id not in call.invited:
+                raise CallError('not_invited')
+            if self._sid_calls.get(sid):
+                raise CallError('busy')
+            del call.invited[user_id]
+            call.participants[user_id] = sid
+            self._sid_calls.setdefault(sid, set()).add(call.id)
+            return call
+
+    def reject(self, call_id, user_id):
+        """Stop ringing `user_id`. Returns (session, ended)."""
+        with self._lock:
+            call = self._session(call_id)
+            if call.invited.pop(user_id, None) is None:
+                raise CallError('not_invited')
+            ended = call.ended
+            if ended:
+                self._end(call)
+            return call, ended
+
+    def leave(self, call_id, user_id):
+        """Take `user_id` out of the call. Returns (session, ended)."""
+        with self._lock:
+            call = self._session(call_id)
+            if user_id not in call.participants:
+                raise CallError('not_in_call')
+            self._remove_participant(call, user_id)
+            ended = call.ended
+            if ended:
+                self._end(call)
+            return call, ended
+
+    def drop_sid(self, sid):
+        """A socket went away: leave its calls. Returns [(session, user_id, ended)]."""
+        with self._lock:
+            left = []
+            for call_id in list(self._sid_calls.get(sid, ())):
+                call = self._calls.get(call_id)
+                if call is None:
+                    continue
+                user_id = next((uid for uid, s in call.participants.items() if s == sid), None)
+                self._remove_participant(call, user_id)
+                ended = call.ended
+                if ended:
+                    self._end(call)
+                left.append((call, user_id, ended))
+            self._sid_calls.pop(sid, None)
+            return left
+
+    def expire_ringing(self, now=None):
+        """Stop ringing users past their deadline. Returns [(session, timed_out_user_ids, ended)]."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expired = []
+            for call in list(self._calls.values()):
+                late = [uid for uid, deadline in call.invited.items() if deadline <= now]
+                if not late:
+                    continue
+                for uid in late:
+                    del call.invited[uid]
+                ended = call.ended
+                if ended:
+                    self._end(call)
+                expired.append((call, late, ended))
+            return expired
+
+    def signal_rooms(self, call_id, user_id, to=None):
+        """Rooms a `signal` frame from `user_id` goes to: the other participants' sids, or only `to`.
+
+        A frame addressed to a user who is still being rung goes to their
+        `user-<id>` room, so an offer can be sent before the answer.
+        """
+        with self._lock:
+            call = self._session(call_id)
+            if user_id not in call.participants:
+                raise CallError('not_in_call')
+            if to is None:
+                return [sid for uid, sid in call.participants.items() if uid != user_id]
+            if to in call.participants and to != user_id:
+                return [call.participants[to]]
+            if to in call.invited:
+                return [f'user-{to}']
+            raise CallError('unknown_peer')
+
+    def participant_sids(self, call, exclude=None):
+        with self._lock:
+            return [sid for uid, sid in call.participants.items() if uid != exclude]
+
+    def count(self):
+        with self._lock:
+            return len(self._calls)
+
+    def in_call(self):
+        with self._lock:
+            return sum(len(c.participants) for c in self._calls.values())
+
+    def start_sweeper(self, socketio, on_expired):
+        """Start the ring timeout loop once; `on_expired(results)` gets `expire_ringing()` results."""
+        with self._lock:
+            if self._sweeper is not None:
+                return self._sweeper
+            self._sweeper = True
+        tick = min(5.0, max(0.5, self.ring_timeout / 5.0))
+
+        def _loop():
+            while True:
+                socketio.sleep(tick)
+                expired = self.expire_ringing()
+                if not expired:
+                    continue
+                try:
+                    on_expired(expired)
+                except Exception:
+                    logger.exception('[CALLS] ring timeout notification failed for %s calls', len(expired))
+
+        self._sweeper = socketio.start_background_task(_loop)
+        return self._sweeper
+
+
+call_registry = CallRegistry()
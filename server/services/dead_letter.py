@@ -0,0 +1,392 @@
+"""Dead-letter journal for chat messages whose insert failed.
+
+When `send_message` cannot commit because the database is busy (`database is
+locked` and other `OperationalError`s), the message is not dropped: the
+handler appends it to an in-memory buffer and returns right away. The
+retrier task then:
+
+- writes buffered entries to DEAD_LETTER_PATH as compact JSON lines and
+  fsyncs once per batch (group commit); only then does the sender get a
+  `message_sent_ack` with `status: 'queued'`
+- replays the oldest journaled entries every DEAD_LETTER_RETRY_SECONDS,
+  backing off up to 16x while the database keeps failing; a replayed message
+  gets its real id, the late `message_sent_ack` (`status: 'sent'`,
+  `late: true`) in the sender's `user-<id>` room and the usual
+  `receive_message` for the receiver; blocks are checked again first, and a
+  message between users that blocked each other meanwhile is closed with a
+  `status: 'blocked'` ACK instead
+
+The journal is append-only: a replayed entry is closed by a `{"d": id}`
+marker line, and the file is truncated once nothing is left open (and
+compacted on start). It is capped at DEAD_LETTER_MAX_BYTES; when full, or
+when the retrier is not running, the sender gets `status: 'error'` as
+before. Replays are idempotent: an entry whose row already exists (crash
+between the commit and the marker) only gets its ACK.
+
+Only the retrier touches the file; importing the app (`flask init-db`,
+scripts) does no journal I/O. Each journal belongs to one process, which
+holds an exclusive `flock` on `<journal>.lock` while it runs: the first
+worker takes DEAD_LETTER_PATH (default `<DB_PATH without .db>.dead_letter.jsonl`,
+so benchmark databases get their own), later workers take
+`<journal>.<pid>`. On start a worker also adopts the open entries of any
+`<journal>.<pid>` whose owner is gone, so nothing is compacted, truncated or
+replayed by two processes.
+
+Started from the server entry point via `start_dead_letter_retrier(app, socketio)`.
+"""
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process, no locking
+    fcntl = None
+
+from config.database import db
+from models.block_model import Block
+from models.message_model import Message
+from services.presence import as_user_id
+
+logger = logging.getLogger(__name__)
+
+# retry delay ceiling, as a multiple of DEAD_LETTER_RETRY_SECONDS
+MAX_BACKOFF = 16
+# short keys keep the journal compact
+FIELDS = {'s': 'sender_id', 'r': 'receiver_id', 'c': 'content', 'm': 'client_message_id',
+          'p': 'reply_to_id', 'f': 'forward_from_id'}
+
+
+def _default_path(db_path=None):
+    if db_path:
+        return f'{os.path.splitext(db_path)[0]}.dead_letter.jsonl'
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'storage', 'chatapp.dead_letter.jsonl'))
+
+
+def _lock(path):
+    """Exclusive, non-blocking lock on `<path>.lock`: the open fd, or None when another process holds it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(f'{path}.lock', os.O_CREAT | os.O_RDWR, 0o644)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _read_open(path, pending):
+    """Add the entries of `path` that have no `done` marker to `pending`."""
+    try:
+        with open(path, 'rb') as fh:
+            for raw in fh:
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    continue  # torn last line of a crash mid-write
+                if 'd' in record:
+                    pending.pop(record['d'], None)
+                elif 'i' in record:
+                    pending[record['i']] = record
+    except FileNotFoundError:
+        pass
+
+
+def _line(record):
+    return (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def message_data(msg, reply_to_id=None, forward_from_id=None):
+    """`receive_message` payload of a saved 1:1 message."""
+    return {
+        'id': msg.id,
+        'sender_id': msg.sender_id,
+        'receiver_id': msg.receiver_id,
+        'content': msg.content,
+        'timestamp': msg.timestamp.isoformat(),
+        'status': 'sent',
+        'reply_to_id': reply_to_id,
+        'forward_from_id': forward_from_id,
+    }
+
+
+class DeadLetterJournal:
+    def __init__(self, path=None, max_bytes=16 * 1024 * 1024, flush_window=0.05):
+        self.path = path or _default_path()
+        self.max_bytes = max_bytes
+        self.flush_window = flush_window
+        self.running = False
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._buffer = []              # (record, line, sid) not on disk yet
+        self._markers = []             # `done` lines not on disk yet
+        self._pending = OrderedDict()  # id -> record, on disk and not replayed
+        self._size = 0                 # bytes on disk plus buffered
+        self.stats = {'journaled': 0, 'replayed': 0, 'dropped': 0, 'rejected': 0, 'blocked': 0}
+        self._lock_fd = None
+
+    def init_app(self, config):
+        """Read the settings only; the file is opened by `open()` in the retrier's process."""
+        self.path = config.get('DEAD_LETTER_PATH') or _default_path(config.get('DB_PATH'))
+        self.max_bytes = max(64 * 1024, int(config.get('DEAD_LETTER_MAX_BYTES', 16 * 1024 * 1024)))
+        self.flush_window = max(0, int(config.get('DEAD_LETTER_FLUSH_MS', 50))) / 1000.0
+
+    def open(self):
+        """Lock a journal for this process, load it plus orphaned worker journals, compact. Returns the path."""
+        if self._lock_fd is not None:
+            return self.path
+        shared = self.path
+        fd = _lock(shared)
+        if fd is None:
+            # another worker owns the shared journal
+            self.path = f'{shared}.{os.getpid()}'
+            fd = _lock(self.path)
+            if fd is None:
+                raise OSError(f'dead-letter journal {self.path} is locked by another process')
+        self._lock_fd = fd
+        # worker journals whose process is gone (their lock is free); the shared one is read by its owner only
+        orphans = []
+        for other in glob.glob(f'{glob.escape(shared)}.*'):
+            if other != self.path and re.fullmatch(r'\.\d+', other[len(shared):]):
+                other_fd = _lock(other)
+                if other_fd is not None:
+                    orphans.append((other, other_fd))
+        self._load([path for path, _fd in orphans])
+        for other, other_fd in orphans:
+            for leftover in (other, f'{other}.lock'):
+                try:
+                    os.remove(leftover)
+                except FileNotFoundError:
+                    pass
+            os.close(other_fd)
+        return self.path
+
+    def _load(self, orphans=()):
+        """Read open entries of our journal and of `orphans`, and rewrite our file with only those."""
+        pending = OrderedDict()
+        for path in [self.path, *orphans]:
+            _read_open(path, pending)
+        data = b''.join(_line(r) for r in pending.values())
+        with self._io_lock, self._lock:
+            self._pending = pending
+            self._size = len(data)
+            if pending or os.path.exists(self.path):
+                tmp = f'{self.path}.tmp'
+                with open(tmp, 'wb') as fh:
+                    fh.write(data)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                os.replace(tmp, self.path)
+        if pending:
+            logger.warning('[DEAD_LETTER] %s undelivered messages in %s', len(pending), self.path)
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending) + len(self._buffer)
+
+    def append(self, sid=None, **fields):
+        """Buffer a failed message for the journal. Returns its entry id, or None when it cannot be kept."""
+        record = {'i': uuid.uuid4().hex, 't': datetime.utcnow().isoformat()}
+        record.update((short, fields[name]) for short, name in FIELDS.items() if fields.get(name) is not None)
+        line = _line(record)
+        with self._lock:
+            if not self.running or self._size + len(line) > self.max_bytes:
+                self.stats['rejected'] += 1
+                return None
+            self._buffer.append((record, line, sid))
+            self._size += len(line)
+            self.stats['journaled'] += 1
+        self._wake.set()
+        return record['i']
+
+    def wait(self, timeout):
+        self._wake.wait(timeout)
+        self._wake.clear()
+
+    def flush(self):
+        """Write and fsync everything buffered in one go. Returns [(record, sid)] now on disk."""
+        with self._io_lock:
+            with self._lock:
+                buffer, self._buffer = self._buffer, []
+                markers, self._markers = self._markers, []
+            if not buffer and not markers:
+                return []
+            try:
+                with open(self.path, 'ab') as fh:
+                    fh.write(b''.join([line for _r, line, _sid in buffer] + markers))
+                    fh.flush()
+                    os.fsync(fh.fileno())
+            except OSError:
+                logger.exception('[DEAD_LETTER] could not write %s; retrying', self.path)
+                with self._lock:
+                    self._buffer[:0] = buffer
+                    self._markers[:0] = markers
+                return []
+            with self._lock:
+                for record, _l, _s in buffer:
+                    self._pending[record['i']] = record
+                if not self._pending and not self._buffer and not self._markers:
+                    # every entry was replayed: start the file over
+                    with open(self.path, 'wb'):
+                        pass
+                    self._size = 0
+        return [(record, sid) for record, _l, sid in buffer]
+
+    def _close(self, ids):
+        with self._lock:
+            for entry_id in ids:
+                if self._pending.pop(entry_id, None) is not None:
+                    line = _line({'d': entry_id})
+                    self._markers.append(line)
+                    self._size += len(line)
+        self._wake.set()
+
+    def _insert(self, record):
+        """The message row of a journal entry, reusing the row a previous replay already committed."""
+        fields = {name: record.get(short) for short, name in FIELDS.items()}
+        timestamp = datetime.fromisoformat(record['t'])
+        msg = Message.query.filter_by(sender_id=fields['sender_id'], receiver_id=fields['receiver_id'],
+                                      timestamp=timestamp, content=fields['content']).first()
+        if msg is None:
+            msg = Message(sender_id=fields['sender_id'], receiver_id=fields['receiver_id'],
+                          content=fields['content'], timestamp=timestamp)
+            db.session.add(msg)
+        return msg
+
+    @staticmethod
+    def _blocked(batch):
+        """Entries whose sender and receiver block each other (either direction) by now."""
+        ids = {r['i']: (as_user_id(r.get('s')), as_user_id(r.get('r'))) for r in batch}
+        users = {uid for pair in ids.values() for uid in pair if isinstance(uid, int)}
+        if not users:
+            return []
+        pairs = set(db.session.query(Block.user_id, Block.target_id).filter(
+            Block.user_id.in_(users), Block.target_id.in_(users)))
+        return [r for r in batch if ids[r['i']] in pairs or ids[r['i']][::-1] in pairs]
+
+    def replay(self, app, socketio, batch_size=200):
+        """Insert up to `batch_size` journaled messages and deliver their late ACKs.
+
+        Returns the number replayed or closed as blocked; raises OperationalError while the database still fails.
+        """
+        with self._lock:
+            batch = list(self._pending.values())[:batch_size]
+        if not batch:
+            return 0
+        saved, dropped = [], []
+        with app.app_context():
+            blocked = self._blocked(batch)
+            batch = [r for r in batch if r not in blocked]
+            try:
+                rows = [self._insert(r) for r in batch]
+                db.session.commit()
+                saved = list(zip(batch, rows))
+            except OperationalError:
+                db.session.rollback()
+                raise
+            except Exception:
+                # a bad entry spoils the batch: go one by one and drop what cannot be inserted
+                db.session.rollback()
+                for record in batch:
+                    try:
+                        msg = self._insert(record)
+                        db.session.commit()
+                        saved.append((record, msg))
+                    except OperationalError:
+                        db.session.rollback()
+                        raise
+                    except Exception:
+                        db.session.rollback()
+                        logger.exception('[DEAD_LETTER] dropping entry %s', record['i'])
+                        dropped.append(record)
+            payloads = [(record, msg.id, message_data(msg, record.get('p'), record.get('f')))
+                        for record, msg in saved]
+        self._close([r['i'] for r in blocked + dropped] + [r['i'] for r, _msg in saved])
+        with self._lock:
+            self.stats['replayed'] += len(saved)
+            self.stats['dropped'] += len(dropped)
+            self.stats['blocked'] += len(blocked)
+        for record in blocked:
+            if record.get('m'):
+                socketio.emit('message_sent_ack', {'client_message_id': record['m'], 'status': 'blocked'},
+                              room=f"user-{record['s']}")
+        for record in dropped:
+            if record.get('m'):
+                socketio.emit('message_sent_ack', {'client_message_id': record['m'], 'status': 'error'},
+                              room=f"user-{record['s']}")
+        for record, message_id, data in payloads:
+            if record.get('m'):
+                socketio.emit('message_sent_ack', {'client_message_id': record['m'], 'message_id': message_id,
+                                                   'status': 'sent', 'late': True}, room=f"user-{record['s']}")
+            socketio.emit('receive_message', data, room=f"user-{record['r']}")
+        if saved:
+            logger.info('[DEAD_LETTER] replayed %s messages (%s still queued)', len(saved), self.pending)
+        if blocked:
+            logger.info('[DEAD_LETTER] closed %s messages between users that blocked each other', len(blocked))
+        return len(saved) + len(blocked)
+
+
+dead_letters = DeadLetterJournal()
+
+
+def start_dead_letter_retrier(app, socketio):
+    """Flush the journal and replay it as a SocketIO background task."""
+    retry = max(0.1, float(app.config.get('DEAD_LETTER_RETRY_SECONDS', 2)))
+    batch_size = int(app.config.get('DEAD_LETTER_BATCH_SIZE', 200))
+    journal = dead_letters
+    try:
+        journal.open()
+    except OSError:
+        logger.exception('[DEAD_LETTER] no journal for this process; failed sends get status error')
+        return None
+    journal.running = True
+
+    def _loop():
+        delay = retry
+        next_retry = time.monotonic()
+        while True:
+            journal.wait(max(0.0, next_retry - time.monotonic()) if journal.pending else 60)
+            if journal.flush_window:
+                socketio.sleep(journal.flush_window)  # let a burst of failures share one fsync
+            for record, sid in journal.flush():
+                if sid and record.get('m'):
+                    socketio.emit('message_sent_ack', {'client_message_id': record['m'], 'status': 'queued'},
+                                  room=sid)
+            if not journal.pending or time.monotonic() < next_retry:
+                continue
+            try:
+                replayed = journal.replay(app, socketio, batch_size)
+                delay = retry
+                # a full batch means more is waiting: keep draining while the database keeps up
+                next_retry = time.monotonic() + (0 if replayed >= batch_size else delay)
+                continue
+            except OperationalError as e:
+                delay = min(delay * 2, retry * MAX_BACKOFF)
+                logger.warning('[DEAD_LETTER] database still failing (%s); next retry in %.1fs', e.orig, delay)
+            except Exception:
+                logger.exception('[DEAD_LETTER] replay failed')
+            next_retry = time.monotonic() + delay
+
+    try:
+        from services.metrics import registry
+        registry.counter('chat_dead_letter_messages_total', 'Messages through the dead-letter journal.', ('outcome',),
+                         callback=lambda: dict(journal.stats))
+        registry.gauge('chat_dead_letter_pending', 'Journaled messages not replayed yet.', callback=lambda: journal.pending)
+    except Exception:
+        logger.debug('metrics unavailable; dead-letter gauges not registered')
+
+    logger.info('[DEAD_LETTER] retrier every %ss, journal %s', retry, journal.path)
+    return socketio.start_background_task(_loop)
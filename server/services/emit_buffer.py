@@ -0,0 +1,128 @@
+"""Coalesce socket emits per room into one `batch` frame per short window.
+
+A single action often fans out several events to the same rooms (presence
+to every friend room, profile updates, reactions). Under reconnect storms
+that becomes thousands of tiny frames. `emit_buffer.emit(...)` queues the
+event for its room instead; after EMIT_BATCH_WINDOW_MS every room with
+pending events is flushed:
+
+- clients that joined with `capabilities: ['batch']` receive one
+  `batch` frame: `{'events': [{'event': name, 'data': payload}, ...]}`
+- all other sids in the room receive the original events one by one
+
+A room with a single pending event is flushed as that plain event to
+everyone. Passing `key=` replaces an earlier pending event with the same
+key in that room (e.g. the same user flapping online/offline), so only the
+latest state is sent.
+
+Room membership is read from the in-process Socket.IO manager, which is
+what this server runs with (no message queue).
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+BATCH_EVENT = 'batch'
+BATCH_CAPABILITY = 'batch'
+
+try:
+    from services.metrics import registry
+    _buffered_total = registry.counter('chat_emit_buffered_total', 'Emits queued in the emit buffer.', ('outcome',))
+    _frames_total = registry.counter('chat_emit_buffer_frames_total', 'Frames sent when flushing the emit buffer.', ('kind',))
+except Exception:  # metrics are optional
+    _buffered_total = _frames_total = None
+
+
+def _count(metric, label):
+    if metric is not None:
+        metric.inc(label)
+
+
+class EmitBuffer:
+    def __init__(self):
+        self.socketio = None
+        self.window = 0.02
+        self._lock = threading.Lock()
+        # room -> OrderedDict(key -> (event, data)); keyless events get a unique key
+        self._pending = {}
+        self._seq = 0
+        self._flush_scheduled = False
+        self._capable = set()
+
+    def init_app(self, socketio, config):
+        """Bind to the SocketIO server. The first binding wins (app.py may be imported twice)."""
+        if self.socketio is not None:
+            return
+        self.socketio = socketio
+        self.window = max(0, int(config.get('EMIT_BATCH_WINDOW_MS', 20))) / 1000.0
+
+    def set_capabilities(self, sid, capabilities):
+        """Record what `sid` declared; callers only pass an explicit `capabilities` list."""
+        if isinstance(capabilities, (list, tuple, set)) and BATCH_CAPABILITY in capabilities:
+            self._capable.add(sid)
+        else:
+            self._capable.discard(sid)
+
+    def forget(self, sid):
+        self._capable.discard(sid)
+
+    def emit(self, event, data, room, key=None):
+        """Queue `event` for `room` (sent right away when batching is off or for broadcasts)."""
+        if self.socketio is None:
+            raise RuntimeError('emit_buffer is not bound; call emit_buffer.init_app() first')
+        if self.window <= 0 or room is None:
+            _count(_buffered_total, 'direct')
+            self.socketio.emit(event, data, room=room)
+            return
+        with self._lock:
+            events = self._pending.setdefault(room, OrderedDict())
+            if key is None:
+                self._seq += 1
+                key = ('_seq', self._seq)
+            elif key in events:
+                del events[key]  # re-append so the latest state keeps its place at the end
+                _count(_buffered_total, 'coalesced')
+            events[key] = (event, data)
+            _count(_buffered_total, 'queued')
+            schedule = not self._flush_scheduled
+            self._flush_scheduled = True
+        if schedule:
+            self.socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        self.socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flush_scheduled = False
+        for room, events in pending.items():
+            try:
+                self._flush_room(room, list(events.values()))
+            except Exception:
+                logger.exception('[EMIT_BUFFER] flush failed for room %s', room)
+
+    def _flush_room(self, room, events):
+        sio = self.socketio
+        if len(events) == 1:
+            event, data = events[0]
+            sio.emit(event, data, room=room)
+            _count(_frames_total, 'single')
+            return
+        sids = [sid for sid, _eio_sid in sio.server.manager.get_participants('/', room)]
+        capable = [sid for sid in sids if sid in self._capable]
+        legacy = [sid for sid in sids if sid not in self._capable]
+        if capable:
+            frame = {'events': [{'event': event, 'data': data} for event, data in events]}
+            sio.emit(BATCH_EVENT, frame, room=room, skip_sid=legacy or None)
+            _count(_frames_total, 'batch')
+        if legacy:
+            for event, data in events:
+                sio.emit(event, data, room=room, skip_sid=capable or None)
+                _count(_frames_total, 'single')
+
+
+emit_buffer = EmitBuffer()
@@ -0,0 +1,312 @@
+"""Monthly archive partitions for the `message` table.
+
+Messages older than MESSAGE_ARCHIVE_AFTER_DAYS are moved by a background job
+from the hot `message` table into per-month tables `message_archive_YYYYMM`
+(same columns, same ids) in the same SQLite file. The hot table and its
+indexes stay small; archived months are only touched when a client pages that
+far back.
+
+Reads go through `page_messages()`, which walks the hot table first and then
+the archive tables newest-first, merging by id, so callers page with an id
+cursor (`before_id`) without knowing where a row lives. Edits and recalls
+reach archived rows through `update_message()`.
+
+Two small tables, written in the same transaction as the rows the archiver
+moves, keep readers off the partitions themselves:
+
+- `message_archive_partition` lists each partition with its id range; it is
+  read on every lookup, so partitions created by another worker process are
+  visible as soon as they commit
+- `message_archive_head` holds the newest archived message of every
+  conversation per participant, so the conversation list finds conversations
+  that went quiet without a GROUP BY over the archive
+
+The row with the highest id is never archived: `message.id` is a plain
+INTEGER PRIMARY KEY, and SQLite hands out max(rowid) + 1, so moving the max
+row would let a new message reuse an id that already exists in an archive.
+"""
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Index, MetaData, Table, bindparam, func, inspect, or_, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config.database import db
+from models.message_archive_model import ArchiveHead, ArchivePartition
+from models.message_model import Message
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = 'message_archive_'
+_ARCHIVE_RE = re.compile(r'^message_archive_(\d{6})$')
+
+_metadata = MetaData()
+_lock = threading.Lock()
+
+# last run of the archiver, read by the metrics gauges
+archive_state = {'runs': 0, 'moved': 0, 'last_moved': 0}
+
+
+def archive_table_name(ts):
+    return f'{ARCHIVE_PREFIX}{ts:%Y%m}'
+
+
+def _archive_table(name):
+    """Table object for an archive partition, built from the Message columns (no FKs)."""
+    with _lock:
+        if name in _metadata.tables:
+            return _metadata.tables[name]
+        columns = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+                   for c in Message.__table__.columns]
+        return Table(
+            name, _metadata, *columns,
+            Index(f'ix_{name}_pair', 'sender_id', 'receiver_id'),
+            Index(f'ix_{name}_receiver', 'receiver_id'),
+            Index(f'ix_{name}_recalled_at', 'recalled_at'),
+        )
+
+
+def ensure_archive_table(conn, name):
+    """Create the partition if missing and add columns and indexes the Message model gained since."""
+    table = _archive_table(name)
+    table.create(conn, checkfirst=True)
+    existing = {c['name'] for c in inspect(conn).get_columns(name)}
+    for col in table.columns:
+        if col.name not in existing:
+            conn.execute(text(f'ALTER TABLE "{name}" ADD COLUMN "{col.name}" {col.type.compile(conn.dialect)}'))
+            logger.info('[ARCHIVE] added column %s to %s', col.name, name)
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+    return table
+
+
+def _record_partition(conn, name, table):
+    """Store the partition's current id range in the catalog."""
+    lo, hi = conn.execute(select(func.min(table.c.id), func.max(table.c.id))).one()
+    catalog = ArchivePartition.__table__
+    if hi is None:
+        conn.execute(catalog.delete().where(catalog.c.name == name))
+        return
+    stmt = sqlite_insert(catalog).values(name=name, min_id=lo, max_id=hi)
+    conn.execute(stmt.on_conflict_do_update(index_elements=['name'], set_={'min_id': lo, 'max_id': hi}))
+
+
+def _record_heads(conn, name, table, ids=None):
+    """Raise the per-conversation heads to the newest rows of `table` (only `ids` when given)."""
+    t = table.c
+    stmt = select(t.sender_id, t.receiver_id, t.group_id, func.max(t.id)).group_by(t.sender_id, t.receiver_id, t.group_id)
+    if ids is not None:
+        stmt = stmt.where(t.id.in_(bindparam('ids', expanding=True)))
+    heads = {}
+    for sender, receiver, group, newest in conn.execute(stmt, {'ids': ids} if ids is not None else {}):
+        # groups get negative keys so they never collide with user ids
+        for key in ([(sender, -group), (receiver, -group)] if group else [(sender, receiver), (receiver, sender)]):
+            if heads.get(key, 0) < newest:
+                heads[key] = newest
+    if not heads:
+        return
+    ins = sqlite_insert(ArchiveHead.__table__)
+    conn.execute(ins.on_conflict_do_update(
+        index_elements=['user_id', 'peer'],
+        set_={'message_id': ins.excluded.message_id, 'table_name': ins.excluded.table_name},
+        where=ins.excluded.message_id > ArchiveHead.__table__.c.message_id,
+    ), [{'user_id': u, 'peer': p, 'message_id': m, 'table_name': name} for (u, p), m in heads.items()])
+
+
+def _partition_names(conn):
+    names = [r[0] for r in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'message_archive_%'"))]
+    return [n for n in names if _ARCHIVE_RE.match(n)]
+
+
+def upgrade_partitions(conn):
+    """Bring every partition up to the current Message columns and fill the catalog and heads.
+
+    Called by schema.upgrade_schema; heads are backfilled once, when the catalog is still empty.
+    """
+    backfill = conn.execute(select(func.count()).select_from(ArchivePartition.__table__)).scalar() == 0
+    for name in _partition_names(conn):
+        table = ensure_archive_table(conn, name)
+        _record_partition(conn, name, table)
+        if backfill:
+            _record_heads(conn, name, table)
+
+
+def list_partitions():
+    """Archive partitions as (Table, min_id, max_id), newest ids first. Needs an app context."""
+    rows = db.session.execute(select(ArchivePartition.name, ArchivePartition.min_id, ArchivePartition.max_id)
+                              .order_by(ArchivePartition.max_id.desc())).all()
+    return [(_archive_table(name), lo, hi) for name, lo, hi in rows]
+
+
+def message_tables():
+    """The hot table followed by every archive partition, for work that must see all messages."""
+    return [Message.__table__] + [table for table, _lo, _hi in list_partitions()]
+
+
+def page_messages(where, limit=None, before_id=None):
+    """Messages matching `where(table)` across hot and archive tables, newest id first.
+
+    `where` receives a table (Message.__table__ or a partition) and returns a
+    clause. With `limit` it stops visiting older partitions as soon as no
+    remaining one can contribute a row to the page.
+    """
+    def fetch(table):
+        stmt = select(table).where(where(table))
+        if before_id is not None:
+            stmt = stmt.where(table.c.id < before_id)
+        stmt = stmt.order_by(table.c.id.desc())
+        if limit:
+            stmt = stmt.limit(limit)
+        return db.session.execute(stmt).all()
+
+    rows = fetch(Message.__table__)
+    for table, lo, hi in list_partitions():
+        if before_id is not None and lo >= before_id:
+            continue
+        if limit and len(rows) >= limit and hi < rows[limit - 1].id:
+            break
+        rows.extend(fetch(table))
+        rows.sort(key=lambda r: r.id, reverse=True)
+        if limit:
+            del rows[limit:]
+    return rows
+
+
+def conversation_pair(a, b):
+    """`where` callback for the two directions of a 1:1 conversation."""
+    def where(t):
+        return or_((t.c.sender_id == a) & (t.c.receiver_id == b),
+                   (t.c.sender_id == b) & (t.c.receiver_id == a))
+    return where
+
+
+def find_message(message_id):
+    """Hot Message or archived row for an id, or None. Change either through `update_message`."""
+    msg = db.session.get(Message, message_id)
+    if msg is not None:
+        return msg
+    for table, lo, hi in list_partitions():
+        if lo <= int(message_id) <= hi:
+            row = db.session.execute(select(table).where(table.c.id == message_id)).first()
+            if row is not None:
+                return row
+    return None
+
+
+def update_message(msg, **values):
+    """Apply `values` to a message from `find_message()` and return it as updated; the caller commits.
+
+    A hot Message is changed in the session; an archived row is updated in its partition.
+    """
+    if isinstance(msg, Message):
+        for key, value in values.items():
+            setattr(msg, key, value)
+        return msg
+    for table, lo, hi in list_partitions():
+        if lo <= msg.id <= hi:
+            db.session.execute(table.update().where(table.c.id == msg.id).values(**values))
+            return db.session.execute(select(table).where(table.c.id == msg.id)).first()
+    return None
+
+
+def latest_per_peer(uid, skip_keys=()):
+    """Newest archived message per conversation of `uid` that is not in `skip_keys`.
+
+    Keys are ('group', group_id) or ('user', other_user_id), like the
+    conversation list. Used to keep conversations that went quiet visible
+    after their messages were archived; reads `message_archive_head` and only
+    the head rows themselves.
+    """
+    skip = set(skip_keys)
+    wanted = {}
+    for peer, message_id, name in db.session.execute(
+            select(ArchiveHead.peer, ArchiveHead.message_id, ArchiveHead.table_name)
+            .where(ArchiveHead.user_id == uid)):
+        key = ('group', -peer) if peer < 0 else ('user', peer)
+        if key not in skip:
+            wanted.setdefault(name, {})[message_id] = key
+    found = {}
+    for name, keys in wanted.items():
+        table = _archive_table(name)
+        for row in db.session.execute(select(table).where(table.c.id.in_(list(keys)))):
+            found[keys[row.id]] = row
+    return found
+
+
+def archive_messages(app, older_than_days=None, batch_size=None, sleep=None):
+    """Move messages older than the cutoff into their monthly partitions. Returns rows moved."""
+    older_than_days = int(older_than_days or app.config.get('MESSAGE_ARCHIVE_AFTER_DAYS', 90))
+    batch_size = int(batch_size or app.config.get('MESSAGE_ARCHIVE_BATCH_SIZE', 500))
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    hot = Message.__table__
+    col_names = ', '.join(f'"{c.name}"' for c in hot.columns)
+    moved = 0
+    with app.app_context():
+        with db.engine.connect() as conn:
+            max_id = conn.execute(select(func.max(hot.c.id))).scalar()
+        if max_id is None:
+            return 0
+        pick = (select(hot.c.id, hot.c.timestamp)
+                .where(hot.c.timestamp < cutoff, hot.c.id < max_id)
+                .order_by(hot.c.timestamp)
+                .limit(batch_size))
+        while True:
+            with db.engine.begin() as conn:
+                batch = conn.execute(pick).all()
+                if not batch:
+                    break
+                by_month = {}
+                for row in batch:
+                    by_month.setdefault(archive_table_name(row.timestamp), []).append(row.id)
+                for name, ids in by_month.items():
+                    table = ensure_archive_table(conn, name)
+                    conn.execute(text(f'INSERT INTO "{name}" ({col_names}) '
+                                      f'SELECT {col_names} FROM message WHERE id IN :ids')
+                                 .bindparams(bindparam('ids', expanding=True)), {'ids': ids})
+                    conn.execute(hot.delete().where(hot.c.id.in_(ids)))
+                    _record_heads(conn, name, table, ids)
+                    _record_partition(conn, name, table)
+            moved += len(batch)
+            if sleep:
+                sleep(0)  # let other greenlets/threads run between batches
+            if len(batch) < batch_size:
+                break
+    archive_state['runs'] += 1
+    archive_state['moved'] += moved
+    archive_state['last_moved'] = moved
+    if moved:
+        logger.info('[ARCHIVE] moved %s messages older than %s into monthly partitions', moved, cutoff.date())
+    return moved
+
+
+def start_message_archiver(app, socketio):
+    """Run `archive_messages` every MESSAGE_ARCHIVE_INTERVAL seconds as a SocketIO background task."""
+    if str(app.config.get('MESSAGE_ARCHIVE_ENABLED', 'true')).lower() != 'true':
+        return None
+    interval = int(app.config.get('MESSAGE_ARCHIVE_INTERVAL', 3600))
+    if interval <= 0:
+        return None
+
+    def _loop():
+        while True:
+            try:
+                archive_messages(app, sleep=socketio.sleep)
+            except Exception:
+                logger.exception('[ARCHIVE] archiving run failed')
+            socketio.sleep(interval)
+
+    try:
+        from services.metrics import registry
+        registry.counter('chat_message_archive_moved_total', 'Messages moved into archive partitions.',
+                         callback=lambda: archive_state['moved'])
+        registry.gauge('chat_message_archive_last_moved', 'Messages moved by the last archiver run.',
+                       callback=lambda: archive_state['last_moved'])
+    except Exception:
+        logger.debug('metrics unavailable; archive gauges not registered')
+
+    logger.info('[ARCHIVE] message archiver every %ss (older than %s days)', interval,
+                app.config.get('MESSAGE_ARCHIVE_AFTER_DAYS'))
+    return socketio.start_background_task(_loop)
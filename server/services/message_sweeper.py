@@ -0,0 +1,216 @@
+"""Background cleanup behind recalled messages.
+
+Recalling a message only writes a tombstone on its row (`recalled`,
+`recalled_at`, blank content), so the socket handler stays a single UPDATE.
+Every RECALL_SWEEP_INTERVAL seconds the sweeper removes what is left behind:
+
+- reactions on messages recalled since the previous pass (the first pass
+  after start covers every tombstone), in the hot table and in the archive
+  partitions (archived messages can be recalled too)
+- reactions whose message exists neither in the hot table nor in an archive
+  partition, e.g. rows orphaned by hard deletes before tombstones existed
+- attachments of recalled messages: a local file under storage/uploads or an
+  object in the configured S3 bucket is deleted only when the upload routes
+  recorded it (`upload` table) as uploaded by the message's sender, and no
+  live message, hot or archived (forwarded copies), avatar or sticker still
+  links the same URL; `file_url` is then cleared so the tombstone is not
+  picked up again. `file_url` comes from the client, so anything else is
+  left alone: attachments uploaded before the table existed are never deleted
+
+Started from the server entry point via `start_recall_sweeper(app, socketio)`.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, select, union
+
+from config.database import db
+from models.message_model import Message
+from models.message_reaction_model import MessageReaction
+from models.sticker_model import Sticker
+from models.upload_model import Upload
+from models.user_model import User
+from services.message_archive import list_partitions, message_tables
+
+logger = logging.getLogger(__name__)
+
+LOCAL_PREFIX = '/uploads/files/'
+
+# last run of the sweeper, read by the metrics gauges; `since` is the recalled_at watermark
+sweep_state = {'runs': 0, 'reactions': 0, 'files': 0, 'since': None}
+
+
+def _uploads_dir():
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'storage', 'uploads'))
+
+
+def delete_recalled_reactions(since=None):
+    """Delete reactions on messages recalled at or after `since` (all tombstones when None)."""
+    deleted = 0
+    for table in message_tables():
+        recalled = select(table.c.id).where(table.c.recalled_at.isnot(None))
+        if since is not None:
+            recalled = recalled.where(table.c.recalled_at >= since)
+        result = db.session.execute(delete(MessageReaction).where(MessageReaction.message_id.in_(recalled)))
+        deleted += result.rowcount or 0
+    db.session.commit()
+    return deleted
+
+
+def delete_orphan_reactions(batch_size=500):
+    """Delete reactions whose message is in neither the hot table nor an archive partition."""
+    hot = Message.__table__
+    missing = [mid for (mid,) in db.session.execute(
+        select(MessageReaction.message_id).distinct()
+        .select_from(MessageReaction.__table__.outerjoin(hot, hot.c.id == MessageReaction.message_id))
+        .where(hot.c.id.is_(None)))]
+    if not missing:
+        return 0
+    orphans = set(missing)
+    for table, lo, hi in list_partitions():
+        in_range = [mid for mid in orphans if lo <= mid <= hi]
+        for i in range(0, len(in_range), batch_size):
+            chunk = in_range[i:i + batch_size]
+            orphans.difference_update(mid for (mid,) in db.session.execute(
+                select(table.c.id).where(table.c.id.in_(chunk))))
+    deleted = 0
+    orphans = sorted(orphans)
+    for i in range(0, len(orphans), batch_size):
+        result = db.session.execute(delete(MessageReaction).where(
+            MessageReaction.message_id.in_(orphans[i:i + batch_size])))
+        deleted += result.rowcount or 0
+    db.session.commit()
+    return deleted
+
+
+def _s3_key(app, url):
+    """Object key when `url` points into the configured bucket, else None."""
+    bucket = app.config.get('AWS_S3_BUCKET')
+    region = app.config.get('AWS_S3_REGION', 'ap-southeast-1')
+    prefix = f'https://{bucket}.s3.{region}.amazonaws.com/'
+    return url[len(prefix):] if bucket and url.startswith(prefix) else None
+
+
+def _local_path(url):
+    """File under storage/uploads that a `/uploads/files/...` URL names, or None when it points outside."""
+    base = os.path.realpath(_uploads_dir())
+    path = os.path.realpath(os.path.join(base, url[len(LOCAL_PREFIX):].split('?', 1)[0]))
+    return path if path.startswith(base + os.sep) else None
+
+
+def delete_attachment(app, url):
+    """Remove the stored file behind a message `file_url`. Returns True when something was deleted."""
+    if url.startswith(LOCAL_PREFIX):
+        path = _local_path(url)
+        if path is None or not os.path.isfile(path):
+            return False
+        os.remove(path)
+        return True
+    key = _s3_key(app, url)
+    if key:
+        from routes.uploads import get_s3_client
+        client = get_s3_client()
+        if client is None:
+            return False
+        client.delete_object(Bucket=app.config.get('AWS_S3_BUCKET'), Key=key)
+        return True
+    return False
+
+
+def _still_linked(tables, urls):
+    """The `urls` still used by a message that is not recalled (in any of `tables`), an avatar or a sticker."""
+    linked = union(*[select(t.c.file_url).where(t.c.file_url.in_(urls), t.c.recalled.is_(False))
+                     for t in tables],
+                   select(User.avatar_url).where(User.avatar_url.in_(urls)),
+                   select(Sticker.file_url).where(Sticker.file_url.in_(urls)))
+    return {url for (url,) in db.session.execute(linked)}
+
+
+def _uploaded_by_sender(batch):
+    """URLs of `batch` (id, file_url, sender_id) that the upload routes recorded for that sender."""
+    owners = dict(db.session.query(Upload.file_url, Upload.user_id)
+                  .filter(Upload.file_url.in_({url for _id, url, _sender in batch})))
+    return {url for _id, url, sender in batch if owners.get(url) == sender}
+
+
+def clear_recalled_attachments(app, batch_size=500):
+    """Delete attachments of recalled messages, hot or archived, and clear their `file_url`. Returns files deleted."""
+    tables = message_tables()
+    deleted = 0
+    for table in tables:
+        pick = (select(table.c.id, table.c.file_url, table.c.sender_id)
+                .where(table.c.recalled_at.isnot(None), table.c.file_url.isnot(None))
+                .order_by(table.c.recalled_at)
+                .limit(batch_size))
+        while True:
+            batch = db.session.execute(pick).all()
+            if not batch:
+                break
+            owned = _uploaded_by_sender(batch)
+            if owned:
+                owned -= _still_linked(tables, owned)
+            removed = []
+            for url in owned:
+                try:
+                    if delete_attachment(app, url):
+                        deleted += 1
+                    removed.append(url)
+                except Exception:
+                    logger.exception('[SWEEPER] could not delete attachment %s', url)
+            if removed:
+                db.session.execute(delete(Upload).where(Upload.file_url.in_(removed)))
+            db.session.execute(table.update().where(table.c.id.in_(bindparam('ids', expanding=True)))
+                               .values(file_url=None), {'ids': [mid for mid, _url, _sender in batch]})
+            db.session.commit()
+            if len(batch) < batch_size:
+                break
+    return deleted
+
+
+def sweep_recalled(app, batch_size=None):
+    """One sweeper pass. Returns (reactions deleted, attachments deleted)."""
+    batch_size = int(batch_size or app.config.get('RECALL_SWEEP_BATCH_SIZE', 500))
+    started = datetime.utcnow()
+    with app.app_context():
+        try:
+            # overlap a little so a recall committed while the last pass ran is not missed
+            since = sweep_state['since'] - timedelta(minutes=1) if sweep_state['since'] else None
+            reactions = delete_recalled_reactions(since)
+            reactions += delete_orphan_reactions(batch_size)
+            files = clear_recalled_attachments(app, batch_size)
+        except Exception:
+            db.session.rollback()
+            raise
+    sweep_state['since'] = started
+    sweep_state['runs'] += 1
+    sweep_state['reactions'] += reactions
+    sweep_state['files'] += files
+    if reactions or files:
+        logger.info('[SWEEPER] removed %s reactions and %s attachments of recalled messages', reactions, files)
+    return reactions, files
+
+
+def start_recall_sweeper(app, socketio):
+    """Run `sweep_recalled` every RECALL_SWEEP_INTERVAL seconds as a SocketIO background task."""
+    interval = int(app.config.get('RECALL_SWEEP_INTERVAL', 600))
+    if interval <= 0:
+        return None
+
+    def _loop():
+        while True:
+            try:
+                sweep_recalled(app)
+            except Exception:
+                logger.exception('[SWEEPER] sweep failed')
+            socketio.sleep(interval)
+
+    try:
+        from services.metrics import registry
+        registry.counter('chat_recall_swept_total', 'Reactions and attachments removed after recalls.', ('kind',),
+                         callback=lambda: {'reactions': sweep_state['reactions'], 'files': sweep_state['files']})
+    except Exception:
+        logger.debug('metrics unavailable; sweeper gauges not registered')
+
+    logger.info('[SWEEPER] recall sweeper every %ss', interval)
+    return socketio.start_background_task(_loop)
@@ -0,0 +1,361 @@
+"""In-process metrics with Prometheus text exposition.
+
+Small dependency-free counters, gauges and histograms plus helpers that
+instrument the Flask app (every view, via request hooks), the SocketIO
+server (every `@socketio.on` handler and every emit) and SQLAlchemy
+session commits. `render_metrics()` returns the registry in the Prometheus
+text format; `routes/metrics.py` serves it at GET /metrics.
+
+Recording a sample is a dict lookup, a bisect and a few additions under a
+per-metric lock, so the per-event overhead stays in the low microseconds.
+"""
+from __future__ import annotations
+
+import bisect
+import inspect
+import itertools
+import json
+import logging
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets (seconds) tuned for a chat server: sub-ms emits up to slow DB writes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Payload size buckets (bytes)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+# Hard cap on distinct label sets per metric; extra series collapse into 'other'
+MAX_SERIES = 500
+INF_LABEL = 'le="+Inf"'
+# Payload sizes need a json.dumps, so only every Nth socket event is measured
+PAYLOAD_SAMPLE_EVERY = 10
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(v) -> str:
+    if isinstance(v, float):
+        if v == float('inf'):
+            return '+Inf'
+        return repr(v)
+    return str(v)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        key = tuple(labels)
+        if key not in self._series and len(self._series) >= MAX_SERIES:
+            return tuple('other' for _ in self.labelnames)
+        return key
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class _CallbackMetric(_Metric):
+    """Metric that is either updated directly or read from a callback at scrape time."""
+
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def collect(self):
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                logger.debug('metrics %s callback failed for %s', self.kind, self.name, exc_info=True)
+                return []
+            if isinstance(value, dict):
+                return [f'{self.name}{_format_labels(self.labelnames, k if isinstance(k, tuple) else (k,))} {_format_value(v)}'
+                        for k, v in value.items()]
+            return [f'{self.name} {_format_value(value)}']
+        with self._lock:
+            items = list(self._series.items())
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items]
+
+
+class Counter(_CallbackMetric):
+    """Monotonic counter; a callback must return running totals (e.g. a service's stats dict)."""
+    kind = 'counter'
+
+
+class Gauge(_CallbackMetric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket (non cumulative) counts + overflow slot, sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._series.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = 'le="%s"' % _format_value(float(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, INF_LABEL)} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=(), callback=None):
+        return self.register(Counter(name, help_text, labelnames, callback=callback))
+
+    def gauge(self, name, help_text, labelnames=(), callback=None):
+        return self.register(Gauge(name, help_text, labelnames, callback=callback))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets=buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.header())
+            lines.extend(m.collect())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+socket_event_seconds = registry.histogram(
+    'chat_socket_event_duration_seconds', 'Socket event handler latency.', ('event', 'action'))
+socket_event_errors = registry.counter(
+    'chat_socket_event_errors_total', 'Socket event handlers that raised.', ('event', 'action'))
+socket_payload_bytes = registry.histogram(
+    'chat_socket_event_payload_bytes', 'Sampled JSON size of incoming socket event payloads.', ('event',),
+    buckets=SIZE_BUCKETS)
+socket_emits = registry.counter(
+    'chat_socket_emits_total', 'Server side socket emits.', ('event',))
+socket_emit_seconds = registry.histogram(
+    'chat_socket_emit_duration_seconds', 'Time spent inside socketio.emit().', ('event',))
+connected_sockets = registry.gauge(
+    'chat_connected_sockets', 'Currently connected socket clients.')
+http_request_seconds = registry.histogram(
+    'chat_http_request_duration_seconds', 'REST request latency per endpoint.', ('endpoint', 'method'))
+http_request_errors = registry.counter(
+    'chat_http_request_errors_total', 'REST responses with a 5xx status.', ('endpoint', 'method'))
+db_commit_seconds = registry.histogram(
+    'chat_db_commit_duration_seconds', 'Session commit latency, including the flush.')
+db_commit_errors = registry.counter(
+    'chat_db_commit_errors_total', 'Session commits that were rolled back.')
+
+
+def _logging_stats():
+    from utils.logging_helpers import get_logging_stats
+    stats = get_logging_stats()
+    return {'suppressed': stats['suppressed'], 'dropped': stats['dropped']}
+
+
+registry.counter('chat_log_records_discarded_total', 'Log records suppressed by dedup or dropped on a full queue.',
+                 ('reason',), callback=_logging_stats)
+
+
+def render_metrics() -> str:
+    """Return all registered metrics in the Prometheus text exposition format."""
+    return registry.render()
+
+
+def _event_action(message, args):
+    """Label 'command' events by their action so each command gets its own series."""
+    if message == 'command' and args and isinstance(args[0], dict):
+        action = args[0].get('action')
+        if isinstance(action, str) and len(action) <= 64:
+            return action
+    return ''
+
+
+def _timed_handler(message, handler):
+    try:
+        takes_args = bool(inspect.signature(handler).parameters)
+    except (TypeError, ValueError):
+        takes_args = True
+    sample = itertools.count()
+
+    @wraps(handler)
+    def _wrapper(*args):
+        # Flask-SocketIO retries zero-arg connect handlers on TypeError; avoid the double call
+        if not takes_args:
+            args = ()
+        action = _event_action(message, args)
+        if args and next(sample) % PAYLOAD_SAMPLE_EVERY == 0:
+            try:
+                socket_payload_bytes.observe(len(json.dumps(args, default=str)), message)
+            except Exception:
+                pass
+        if message == 'connect':
+            connected_sockets.inc()
+        elif message == 'disconnect':
+            connected_sockets.dec()
+        start = time.perf_counter()
+        try:
+            return handler(*args)
+        except Exception:
+            socket_event_errors.inc(message, action)
+            raise
+        finally:
+            socket_event_seconds.observe(time.perf_counter() - start, message, action)
+
+    return _wrapper
+
+
+def instrument_socketio(socketio):
+    """Time every handler registered through `socketio.on` and count every emit.
+
+    Must be called before the event modules register their handlers.
+    """
+    original_on = socketio.on
+    original_emit = socketio.emit
+
+    def on(message, namespace=None):
+        decorator = original_on(message, namespace)
+
+        def register(handler):
+            decorator(_timed_handler(message, handler))
+            return handler
+        return register
+
+    def emit(event, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_emit(event, *args, **kwargs)
+        finally:
+            socket_emit_seconds.observe(time.perf_counter() - start, event)
+            socket_emits.inc(event)
+
+    socketio.on = on
+    socketio.emit = emit
+
+    def _room_count():
+        server = getattr(socketio, 'server', None)
+        manager = getattr(server, 'manager', None)
+        rooms = (getattr(manager, 'rooms', None) or {}).get('/', {})
+        # every sid has a private room named after itself; only count named rooms
+        sids = rooms.get(None, {})
+        return sum(1 for name in rooms if name is not None and name not in sids)
+
+    def _online_users():
+        from services.presence import presence
+        return presence.count()
+
+    def _flaps_absorbed():
+        from services.presence import presence
+        return presence.flaps_absorbed
+
+    registry.gauge('chat_socket_rooms', 'Named socket rooms in the default namespace.', callback=_room_count)
+    registry.gauge('chat_online_users', 'Users with a joined personal room (including the offline grace period).',
+                   callback=_online_users)
+    registry.counter('chat_presence_flaps_absorbed_total', 'Reconnects inside the presence grace period.',
+                     callback=_flaps_absorbed)
+    return socketio
+
+
+def instrument_app(app):
+    """Record latency and 5xx counts for every view via request hooks."""
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _metrics_observe(response):
+        start = getattr(g, '_metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            http_request_seconds.observe(time.perf_counter() - start, endpoint, request.method)
+            if response.status_code >= 500:
+                http_request_errors.inc(endpoint, request.method)
+        return response
+
+    return app
+
+
+def instrument_sqlalchemy(session_class=None):
+    """Time session commits (flush + COMMIT) and count rollbacks."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    target = session_class or Session
+
+    @event.listens_for(target, 'before_commit')
+    def _before_commit(session):
+        session.info['_metrics_commit_start'] = time.perf_counter()
+
+    @event.listens_for(target, 'after_commit')
+    def _after_commit(session):
+        start = session.info.pop('_metrics_commit_start', None)
+        if start is not None:
+            db_commit_seconds.observe(time.perf_counter() - start)
+
+    @event.listens_for(target, 'after_soft_rollback')
+    def _after_rollback(session, previous_transaction):
+        if session.info.pop('_metrics_commit_start', None) is not None:
+            db_commit_errors.inc()
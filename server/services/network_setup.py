@@ -1,4 +1,3 @@
-from pyngrok import ngrok
 import os
 import subprocess
 import logging
@@ -13,6 +12,9 @@ def start_ngrok(app, port=None):
     - Port can be passed explicitly; otherwise BACKEND_PORT or 5000 is used.
     - Uses ngrok from PATH (assumed to be installed manually or system-wide).
     """
+    # imported here so pyngrok is only loaded when a tunnel is actually requested
+    from pyngrok import ngrok
+
     # Allow explicit port or read from env
     if port is None:
         try:
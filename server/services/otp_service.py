@@ -3,10 +3,21 @@ import logging
 from models.user_model import User
 from config.database import db
 from werkzeug.security import generate_password_hash
+from services.async_compat import run_blocking
+from utils.phone import normalize_phone
 
 # Module logger
 logger = logging.getLogger(__name__)
 
+
+def _find_user(contact):
+    """User whose username is `contact` or whose (E.164) phone number matches it."""
+    phone = normalize_phone(contact)
+    if phone:
+        return User.query.filter((User.username == contact) | (User.phone_number == phone)).first()
+    return User.query.filter_by(username=contact).first()
+
+
 # Try a top-level import so static analyzers (language servers) can resolve
 # the `requests` symbol. If it's not available at runtime the helper functions
 # will raise a RuntimeError as before.
@@ -48,7 +59,7 @@ def send_otp(contact, method=None):
                 is_phone = True
 
     # Try to find a user by username or phone_number
-    user = User.query.filter((User.username == contact) | (User.phone_number == contact)).first()
+    user = _find_user(contact)
     if not user:
         return {'success': False, 'error': 'User not found'}
 
@@ -213,11 +224,11 @@ def reset_password(contact, otp, new_password):
         return {'success': False, 'error': 'Invalid OTP'}
 
     # Find user by username or phone_number
-    user = User.query.filter((User.username == contact) | (User.phone_number == contact)).first()
+    user = _find_user(contact)
     if not user:
         return {'success': False, 'error': 'User not found'}
 
-    user.password_hash = generate_password_hash(new_password)
+    user.password_hash = run_blocking(generate_password_hash, new_password)
     db.session.commit()
 
     # Clean up OTP
@@ -0,0 +1,195 @@
+"""In-memory presence registry with a grace period for disconnects.
+
+A user is online while at least one of their sockets has joined `user-<id>`.
+When the last socket goes away the user is only *tentatively* offline for
+PRESENCE_GRACE_SECONDS. A reconnect inside that window cancels the pending
+offline notice, and the join skips the friend query and the `user_joined`
+fan-out because friends never saw the user leave. After a deploy or a
+network blip, mass reconnects therefore cost no presence emits at all.
+
+Expired grace periods are collected by a single sweeper task (not one timer
+per disconnect), which hands the user ids to the `on_offline` callback
+inside an app context.
+
+The registry also backs presence subscriptions: a socket subscribes to a
+set of user ids, gets one snapshot, and is then sent a diff for each real
+online/offline transition of those users (see `GET /presence` and the
+`presence_subscribe` socket event).
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+MAX_SUBSCRIPTIONS_PER_SID = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def as_user_id(value):
+    """Normalize ids from socket payloads ('12' and 12 are the same user)."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class PresenceRegistry:
+    def __init__(self, grace_seconds=5.0):
+        self.grace = grace_seconds
+        self._lock = threading.Lock()
+        self._sids = {}      # user_id -> set of sids
+        self._users = {}     # sid -> user_id
+        self._pending = {}   # user_id -> monotonic deadline of the offline notice
+        self._sweeper = None
+        self._last_seen = {}  # user_id -> datetime the user went offline (UTC)
+        self._watchers = {}   # user_id -> sids subscribed to that user's presence
+        self._subscriptions = {}  # sid -> user_ids it watches
+        self.flaps_absorbed = 0
+
+    def init_app(self, config):
+        self.grace = max(0.0, float(config.get('PRESENCE_GRACE_SECONDS', 5)))
+
+    def attach(self, user_id, sid):
+        """Register a joined socket. Returns True when friends should be told the user came online."""
+        with self._lock:
+            previous = self._users.get(sid)
+            if previous is not None and previous != user_id:
+                self._drop_sid(previous, sid)
+            self._users[sid] = user_id
+            sids = self._sids.setdefault(user_id, set())
+            was_online = bool(sids)
+            if self._pending.pop(user_id, None) is not None:
+                was_online = True
+                self.flaps_absorbed += 1
+            sids.add(sid)
+            return not was_online
+
+    def detach(self, sid):
+        """Forget a socket. Returns (user_id, last) where `last` means no sockets are left."""
+        with self._lock:
+            user_id = self._users.pop(sid, None)
+            if user_id is None:
+                return None, False
+            last = self._drop_sid(user_id, sid)
+            if last and self.grace > 0:
+                self._pending[user_id] = time.monotonic() + self.grace
+            return user_id, last
+
+    def _drop_sid(self, user_id, sid):
+        sids = self._sids.get(user_id)
+        if sids is None:
+            return False
+        sids.discard(sid)
+        if sids:
+            return False
+        del self._sids[user_id]
+        return True
+
+    def collect_expired(self, now=None):
+        """Pop and return users whose grace period ran out without a reconnect."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expired = [uid for uid, deadline in self._pending.items() if deadline <= now]
+            stamp = datetime.utcnow()
+            for uid in expired:
+                del self._pending[uid]
+                self._last_seen[uid] = stamp
+        return expired
+
+    def mark_offline_now(self, user_id):
+        """Record the offline time when there is no grace period."""
+        with self._lock:
+            self._last_seen[user_id] = datetime.utcnow()
+
+    def is_online(self, user_id):
+        """Online, or inside the grace period (friends have not been told otherwise)."""
+        user_id = as_user_id(user_id)
+        return user_id in self._sids or user_id in self._pending
+
+    def online_ids(self):
+        with self._lock:
+            return set(self._sids) | set(self._pending)
+
+    def user_of(self, sid):
+        """User a socket joined as, or None before its `join`."""
+        with self._lock:
+            return self._users.get(sid)
+
+    def sids_for(self, user_id):
+        with self._lock:
+            return set(self._sids.get(as_user_id(user_id), ()))
+
+    def count(self):
+        return len(self.online_ids())
+
+    def state(self, user_id):
+        """Presence entry for one user: {'online': bool, 'last_seen': iso string or None}."""
+        user_id = as_user_id(user_id)
+        online = user_id in self._sids or user_id in self._pending
+        last_seen = None if online else self._last_seen.get(user_id)
+        return {'online': online, 'last_seen': last_seen.isoformat() if last_seen else None}
+
+    def snapshot(self, user_ids):
+        return {str(uid): self.state(uid) for uid in user_ids}
+
+    def subscribe(self, sid, user_ids):
+        """Watch `user_ids` from `sid`; returns the requested ids now watched (bounded per sid)."""
+        with self._lock:
+            watched = self._subscriptions.setdefault(sid, set())
+            watching = []
+            for uid in user_ids:
+                if uid not in watched:
+                    if len(watched) >= MAX_SUBSCRIPTIONS_PER_SID:
+                        continue
+                    watched.add(uid)
+                    self._watchers.setdefault(uid, set()).add(sid)
+                watching.append(uid)
+            return watching
+
+    def unsubscribe(self, sid, user_ids=None):
+        """Stop watching `user_ids` (all of them when None) from `sid`."""
+        with self._lock:
+            watched = self._subscriptions.get(sid)
+            if not watched:
+                return
+            for uid in list(watched if user_ids is None else user_ids):
+                watched.discard(uid)
+                sids = self._watchers.get(uid)
+                if sids is not None:
+                    sids.discard(sid)
+                    if not sids:
+                        del self._watchers[uid]
+            if not watched:
+                del self._subscriptions[sid]
+
+    def watchers_of(self, user_id):
+        with self._lock:
+            return set(self._watchers.get(user_id, ()))
+
+    def start_sweeper(self, socketio, app, on_offline):
+        """Start the sweeper once; `on_offline(user_ids)` runs inside an app context."""
+        with self._lock:
+            if self._sweeper is not None or self.grace <= 0:
+                return self._sweeper
+            self._sweeper = True
+        tick = min(1.0, self.grace / 2.0)
+
+        def _loop():
+            while True:
+                socketio.sleep(tick)
+                expired = self.collect_expired()
+                if not expired:
+                    continue
+                try:
+                    with app.app_context():
+                        on_offline(expired)
+                except Exception:
+                    logger.exception('[PRESENCE] offline notification failed for %s users', len(expired))
+
+        self._sweeper = socketio.start_background_task(_loop)
+        logger.info('[PRESENCE] offline grace period %ss', self.grace)
+        return self._sweeper
+
+
+presence = PresenceRegistry()
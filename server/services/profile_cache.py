@@ -0,0 +1,177 @@
+"""Serialized user profiles behind a versioned write-through cache.
+
+`serialize_profile(user)` is the one place that turns a user into the
+profile dict returned by /users/me, /auth/me, /users/<id> and login. The
+cache stores those dicts, not ORM objects:
+
+    from services.profile_cache import profile_cache
+    profile = profile_cache.get(user_id)   # dict or None; misses read one projected row
+    profile_cache.put(serialize_profile(user))   # after committing a change
+
+Every profile change bumps `user.profile_version`; `put` ignores a profile
+older than the cached one, so a slow writer cannot overwrite a newer entry.
+`status` is not cached: it changes on every connect/disconnect, so readers
+take it from the presence registry (`with_status`).
+
+Backends (PROFILE_CACHE_BACKEND): `memory` (default, per process LRU of
+PROFILE_CACHE_SIZE entries) or `redis` (REDIS_URL, shared by all workers,
+falling back to memory while Redis is unreachable). Entries expire after
+PROFILE_CACHE_TTL_SECONDS, which bounds staleness for writes that bypass
+the cache (scripts, manual SQL).
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from config.database import db
+
+logger = logging.getLogger(__name__)
+
+# columns read on a cache miss, in response order; `status` is added by with_status()
+PROFILE_FIELDS = ('id', 'username', 'display_name', 'avatar_url', 'gender', 'birthdate', 'phone_number',
+                  'profile_version')
+PUBLIC_FIELDS = ('id', 'username', 'display_name', 'avatar_url', 'profile_version')
+
+
+def _format_birthdate(value):
+    if value is None or value == '':
+        return None
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def serialize_profile(user):
+    """Profile dict for a User (or a projected row with the same attributes)."""
+    return {
+        'id': user.id,
+        'username': user.username,
+        'display_name': user.display_name or user.username,
+        'avatar_url': user.avatar_url,
+        'gender': user.gender,
+        'birthdate': _format_birthdate(user.birthdate),
+        'phone_number': user.phone_number,
+        'profile_version': user.profile_version or 1,
+    }
+
+
+def public_profile(profile):
+    """The subset of a profile other users may see."""
+    return {field: profile.get(field) for field in PUBLIC_FIELDS}
+
+
+def with_status(profile):
+    """Copy of `profile` with the live `status` from the presence registry."""
+    from services.presence import presence
+    return dict(profile, status='online' if presence.is_online(profile['id']) else 'offline')
+
+
+class ProfileCache:
+    def __init__(self, max_entries=10000, ttl_seconds=600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.backend = 'memory'
+        self.redis_url = None
+        self._redis = None
+        self._redis_retry_at = 0.0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (monotonic expiry, profile)
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, config):
+        self.max_entries = max(1, int(config.get('PROFILE_CACHE_SIZE', 10000)))
+        self.ttl = float(config.get('PROFILE_CACHE_TTL_SECONDS', 600))
+        self.backend = str(config.get('PROFILE_CACHE_BACKEND', 'memory')).lower()
+        self.redis_url = config.get('REDIS_URL')
+
+    # -- backends -----------------------------------------------------------------
+
+    def _client(self):
+        """Redis client, or None when the backend is memory or Redis is down (retried every 30s)."""
+        if self.backend != 'redis' or time.monotonic() < self._redis_retry_at:
+            return None
+        if self._redis is None:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.5)
+            except Exception:
+                logger.exception('[PROFILE_CACHE] redis unavailable, using the in-process cache')
+                self._redis_retry_at = time.monotonic() + 30
+                return None
+        return self._redis
+
+    def _redis_failed(self):
+        logger.warning('[PROFILE_CACHE] redis error, using the in-process cache for 30s', exc_info=True)
+        self._redis = None
+        self._redis_retry_at = time.monotonic() + 30
+
+    def _read(self, user_id):
+        client = self._client()
+        if client is not None:
+            try:
+                raw = client.get(f'profile:{user_id}')
+                return json.loads(raw) if raw else None
+            except Exception:
+                self._redis_failed()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def _write(self, profile):
+        user_id = profile['id']
+        client = self._client()
+        if client is not None:
+            try:
+                client.set(f'profile:{user_id}', json.dumps(profile), ex=max(1, int(self.ttl)))
+                return
+            except Exception:
+                self._redis_failed()
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # -- public API ----------------------------------------------------------------
+
+    def put(self, profile):
+        """Write `profile` through unless the cache already holds a newer version."""
+        current = self._read(profile['id'])
+        if current is not None and current.get('profile_version', 0) > profile.get('profile_version', 0):
+            return current
+        self._write(profile)
+        return profile
+
+    def get(self, user_id):
+        """Profile dict for `user_id`, or None when the user does not exist."""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        profile = self._read(user_id)
+        if profile is not None:
+            self.hits += 1
+            return profile
+        self.misses += 1
+        from models.user_model import User
+        row = db.session.query(*(getattr(User, field) for field in PROFILE_FIELDS)).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        return self.put(serialize_profile(row))
+
+    def invalidate(self, user_id):
+        client = self._client()
+        if client is not None:
+            try:
+                client.delete(f'profile:{user_id}')
+            except Exception:
+                self._redis_failed()
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+profile_cache = ProfileCache()
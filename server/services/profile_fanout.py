@@ -0,0 +1,77 @@
+"""Targeted `contact_updated` fan-out after a profile change.
+
+Only the fields that changed are sent, together with the new
+`profile_version`, so a client can drop an update older than the copy it
+already has. The audience is limited to people who can see the profile:
+
+- the user's own room (other tabs/devices) gets every changed field
+- online friends and online recent conversation peers (messages in the
+  last PROFILE_FANOUT_PEER_DAYS) get the public fields only; a change to
+  private fields alone (phone number, birthdate, gender) is not fanned out
+
+Payload: {'event': 'PROFILE_UPDATED', 'data': {'id', 'username',
+'profile_version', 'changed': [field, ...], <field>: <new value>, ...}}
+"""
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import union
+
+from config.database import db
+from services.emit_buffer import emit_buffer
+from services.presence import presence
+from services.profile_cache import PUBLIC_FIELDS
+from services.social_graph import social_graph
+
+logger = logging.getLogger(__name__)
+
+
+def changed_fields(before, after):
+    """Names of the profile fields that differ between two serialized profiles."""
+    return [field for field, value in after.items()
+            if field not in ('id', 'profile_version') and before.get(field) != value]
+
+
+def recent_peers(user_id, days):
+    """Users `user_id` exchanged 1:1 messages with in the last `days` days (hot table only)."""
+    from models.message_model import Message
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    sent = db.session.query(Message.receiver_id.label('peer')).filter(
+        Message.sender_id == user_id, Message.timestamp >= cutoff, Message.group_id.is_(None))
+    received = db.session.query(Message.sender_id.label('peer')).filter(
+        Message.receiver_id == user_id, Message.timestamp >= cutoff, Message.group_id.is_(None))
+    return {peer for (peer,) in db.session.execute(union(sent, received))}
+
+
+def profile_audience(user_id):
+    """Online friends and recent conversation peers of `user_id`."""
+    days = float(current_app.config.get('PROFILE_FANOUT_PEER_DAYS', 7))
+    candidates = set(social_graph.friends_of(user_id))
+    if days > 0:
+        candidates |= recent_peers(user_id, days)
+    candidates.discard(user_id)
+    return {uid for uid in candidates if presence.is_online(uid)}
+
+
+def publish_profile_update(before, after):
+    """Send the fields that changed from `before` to `after` (serialized profiles). Returns rooms emitted to."""
+    changed = changed_fields(before, after)
+    if not changed:
+        return 0
+    user_id = after['id']
+    base = {'id': user_id, 'username': after['username'], 'profile_version': after['profile_version']}
+
+    own = dict(base, changed=changed, **{field: after[field] for field in changed})
+    emit_buffer.emit('contact_updated', {'event': 'PROFILE_UPDATED', 'data': own}, room=f'user-{user_id}')
+    rooms = 1
+
+    public = [field for field in changed if field in PUBLIC_FIELDS]
+    if public:
+        data = dict(base, changed=public, **{field: after[field] for field in public})
+        payload = {'event': 'PROFILE_UPDATED', 'data': data}
+        for uid in profile_audience(user_id):
+            emit_buffer.emit('contact_updated', payload, room=f'user-{uid}')
+            rooms += 1
+    logger.debug('[PROFILE] user %s v%s changed %s, sent to %s rooms', user_id, after['profile_version'], changed, rooms)
+    return rooms
@@ -0,0 +1,108 @@
+"""Cached friend adjacency and bulk mutual-friend counts.
+
+Each user's accepted friends are loaded once into a frozenset and kept in a
+bounded LRU. `mutuals(caller, ids)` loads the sets that are not cached with
+one IN query, then intersects them with the caller's set in memory, so
+profile, search and suggestion responses can show mutual counts for dozens
+of users in a single call:
+
+    from services.social_graph import social_graph
+    social_graph.mutuals(me, [12, 40, 41])   # {12: 3, 40: 0, 41: 7}
+
+Call `social_graph.invalidate(a, b)` after a friendship between a and b is
+accepted or removed. Entries also expire after SOCIAL_GRAPH_TTL_SECONDS, which
+bounds staleness when another process (a script, a second worker) changes
+the friend table. SOCIAL_GRAPH_CACHE_SIZE caps the number of cached users.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from config.database import db
+
+_IN_CHUNK = 500
+
+
+class SocialGraph:
+    def __init__(self, max_users=10000, ttl_seconds=300.0):
+        self.max_users = max_users
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._friends = OrderedDict()  # user_id -> (monotonic expiry, frozenset of friend ids)
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, config):
+        self.max_users = max(1, int(config.get('SOCIAL_GRAPH_CACHE_SIZE', 10000)))
+        self.ttl = float(config.get('SOCIAL_GRAPH_TTL_SECONDS', 300))
+
+    def _cached(self, user_ids):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for uid in user_ids:
+                entry = self._friends.get(uid)
+                if entry is None or entry[0] <= now:
+                    continue
+                self._friends.move_to_end(uid)
+                found[uid] = entry[1]
+            self.hits += len(found)
+            self.misses += len(user_ids) - len(found)
+        return found
+
+    def _load(self, user_ids):
+        from models.friend_model import Friend
+        loaded = {uid: set() for uid in user_ids}
+        ids = list(user_ids)
+        for i in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[i:i + _IN_CHUNK]
+            rows = db.session.query(Friend.user_id, Friend.friend_id).filter(
+                Friend.status == 'accepted', Friend.user_id.in_(chunk) | Friend.friend_id.in_(chunk))
+            for a, b in rows:
+                if a in loaded:
+                    loaded[a].add(b)
+                if b in loaded:
+                    loaded[b].add(a)
+        expires = time.monotonic() + self.ttl
+        result = {uid: frozenset(friends) for uid, friends in loaded.items()}
+        with self._lock:
+            for uid, friends in result.items():
+                self._friends[uid] = (expires, friends)
+                self._friends.move_to_end(uid)
+            while len(self._friends) > self.max_users:
+                self._friends.popitem(last=False)
+        return result
+
+    def friends_of_many(self, user_ids):
+        """{user_id: frozenset of accepted friend ids}, one query for whatever is not cached."""
+        user_ids = set(user_ids)
+        found = self._cached(user_ids)
+        missing = user_ids - set(found)
+        if missing:
+            found.update(self._load(missing))
+        return found
+
+    def friends_of(self, user_id):
+        return self.friends_of_many([user_id])[user_id]
+
+    def is_friend(self, a, b):
+        return b in self.friends_of(a)
+
+    def mutuals(self, caller_id, user_ids):
+        """{user_id: number of friends shared with `caller_id`} for every id in `user_ids`."""
+        user_ids = [uid for uid in user_ids if uid is not None]
+        graph = self.friends_of_many([caller_id, *user_ids])
+        mine = graph[caller_id]
+        return {uid: len(mine & graph[uid]) if uid != caller_id else 0 for uid in user_ids}
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for uid in user_ids:
+                self._friends.pop(uid, None)
+
+    def clear(self):
+        with self._lock:
+            self._friends.clear()
+
+
+social_graph = SocialGraph()
@@ -0,0 +1,98 @@
+"""Background WAL checkpointing and WAL size monitoring for SQLite.
+
+With `journal_mode=WAL` SQLite only checkpoints automatically from inside a
+committing writer (wal_autocheckpoint), and never shrinks the -wal file. The
+checkpointer runs a PASSIVE checkpoint every SQLITE_CHECKPOINT_INTERVAL
+seconds, which never blocks readers or the writer. Once the WAL grows past
+SQLITE_WAL_TRUNCATE_BYTES it runs a TRUNCATE checkpoint to reset the file.
+
+Started from the server entry point via `start_wal_checkpointer(app, socketio)`;
+it uses `socketio.start_background_task` / `socketio.sleep` so it works under
+threading, eventlet and gevent alike.
+"""
+import logging
+import os
+
+from sqlalchemy import text
+
+from config.database import db
+
+logger = logging.getLogger(__name__)
+
+# last observed values, read by the metrics gauges
+wal_state = {'wal_bytes': 0, 'checkpoints': 0, 'busy': 0, 'truncates': 0}
+
+
+def wal_path(app):
+    db_path = app.config.get('DB_PATH')
+    return f'{db_path}-wal' if db_path else None
+
+
+def wal_size(app):
+    """Current size of the -wal file in bytes (0 when absent)."""
+    path = wal_path(app)
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+
+def checkpoint(app, mode='PASSIVE'):
+    """Run `PRAGMA wal_checkpoint(<mode>)` and return (busy, log_frames, checkpointed_frames)."""
+    if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+        raise ValueError(f'invalid checkpoint mode: {mode}')
+    with app.app_context():
+        with db.engine.connect() as conn:
+            row = conn.execute(text(f'PRAGMA wal_checkpoint({mode})')).fetchone()
+    return tuple(row) if row else (0, 0, 0)
+
+
+def run_checkpoint_cycle(app):
+    """One scheduler tick: pick the checkpoint mode from the WAL size and run it."""
+    size = wal_size(app)
+    wal_state['wal_bytes'] = size
+    limit = int(app.config.get('SQLITE_WAL_TRUNCATE_BYTES', 64 * 1024 * 1024))
+    mode = 'TRUNCATE' if size > limit else 'PASSIVE'
+    busy, log_frames, done_frames = checkpoint(app, mode)
+    wal_state['checkpoints'] += 1
+    if busy:
+        wal_state['busy'] += 1
+    if mode == 'TRUNCATE':
+        wal_state['truncates'] += 1
+        logger.info('[SQLITE] WAL was %s bytes; TRUNCATE checkpoint busy=%s frames=%s/%s', size, busy, done_frames, log_frames)
+    else:
+        logger.debug('[SQLITE] PASSIVE checkpoint busy=%s frames=%s/%s wal_bytes=%s', busy, done_frames, log_frames, size)
+    wal_state['wal_bytes'] = wal_size(app)
+    return mode, busy
+
+
+def start_wal_checkpointer(app, socketio):
+    """Start the checkpoint loop as a SocketIO background task (no-op unless SQLite WAL)."""
+    if not str(app.config.get('SQLALCHEMY_DATABASE_URI', '')).startswith('sqlite'):
+        return None
+    if str(app.config.get('SQLITE_JOURNAL_MODE', 'WAL')).upper() != 'WAL':
+        return None
+    interval = int(app.config.get('SQLITE_CHECKPOINT_INTERVAL', 60))
+    if interval <= 0:
+        return None
+
+    def _loop():
+        while True:
+            socketio.sleep(interval)
+            try:
+                run_checkpoint_cycle(app)
+            except Exception:
+                logger.exception('[SQLITE] WAL checkpoint failed')
+
+    try:
+        from services.metrics import registry
+        registry.gauge('chat_sqlite_wal_bytes', 'Size of the SQLite -wal file.', callback=lambda: wal_size(app))
+        registry.counter('chat_sqlite_checkpoints_total', 'Background WAL checkpoints by outcome.', ('outcome',),
+                         callback=lambda: {'total': wal_state['checkpoints'], 'busy': wal_state['busy'],
+                                           'truncate': wal_state['truncates']})
+    except Exception:
+        logger.debug('metrics unavailable; WAL gauges not registered')
+
+    logger.info('[SQLITE] WAL checkpointer every %ss (truncate above %s bytes)', interval,
+                app.config.get('SQLITE_WAL_TRUNCATE_BYTES'))
+    return socketio.start_background_task(_loop)
@@ -0,0 +1,144 @@
+"""Sticker packs, content-addressed sticker files and the catalog manifest.
+
+Sticker images are stored once per content: the file name is the SHA-256 of
+the bytes (`storage/uploads/stickers/<sha256>.<ext>`) and the URL is
+`/stickers/files/<sha256>.<ext>`. A URL therefore never changes meaning, so
+it is served with `Cache-Control: immutable` and a one year max-age, and
+uploading the same image twice returns the existing sticker instead of
+writing (or overwriting) a file.
+
+Clients fetch the compact manifest first (`GET /stickers/manifest`: one
+entry per pack with its sticker count, cover and version) and revalidate it
+with `If-None-Match`; only packs whose `version` changed need their pages
+(`GET /stickers/packs/<id>`) fetched again.
+
+    from services.sticker_catalog import add_sticker, get_or_create_pack
+    pack = get_or_create_pack('Quby', source='zalo')
+    sticker, created = add_sticker(data, '.png', pack, name='quby_01')
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from config.database import db
+
+# raster only: an SVG served from the app origin could run script (stored XSS)
+STICKER_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+FILE_URL_PREFIX = '/stickers/files/'
+DEFAULT_PACK_NAME = 'Stickers'
+
+
+def sticker_dir():
+    path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'storage', 'uploads', 'stickers'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hashed_filename(digest, ext):
+    return f'{digest}{ext.lower()}'
+
+
+def store_file(data, ext, digest=None):
+    """Write `data` under its content hash unless that file already exists. Returns (digest, file_url)."""
+    digest = digest or content_hash(data)
+    name = hashed_filename(digest, ext)
+    path = os.path.join(sticker_dir(), name)
+    if not os.path.exists(path):
+        # write to a temp name first so a reader never sees a half-written immutable file
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    return digest, FILE_URL_PREFIX + name
+
+
+def get_or_create_pack(name, source=None):
+    from models.sticker_pack_model import StickerPack
+    name = (name or DEFAULT_PACK_NAME).strip() or DEFAULT_PACK_NAME
+    pack = StickerPack.query.filter_by(name=name).first()
+    if pack is None:
+        pack = StickerPack(name=name, source=source)
+        db.session.add(pack)
+        db.session.flush()
+    return pack
+
+
+def add_sticker(data, ext, pack, name=None, created_by=None, commit=True):
+    """Store an image in `pack`. Returns (sticker, created); an identical image returns the existing sticker."""
+    from models.sticker_model import Sticker
+    ext = ext.lower()
+    if ext not in STICKER_EXTENSIONS:
+        raise ValueError(f'unsupported sticker type: {ext}')
+    digest = content_hash(data)
+    existing = Sticker.query.filter_by(content_hash=digest).first()
+    if existing is not None:
+        return existing, False
+    digest, file_url = store_file(data, ext, digest)
+    sticker = Sticker(name=name or digest[:12], file_url=file_url, content_hash=digest, source_hash=digest,
+                      pack_id=pack.id, created_by=created_by)
+    db.session.add(sticker)
+    pack.updated_at = datetime.utcnow()
+    if not commit:
+        return sticker, True
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # the same image was added concurrently
+        db.session.rollback()
+        return Sticker.query.filter_by(content_hash=digest).first(), False
+    return sticker, True
+
+
+def _version(*parts):
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+
+
+def pack_version(pack, count, last_id, id_sum):
+    """Changes whenever a sticker is added to or removed from the pack, or the pack is renamed."""
+    return _version(pack.name, count, last_id, id_sum or 0)
+
+
+def pack_stats(pack):
+    """(count, last_id, id_sum) of one pack's stickers."""
+    from models.sticker_model import Sticker
+    return db.session.query(func.count(Sticker.id), func.max(Sticker.id), func.sum(Sticker.id)).filter(
+        Sticker.pack_id == pack.id).one()
+
+
+def build_manifest():
+    """Compact catalog: one entry per pack, plus a `version` hash of the whole manifest (used as ETag)."""
+    from models.sticker_model import Sticker
+    from models.sticker_pack_model import StickerPack
+    stats = {pack_id: (count, first_id, last_id, id_sum) for pack_id, count, first_id, last_id, id_sum in
+             db.session.query(Sticker.pack_id, func.count(Sticker.id), func.min(Sticker.id),
+                              func.max(Sticker.id), func.sum(Sticker.id)).group_by(Sticker.pack_id)}
+    covers = dict(db.session.query(Sticker.id, Sticker.file_url).filter(
+        Sticker.id.in_([s[1] for s in stats.values()]))) if stats else {}
+    packs = []
+    for pack in StickerPack.query.order_by(StickerPack.id):
+        count, first_id, last_id, id_sum = stats.get(pack.id, (0, None, None, 0))
+        packs.append({
+            'id': pack.id,
+            'name': pack.name,
+            'count': count,
+            'cover_url': covers.get(first_id),
+            'version': pack_version(pack, count, last_id, id_sum),
+        })
+    return {'version': _version([(p['id'], p['version']) for p in packs]), 'packs': packs}
+
+
+def pack_page(pack_id, after_id=0, limit=100):
+    """Stickers of one pack with id > after_id, in id order, as compact dicts."""
+    from models.sticker_model import Sticker
+    rows = (db.session.query(Sticker.id, Sticker.name, Sticker.file_url)
+            .filter(Sticker.pack_id == pack_id, Sticker.id > after_id)
+            .order_by(Sticker.id).limit(limit))
+    return [{'id': sid, 'name': name, 'url': url} for sid, name, url in rows]
@@ -0,0 +1,298 @@
+"""Friend suggestions ("people you may know") ranked by mutual friends and contacts.
+
+Scores are precomputed in the friend_suggestion table, so
+GET /users/suggestions is a top-K read on ix_friend_suggestion_rank:
+
+    score = MUTUAL_WEIGHT * mutual_count + CONTACT_WEIGHT * contact_match
+
+`contact_match` means the candidate's phone number is in the user's synced
+address book (ContactSync matches). Rows are kept current incrementally:
+
+- friendship_added(a, b): every friend of `a` gains a mutual friend with `b`
+  and the other way round; the a/b pair stops being a suggestion.
+- friendship_removed(a, b): the reverse, and a/b may become suggestions again.
+- relation_dropped(a, b): a pending request was rejected or a block lifted.
+- contacts_changed(user_id): the user's own rows are rebuilt.
+
+`rebuild_all()` recomputes every user from one in-memory copy of the graph
+(`flask --app app rebuild-suggestions`), e.g. nightly or after bulk imports.
+Every rebuild marks the user in friend_suggestion_scored, so a user with no
+candidates at all is not rescored on each read.
+Candidates that have since become friends, have a pending request or are
+blocked in either direction are filtered out when reading.
+
+The hooks log and swallow their own errors: a stale suggestion is better than
+a failed friend accept.
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import click
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config.database import db
+from services.social_graph import social_graph
+
+logger = logging.getLogger(__name__)
+
+MUTUAL_WEIGHT = 1.0
+CONTACT_WEIGHT = 3.0
+# rows kept per user by a rebuild; incremental updates may add a few more
+MAX_PER_USER = 100
+_IN_CHUNK = 500
+
+
+def _score(mutual_count, contact_match):
+    return MUTUAL_WEIGHT * mutual_count + CONTACT_WEIGHT * contact_match
+
+
+def _chunks(values):
+    values = list(values)
+    for i in range(0, len(values), _IN_CHUNK):
+        yield values[i:i + _IN_CHUNK]
+
+
+def friend_ids(user_id):
+    """Accepted friends of `user_id`, both directions."""
+    return set(social_graph.friends_of(user_id))
+
+
+def related_ids(user_id, candidate_ids=None):
+    """Users that must not be suggested to `user_id`: any friend row (any status) or block, either direction."""
+    from models.friend_model import Friend
+    from models.block_model import Block
+    related = {user_id}
+    friend_q = db.session.query(Friend.user_id, Friend.friend_id).filter(
+        (Friend.user_id == user_id) | (Friend.friend_id == user_id))
+    block_q = db.session.query(Block.user_id, Block.target_id).filter(
+        (Block.user_id == user_id) | (Block.target_id == user_id))
+    if candidate_ids is not None:
+        candidate_ids = list(candidate_ids)
+        if not candidate_ids:
+            return related
+        friend_q = friend_q.filter(Friend.user_id.in_(candidate_ids) | Friend.friend_id.in_(candidate_ids))
+        block_q = block_q.filter(Block.user_id.in_(candidate_ids) | Block.target_id.in_(candidate_ids))
+    for a, b in friend_q.all() + block_q.all():
+        related.add(a)
+        related.add(b)
+    return related
+
+
+def _contact_matches(user_id):
+    from models.contact_sync_model import ContactSync
+    cs = ContactSync.query.filter_by(user_id=user_id).first()
+    return {int(uid) for uid in cs.get_matches().values()} if cs else set()
+
+
+def compute_scores(user_id):
+    """{candidate_id: (mutual_count, contact_match)} for one user, from the database."""
+    friends = friend_ids(user_id)
+    adj = social_graph.friends_of_many(friends)
+    mutual = Counter(c for f in friends for c in adj.get(f, ()))
+    contacts = _contact_matches(user_id)
+    candidates = (set(mutual) | contacts) - related_ids(user_id)
+    return {c: (mutual[c], 1 if c in contacts else 0) for c in candidates}
+
+
+def _replace_rows(user_id, scores, now):
+    from models.friend_suggestion_model import FriendSuggestion, FriendSuggestionScored
+    FriendSuggestion.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    mark = sqlite_insert(FriendSuggestionScored.__table__).values(user_id=user_id, scored_at=now)
+    db.session.execute(mark.on_conflict_do_update(index_elements=['user_id'], set_={'scored_at': now}))
+    ranked = sorted(scores.items(), key=lambda kv: (-_score(*kv[1]), kv[0]))[:MAX_PER_USER]
+    db.session.bulk_insert_mappings(FriendSuggestion, [
+        {'user_id': user_id, 'candidate_id': c, 'mutual_count': m, 'contact_match': cm,
+         'score': _score(m, cm), 'updated_at': now}
+        for c, (m, cm) in ranked])
+    return len(ranked)
+
+
+def is_scored(user_id):
+    """Whether `user_id` went through a rebuild, even one that found no candidates."""
+    from models.friend_suggestion_model import FriendSuggestionScored
+    return db.session.get(FriendSuggestionScored, user_id) is not None
+
+
+def rebuild_for_user(user_id):
+    """Recompute and store one user's suggestions. Returns the number of rows."""
+    count = _replace_rows(user_id, compute_scores(user_id), datetime.utcnow())
+    db.session.commit()
+    return count
+
+
+def _adjust_mutuals(center, others, delta, now):
+    """Add `delta` to the mutual count of (center, o) and (o, center) for every o in `others`."""
+    from models.friend_suggestion_model import FriendSuggestion
+    others = set(others) - {center}
+    if not others:
+        return
+    existing = {}
+    for chunk in _chunks(others):
+        for row in FriendSuggestion.query.filter(
+                ((FriendSuggestion.user_id == center) & FriendSuggestion.candidate_id.in_(chunk)) |
+                ((FriendSuggestion.candidate_id == center) & FriendSuggestion.user_id.in_(chunk))):
+            existing[(row.user_id, row.candidate_id)] = row
+    related = related_ids(center, others) if delta > 0 else set()
+    for other in others:
+        for pair in ((center, other), (other, center)):
+            row = existing.get(pair)
+            if row is None:
+                if delta > 0 and other not in related:
+                    db.session.add(FriendSuggestion(user_id=pair[0], candidate_id=pair[1], mutual_count=delta,
+                                                    contact_match=0, score=_score(delta, 0), updated_at=now))
+                continue
+            row.mutual_count = max(0, row.mutual_count + delta)
+            if row.mutual_count == 0 and not row.contact_match:
+                db.session.delete(row)
+            else:
+                row.score = _score(row.mutual_count, row.contact_match)
+                row.updated_at = now
+
+
+def _delete_pair(a, b):
+    from models.friend_suggestion_model import FriendSuggestion
+    FriendSuggestion.query.filter(
+        ((FriendSuggestion.user_id == a) & (FriendSuggestion.candidate_id == b)) |
+        ((FriendSuggestion.user_id == b) & (FriendSuggestion.candidate_id == a))).delete(synchronize_session=False)
+
+
+def friendship_added(a, b):
+    """`a` and `b` just became friends (call after the accept is committed)."""
+    try:
+        now = datetime.utcnow()
+        _delete_pair(a, b)
+        _adjust_mutuals(b, friend_ids(a) - {b}, 1, now)
+        _adjust_mutuals(a, friend_ids(b) - {a}, 1, now)
+        db.session.commit()
+    except Exception:
+        logger.exception('[SUGGESTIONS] update failed after %s and %s became friends', a, b)
+        db.session.rollback()
+
+
+def friendship_removed(a, b):
+    """`a` and `b` are no longer friends (call after the delete is committed)."""
+    try:
+        now = datetime.utcnow()
+        friends_a, friends_b = friend_ids(a), friend_ids(b)
+        _adjust_mutuals(b, friends_a, -1, now)
+        _adjust_mutuals(a, friends_b, -1, now)
+        db.session.flush()
+        _restore_pair(a, b, friends_a, friends_b, now)
+        db.session.commit()
+    except Exception:
+        logger.exception('[SUGGESTIONS] update failed after %s and %s stopped being friends', a, b)
+        db.session.rollback()
+
+
+def _restore_pair(a, b, friends_a, friends_b, now):
+    """Score a/b as candidates for each other again, unless they are still related."""
+    from models.friend_suggestion_model import FriendSuggestion
+    _delete_pair(a, b)
+    if b in related_ids(a, [b]):
+        return
+    mutual = len(friends_a & friends_b)
+    for user_id, candidate_id in ((a, b), (b, a)):
+        contact = 1 if candidate_id in _contact_matches(user_id) else 0
+        if mutual or contact:
+            db.session.add(FriendSuggestion(user_id=user_id, candidate_id=candidate_id, mutual_count=mutual,
+                                            contact_match=contact, score=_score(mutual, contact), updated_at=now))
+
+
+def relation_dropped(a, b):
+    """A pending request or a block between `a` and `b` went away; they may be suggestions again."""
+    try:
+        _restore_pair(a, b, friend_ids(a), friend_ids(b), datetime.utcnow())
+        db.session.commit()
+    except Exception:
+        logger.exception('[SUGGESTIONS] update failed after the relation between %s and %s was dropped', a, b)
+        db.session.rollback()
+
+
+def contacts_changed(user_id):
+    """The user's address book matches changed: rebuild their rows."""
+    try:
+        rebuild_for_user(user_id)
+    except Exception:
+        logger.exception('[SUGGESTIONS] rebuild failed for user %s', user_id)
+        db.session.rollback()
+
+
+def top_suggestions(user_id, limit=10):
+    """Best `limit` suggestion rows for `user_id`, skipping candidates that are now related."""
+    from models.friend_suggestion_model import FriendSuggestion
+    # over-fetch a little: some candidates may have been requested or blocked since scoring
+    rows = (FriendSuggestion.query.filter_by(user_id=user_id)
+            .order_by(FriendSuggestion.score.desc(), FriendSuggestion.candidate_id)
+            .limit(limit * 2 + 10).all())
+    related = related_ids(user_id, [r.candidate_id for r in rows])
+    return [r for r in rows if r.candidate_id not in related][:limit]
+
+
+def fill_candidates(user_id, limit, skip=()):
+    """Up to `limit` unrelated users by id, for users with too few scored suggestions.
+
+    Reads users a page at a time and checks only that page against the
+    user's relations, so the query does not grow with the friend list.
+    """
+    from models.user_model import User
+    skip = set(skip)
+    found = []
+    last_id = 0
+    page_size = limit * 2 + 10
+    while len(found) < limit:
+        page = User.query.filter(User.id > last_id).order_by(User.id).limit(page_size).all()
+        if not page:
+            break
+        last_id = page[-1].id
+        related = related_ids(user_id, [u.id for u in page])
+        found.extend(u for u in page if u.id not in related and u.id not in skip)
+    return found[:limit]
+
+
+def rebuild_all(batch_size=500, user_ids=None):
+    """Recompute suggestions for all users (or `user_ids`) from one pass over the graph. Returns rows written."""
+    from models.user_model import User
+    from models.friend_model import Friend
+    from models.block_model import Block
+    from models.contact_sync_model import ContactSync
+
+    adj = defaultdict(set)
+    related = defaultdict(set)
+    for a, b, status in db.session.query(Friend.user_id, Friend.friend_id, Friend.status):
+        related[a].add(b)
+        related[b].add(a)
+        if status == 'accepted':
+            adj[a].add(b)
+            adj[b].add(a)
+    for a, b in db.session.query(Block.user_id, Block.target_id):
+        related[a].add(b)
+        related[b].add(a)
+    contacts = {cs.user_id: {int(uid) for uid in cs.get_matches().values()} for cs in ContactSync.query}
+
+    if user_ids is None:
+        user_ids = [uid for (uid,) in db.session.query(User.id).order_by(User.id)]
+    now = datetime.utcnow()
+    written = 0
+    for i, user_id in enumerate(user_ids, 1):
+        mutual = Counter(c for f in adj.get(user_id, ()) for c in adj.get(f, ()))
+        mine = contacts.get(user_id, set())
+        candidates = (set(mutual) | mine) - related.get(user_id, set()) - {user_id}
+        written += _replace_rows(user_id, {c: (mutual[c], 1 if c in mine else 0) for c in candidates}, now)
+        if i % batch_size == 0:
+            db.session.commit()
+            logger.info('[SUGGESTIONS] rebuilt %s/%s users', i, len(user_ids))
+    db.session.commit()
+    return written
+
+
+def register_cli(app):
+    @app.cli.command('rebuild-suggestions')
+    @click.option('--user-id', type=int, multiple=True, help='Only these users (repeatable).')
+    @click.option('--batch-size', type=int, default=500, show_default=True, help='Users per commit.')
+    def rebuild_suggestions_command(user_id, batch_size):
+        """Recompute the friend_suggestion table."""
+        with app.app_context():
+            written = rebuild_all(batch_size=batch_size, user_ids=list(user_id) or None)
+        click.echo(f'Wrote {written} suggestion rows.')
@@ -0,0 +1,80 @@
+"""Request-scoped, batched user lookups (DataLoader style).
+
+Code that renders users usually knows every id it will need before it needs
+the first profile. Queue them, then read them back; all queued ids are
+resolved with one IN query and memoized for the rest of the scope:
+
+    from services.user_loader import user_loader
+    user_loader.prime(peer_ids)          # optional: queue ids early
+    users = user_loader.load_many(ids)   # {id: User or None}, one query for the misses
+    me = user_loader.load(user_id)       # served from the memo when already loaded
+
+The memo lives on `flask.g`, so it is shared by everything that runs in the
+same HTTP request or socket event (Flask-SocketIO pushes a fresh context per
+event) and is dropped with it: nothing is cached across requests.
+"""
+from flask import g, has_app_context
+
+_IN_CHUNK = 500
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class UserLoader:
+    def _scope(self):
+        """(loaded, pending) for the current app context, or None outside one."""
+        if not has_app_context():
+            return None
+        scope = g.get('_user_loader')
+        if scope is None:
+            scope = g._user_loader = ({}, set())
+        return scope
+
+    def prime(self, user_ids):
+        """Queue ids to be fetched by the next load."""
+        scope = self._scope()
+        if scope is None:
+            return
+        loaded, pending = scope
+        pending.update(uid for uid in map(_as_id, user_ids) if uid is not None and uid not in loaded)
+
+    def load_many(self, user_ids):
+        """{user_id: User or None} for every id; queued ids are fetched in the same query."""
+        from models.user_model import User
+        ids = [uid for uid in map(_as_id, user_ids) if uid is not None]
+        scope = self._scope()
+        if scope is None:
+            loaded, pending = {}, set(ids)
+        else:
+            loaded, pending = scope
+            pending.update(uid for uid in ids if uid not in loaded)
+        if pending:
+            batch = list(pending)
+            pending.clear()
+            for uid in batch:
+                loaded[uid] = None
+            for i in range(0, len(batch), _IN_CHUNK):
+                for user in User.query.filter(User.id.in_(batch[i:i + _IN_CHUNK])):
+                    loaded[user.id] = user
+        return {uid: loaded.get(uid) for uid in ids}
+
+    def load(self, user_id):
+        uid = _as_id(user_id)
+        if uid is None:
+            return None
+        return self.load_many([uid])[uid]
+
+    def forget(self, *user_ids):
+        """Drop memoized users, e.g. after they were deleted in this request."""
+        scope = self._scope()
+        if scope is not None:
+            for uid in map(_as_id, user_ids):
+                scope[0].pop(uid, None)
+
+
+user_loader = UserLoader()
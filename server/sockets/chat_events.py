@@ -1,5 +1,5 @@
 from flask_socketio import emit, join_room, leave_room
-from flask import request
+from flask import request, current_app
 from models.user_model import User
 from models.message_model import Message
 from models.message_reaction_model import MessageReaction
@@ -9,49 +9,44 @@ from models.contact_sync_model import ContactSync
 from config.database import db
 import logging
 from services.auth_service import decode_token
-import traceback
-import os
+from services.message_archive import find_message, update_message
+from services.dead_letter import dead_letters, message_data as dead_letter_message_data
+from services.emit_buffer import emit_buffer
+from services.presence import as_user_id, presence
+from sockets.signaling_events import leave_calls_of_sid
+from services import suggestions
+from services.social_graph import social_graph
+from services.user_loader import user_loader
+from utils.logging_helpers import DIAG_SAMPLED, diag_sampled, get_diag_logger
+from utils.phone import contacts_hash, normalize_phone, normalize_phones
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
 
 # module logger
 logger = logging.getLogger(__name__)
-
-# Store mapping of user_id -> socket.sid for direct targeting
-user_sockets = {}
+# sampled logger for per-message diagnostics (see utils.logging_helpers)
+diag_logger = get_diag_logger()
 
 def register_chat_events(socketio):
     def GetContactsList(user_id):
         """Return a list of contact dicts for given user_id: {id, name, online}.
-        Looks up Friend relations with status 'accepted' and queries User for profile.
-        Online detection uses the in-memory `user_sockets` mapping.
+        Friend ids come from the cached social graph and profiles from one batched
+        user query. Online detection uses the in-memory presence registry.
         """
         try:
-            # Find both directions where relationship exists
-            outgoing = Friend.query.filter_by(user_id=user_id, status='accepted').all() or []
-            incoming = Friend.query.filter_by(friend_id=user_id, status='accepted').all() or []
+            users = user_loader.load_many(sorted(_friend_ids(user_id)))
             rows = []
-            for f in outgoing:
-                fid = f.friend_id
-                u = User.query.get(fid)
+            for fid, u in users.items():
                 if not u:
                     continue
                 rows.append({
                     'id': str(u.id),
                     'name': u.display_name or u.username,
-                    'online': fid in user_sockets
-                })
-            for f in incoming:
-                fid = f.user_id
-                u = User.query.get(fid)
-                if not u:
-                    continue
-                rows.append({
-                    'id': str(u.id),
-                    'name': u.display_name or u.username,
-                    'online': fid in user_sockets
+                    'online': presence.is_online(fid)
                 })
             return rows
         except Exception as e:
-            print(f"[CONTACTS] Error building contacts list: {e}")
+            logger.exception("[CONTACTS] Error building contacts list: %s", e)
             return []
 
     def AddBlock(user_id, target_id):
@@ -65,7 +60,7 @@ def register_chat_events(socketio):
             db.session.commit()
             return True, b
         except Exception as e:
-            print(f"[BLOCK] Error adding block: {e}")
+            logger.exception("[BLOCK] Error adding block: %s", e)
             db.session.rollback()
             return False, 'error'
 
@@ -76,45 +71,81 @@ def register_chat_events(socketio):
                 return False, 'not_found'
             db.session.delete(b)
             db.session.commit()
+            suggestions.relation_dropped(user_id, target_id)
             return True, None
         except Exception as e:
-            print(f"[BLOCK] Error removing block: {e}")
+            logger.exception("[BLOCK] Error removing block: %s", e)
             db.session.rollback()
             return False, 'error'
 
-    def SyncContacts(user_id, contacts):
-        """Compare given contacts (list of phone numbers) with users, persist and return matches."""
+    def _users_by_phone(phones):
+        """Users owning any of the normalized `phones`, via the unique phone index in bounded IN chunks."""
+        phones = list(phones)
+        users = []
+        for i in range(0, len(phones), 500):
+            users.extend(User.query.filter(User.phone_number.in_(phones[i:i + 500])).all())
+        return users
+
+    def SyncContacts(user_id, contacts=None, added=None, removed=None, base_hash=None):
+        """Match a user's address book against registered phone numbers.
+
+        Either `contacts` (the full list) or `added`/`removed` deltas with
+        `base_hash`, the hash returned by the previous sync, are given. A full
+        list whose hash equals the stored one costs no phone lookup and no
+        write; deltas only look up the added numbers. Returns
+        (matches, changed, hash); matches is None when the deltas were based on
+        a hash the server does not have and the client must send the full list.
+        """
         try:
-            # Find users where phone_number in provided contacts
-            if not contacts:
-                contacts = []
-            users = User.query.filter(User.phone_number.in_(contacts)).all() if contacts else []
-            matches = [{'id': str(u.id), 'name': u.display_name or u.username, 'phone': u.phone_number} for u in users]
-
-            # Load or create ContactSync row
             cs = ContactSync.query.filter_by(user_id=user_id).first()
-            old = []
-            if cs:
-                old = cs.get_contacts()
+            stored_hash = cs.contacts_hash if cs else None
+            now = datetime.utcnow()
+            fresh = bool(cs and cs.updated_at and stored_hash and
+                         (now - cs.updated_at).total_seconds() < current_app.config.get('CONTACTS_RESYNC_SECONDS', 86400))
+            old_matches = cs.get_matches() if cs else {}
+
+            if contacts is None:
+                if not stored_hash or base_hash != stored_hash:
+                    return None, False, stored_hash
+                phones = set(cs.get_contacts())
+                lookup = normalize_phones(added) - phones
+                phones = (phones - normalize_phones(removed)) | lookup
             else:
-                cs = ContactSync(user_id=user_id)
-                db.session.add(cs)
+                phones = normalize_phones(contacts)
+                lookup = None
+            digest = contacts_hash(phones)
 
-            # Save contacts list (as provided)
-            cs.set_contacts(contacts)
-            from datetime import datetime
-            cs.updated_at = datetime.utcnow()
-            db.session.commit()
-
-            # If matches changed compared to old, return flag to emit update
-            old_set = set(old or [])
-            new_set = set(contacts or [])
-            changed = old_set != new_set
-            return matches, changed
+            if digest == stored_hash and fresh:
+                matches = old_matches
+            else:
+                if lookup is None or not fresh:
+                    # full list, or the stored matches are too old to build on
+                    matches = {}
+                    lookup = phones
+                else:
+                    matches = {phone: uid for phone, uid in old_matches.items() if phone in phones}
+                for u in _users_by_phone(lookup):
+                    if u.id != user_id:
+                        matches[u.phone_number] = u.id
+                if cs is None:
+                    cs = ContactSync(user_id=user_id)
+                    db.session.add(cs)
+                cs.set_contacts(sorted(phones))
+                cs.set_matches(matches)
+                cs.contacts_hash = digest
+                cs.updated_at = now
+                db.session.commit()
+                if set(matches.values()) != set(old_matches.values()):
+                    suggestions.contacts_changed(user_id)
+
+            users = user_loader.load_many(sorted(set(matches.values())))
+            rows = [{'id': str(u.id), 'name': u.display_name or u.username, 'phone': u.phone_number} for u in users.values() if u]
+            changed = set(matches.values()) != set(old_matches.values())
+            return rows, changed, digest
         except Exception as e:
-            print(f"[CONTACTS] Error syncing: {e}")
+            logger.exception("[CONTACTS] Error syncing: %s", e)
             db.session.rollback()
-            return [], False
+            return [], False, None
 
     def AddFriendRequest(sender_id, target_user_id=None, target_phone=None):
         """Create a Friend request record from sender_id to target (by id or phone).
@@ -126,7 +157,8 @@ def register_chat_events(socketio):
             if target_user_id:
                 target = User.query.get(int(target_user_id))
             elif target_phone:
-                target = User.query.filter_by(phone_number=target_phone).first()
+                phone = normalize_phone(target_phone)
+                target = User.query.filter_by(phone_number=phone).first() if phone else None
 
             if not target:
                 return False, 'target_not_found', None, None
@@ -142,7 +174,7 @@ def register_chat_events(socketio):
             db.session.commit()
             return True, 'created', fr, target.id
         except Exception as e:
-            print(f"[FRIENDS] Error creating friend request: {e}")
+            logger.exception("[FRIENDS] Error creating friend request: %s", e)
             db.session.rollback()
             return False, 'error', None, None
 
@@ -162,9 +194,11 @@ def register_chat_events(socketio):
             fr.status = 'accepted'
             db.session.commit()
             requester_id = fr.user_id
+            social_graph.invalidate(fr.user_id, fr.friend_id)
+            suggestions.friendship_added(fr.user_id, fr.friend_id)
             return True, 'accepted', fr, requester_id
         except Exception as e:
-            print(f"[FRIENDS] Error accepting friend request: {e}")
+            logger.exception("[FRIENDS] Error accepting friend request: %s", e)
             db.session.rollback()
             return False, 'error', None, None
 
@@ -183,12 +217,46 @@ def register_chat_events(socketio):
             # delete the pending request
             db.session.delete(fr)
             db.session.commit()
+            suggestions.relation_dropped(fr.user_id, fr.friend_id)
             return True, 'rejected', requester_id
         except Exception as e:
-            print(f"[FRIENDS] Error rejecting friend request: {e}")
+            logger.exception("[FRIENDS] Error rejecting friend request: %s", e)
             db.session.rollback()
             return False, 'error', None
 
+    def _friend_ids(user_id):
+        """Accepted friends of `user_id`, both directions."""
+        return set(social_graph.friends_of(as_user_id(user_id)))
+
+    def _notify_offline(user_ids):
+        """Tell friends that users whose grace period ran out went offline."""
+        for removed_uid in user_ids:
+            try:
+                for fid in _friend_ids(removed_uid):
+                    try:
+                        # emit to each friend's personal room; replaces a pending user_joined for the same user
+                        emit_buffer.emit('user_offline', {'user_id': removed_uid}, room=f'user-{fid}',
+                                         key=('presence', removed_uid))
+                    except Exception:
+                        logger.exception("Error emitting user_offline to user-%s", fid)
+            except Exception:
+                logger.exception('Error while emitting user_offline to friends of %s', removed_uid)
+        _publish_presence(user_ids, online=False)
+
+    def _publish_presence(user_ids, online):
+        """Persist User.status and send `presence_diff` to sockets subscribed to these users."""
+        try:
+            User.query.filter(User.id.in_([u for u in user_ids if isinstance(u, int)])).update(
+                {'status': 'online' if online else 'offline'}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception('Error updating status for %s users', len(user_ids))
+        for uid in user_ids:
+            diff = dict(presence.state(uid), user_id=uid)
+            for sid in presence.watchers_of(uid):
+                emit_buffer.emit('presence_diff', diff, room=sid, key=('presence', uid))
+
     @socketio.on('connect')
     def handle_connect():
         ip = request.remote_addr
@@ -199,20 +267,33 @@ def register_chat_events(socketio):
     def handle_join(data):
         """
         Expect data to include either:
-          - user_id: join user's personal room named `user-<id>`
-          - room: arbitrary room name (e.g., `group-<id>` or conversation room)
+          - user_id + token: join user's personal room named `user-<id>`; the
+            token must belong to that user
+          - room: arbitrary room name (e.g., `group-<id>` or conversation room),
+            never another user's personal room
         """
-        logger.info("[CHAT][JOIN] sid=%s data=%s", request.sid, data)
+        logger.debug("[CHAT][JOIN] sid=%s user_id=%s room=%s", request.sid, data.get('user_id'), data.get('room'))
         
         user_id = data.get('user_id')
         room = data.get('room')
         
+        came_online = False
         if user_id:
+            user_id = as_user_id(user_id)
+            token = data.get('token')
+            auth = decode_token(token) if token else None
+            if not auth or as_user_id(auth.get('user_id')) != user_id:
+                logger.warning("[JOIN] rejected join as user %s from sid=%s: invalid token", user_id, request.sid)
+                socketio.emit('join_error', {'error': 'Invalid token'}, room=request.sid)
+                return
             room_name = f'user-{user_id}'
-            # Store user_id -> sid mapping
-            user_sockets[user_id] = request.sid
-            logger.debug("Stored mapping: user_id=%s -> sid=%s", user_id, request.sid)
+            came_online = presence.attach(user_id, request.sid)
+            logger.debug("Registered presence: user_id=%s sid=%s came_online=%s", user_id, request.sid, came_online)
         elif room:
+            if not isinstance(room, str) or room.startswith('user-'):
+                logger.warning("[JOIN] rejected room %r from sid=%s", room, request.sid)
+                socketio.emit('join_error', {'error': 'Invalid room'}, room=request.sid)
+                return
             room_name = room
             logger.debug("Using explicit room: %s", room_name)
         else:
@@ -222,32 +303,30 @@ def register_chat_events(socketio):
             return
 
         join_room(room_name)
-        logger.info("User joined room: %s", room_name)
-        logger.debug("Current user_sockets mapping: %s", user_sockets)
-        
+        # clients that can unpack `batch` frames say so on join; a later join without
+        # the key (e.g. a conversation room join) keeps what the socket declared before
+        if 'capabilities' in data:
+            emit_buffer.set_capabilities(request.sid, data.get('capabilities'))
+        logger.debug("User joined room: %s", room_name)
+
         # Notify the user's own room (useful for multi-tab clients)
         socketio.emit('user_joined', {'user_id': user_id, 'room': room_name}, room=room_name)
 
-        # Additionally notify the user's friends that this user is online.
-        # Find all accepted friends and emit `user_joined` to their rooms so they can update presence.
+        # Additionally notify the user's friends that this user is online, unless friends
+        # still see them online (another tab, or a reconnect inside the grace period).
         try:
-            if user_id:
-                # collect friend ids in both directions
-                outgoing = Friend.query.filter_by(user_id=user_id, status='accepted').all() or []
-                incoming = Friend.query.filter_by(friend_id=user_id, status='accepted').all() or []
-                friend_ids = set()
-                for f in outgoing:
-                    friend_ids.add(f.friend_id)
-                for f in incoming:
-                    friend_ids.add(f.user_id)
-                for fid in friend_ids:
+            if user_id and came_online:
+                for fid in _friend_ids(user_id):
                     try:
-                        socketio.emit('user_joined', {'user_id': user_id}, room=f'user-{fid}')
+                        emit_buffer.emit('user_joined', {'user_id': user_id}, room=f'user-{fid}',
+                                         key=('presence', user_id))
                         logger.debug('Emitted user_joined for user %s to friend room user-%s', user_id, fid)
                     except Exception:
                         logger.exception('Error emitting user_joined to friend %s', fid)
         except Exception:
             logger.exception('Error while notifying friends about user_joined')
+        if user_id and came_online:
+            _publish_presence([user_id], online=True)
         logger.info("[JOIN] END - SUCCESS user=%s room=%s", user_id, room_name)
 
     @socketio.on('send_message')
@@ -265,10 +344,13 @@ def register_chat_events(socketio):
         # Extra diagnostic logging to help trace issues with emoji-only messages.
         # Log the Python repr, character length and UTF-8 byte length so we can
         # confirm whether the payload arrives empty or gets mangled by transport.
-        try:
-            logger.info("[CHAT][DEBUG] incoming content repr=%r char_len=%s utf8_bytes=%s", content, len(content) if content is not None else 0, len(content.encode('utf-8')) if content is not None else 0)
-        except Exception:
-            logger.exception("[CHAT][DEBUG] Error while logging incoming content")
+        # Goes through the sampled diag logger; the sampling decision comes first,
+        # so the repr and byte length are only computed for records that are kept.
+        if diag_sampled(logging.INFO):
+            try:
+                diag_logger.info("[CHAT][DEBUG] incoming content repr=%r char_len=%s utf8_bytes=%s", content, len(content) if content is not None else 0, len(content.encode('utf-8')) if isinstance(content, str) else 0, extra=DIAG_SAMPLED)
+            except Exception:
+                logger.exception("[CHAT][DEBUG] Error while logging incoming content")
 
         # Validate required fields. Treat None/absent content as invalid, but allow
         # non-empty strings (including emoji-only strings). This avoids rejecting
@@ -282,8 +364,6 @@ def register_chat_events(socketio):
             return
 
         try:
-            # Debug prints to stdout to make failures visible in dev terminal
-            print(f"[DEBUG SEND_MESSAGE] received sender={sender_id} receiver={receiver_id} client_msg_id={client_message_id} content_repr={repr(content)}")
             # Check block list: TWO-WAY check
             # Kiểm tra: (1) receiver đã chặn sender, (2) sender đã chặn receiver
             try:
@@ -314,38 +394,27 @@ def register_chat_events(socketio):
                     socketio.emit('message_sent_ack', ack_data, room=request.sid)
                 return
             # Save message to DB
-            print('[DEBUG SEND_MESSAGE] attempting to save to DB...')
             msg = Message(sender_id=sender_id, receiver_id=receiver_id, content=content)
             db.session.add(msg)
             db.session.commit()
-            print('[DEBUG SEND_MESSAGE] DB commit succeeded, msg.id=', getattr(msg, 'id', None))
-            logger.info("Message saved to DB: message_id=%s timestamp=%s", msg.id, msg.timestamp)
+            logger.debug("Message saved to DB: message_id=%s timestamp=%s", msg.id, msg.timestamp)
+        except OperationalError as e:
+            # transient (`database is locked`): park it in the dead-letter journal; the
+            # retrier acks 'queued' once it is on disk and 'sent' after the replay
+            db.session.rollback()
+            entry_id = dead_letters.append(sid=request.sid, sender_id=sender_id, receiver_id=receiver_id,
+                                           content=content, client_message_id=client_message_id,
+                                           reply_to_id=reply_to_id, forward_from_id=forward_from_id)
+            if entry_id:
+                logger.warning("Message from %s to %s journaled for retry (%s): %s", sender_id, receiver_id, entry_id, e.orig)
+                return
+            logger.error("Dead-letter journal unavailable or full; message from %s to %s lost: %s", sender_id, receiver_id, e.orig)
+            if client_message_id:
+                ack_data = {'client_message_id': client_message_id, 'status': 'error', 'error_detail': str(e.orig)}
+                socketio.emit('message_sent_ack', ack_data, room=request.sid)
+            return
         except Exception as e:
-            # Log exception to logger and also persist a traceback to a file for easier debugging
             logger.exception("Error saving message to DB: %s", str(e))
-            try:
-                # write to /tmp for convenience
-                with open('/tmp/chat_save_error.log', 'a', encoding='utf-8') as fh:
-                    fh.write('\n--- Chat save error ---\n')
-                    fh.write(f"time: {__import__('datetime').datetime.utcnow().isoformat()}\n")
-                    fh.write(f"sender_id={sender_id} receiver_id={receiver_id} client_message_id={client_message_id}\n")
-                    fh.write(f"content repr: {repr(content)}\n")
-                    fh.write('traceback:\n')
-                    fh.write(traceback.format_exc())
-                    fh.write('\n-----------------------\n')
-                # also write a copy into project server folder so the repo tools can read it
-                proj_path = os.path.join(os.path.dirname(__file__), '..', 'chat_save_error.log')
-                with open(proj_path, 'a', encoding='utf-8') as fh2:
-                    fh2.write('\n--- Chat save error (project) ---\n')
-                    fh2.write(f"time: {__import__('datetime').datetime.utcnow().isoformat()}\n")
-                    fh2.write(f"sender_id={sender_id} receiver_id={receiver_id} client_message_id={client_message_id}\n")
-                    fh2.write(f"content repr: {repr(content)}\n")
-                    fh2.write('traceback:\n')
-                    fh2.write(traceback.format_exc())
-                    fh2.write('\n-----------------------\n')
-            except Exception:
-                logger.exception('Failed to write chat_save_error.log')
-
             db.session.rollback()
             # Notify sender of failure if client id provided
             if client_message_id:
@@ -354,16 +423,7 @@ def register_chat_events(socketio):
             return
 
         # Prepare message data to broadcast
-        message_data = {
-            'id': msg.id,
-            'sender_id': sender_id,
-            'receiver_id': receiver_id,
-            'content': content,
-            'timestamp': msg.timestamp.isoformat(),
-            'status': 'sent',
-            'reply_to_id': reply_to_id,
-            'forward_from_id': forward_from_id,
-        }
+        message_data = dead_letter_message_data(msg, reply_to_id, forward_from_id)
 
         # Send ACK back to sender (to confirm message saved with real ID)
         if client_message_id:
@@ -376,7 +436,7 @@ def register_chat_events(socketio):
         logger.debug("Emitting to receiver room '%s'", receiver_room)
         try:
             socketio.emit('receive_message', message_data, room=receiver_room)
-            logger.info("Emitted message_id=%s to %s", msg.id, receiver_room)
+            logger.debug("Emitted message_id=%s to %s", msg.id, receiver_room)
         except Exception as e:
             logger.exception("Error emitting to %s: %s", receiver_room, str(e))
 
@@ -395,6 +455,12 @@ def register_chat_events(socketio):
             return
 
         try:
+            # the message may already live in an archive partition
+            msg = find_message(message_id)
+            if msg is not None and getattr(msg, 'recalled', False):
+                logger.debug("Ignoring reaction on recalled message=%s", message_id)
+                return
+
             # avoid duplicate same-reaction by same user
             exists = MessageReaction.query.filter_by(message_id=message_id, user_id=user_id, reaction_type=reaction).first()
             if exists:
@@ -404,7 +470,7 @@ def register_chat_events(socketio):
             mr = MessageReaction(message_id=message_id, user_id=user_id, reaction_type=reaction)
             db.session.add(mr)
             db.session.commit()
-            logger.info("Saved reaction for message=%s by user=%s reaction=%s", message_id, user_id, reaction)
+            logger.debug("Saved reaction for message=%s by user=%s reaction=%s", message_id, user_id, reaction)
 
             # Aggregate reactions for this message
             reactions = MessageReaction.query.filter_by(message_id=message_id).all()
@@ -413,7 +479,6 @@ def register_chat_events(socketio):
                 agg.setdefault(r.reaction_type, []).append(r.user_id)
 
             # Emit aggregated reactions to interested parties (sender & receiver rooms)
-            msg = Message.query.get(message_id)
             target_rooms = set()
             if msg:
                 target_rooms.add(f'user-{msg.sender_id}')
@@ -429,7 +494,7 @@ def register_chat_events(socketio):
             if target_rooms:
                 for r in target_rooms:
                     try:
-                        socketio.emit('message_reaction', payload, room=r)
+                        emit_buffer.emit('message_reaction', payload, room=r, key=('reaction', message_id))
                         logger.debug("Emitted message_reaction to room=%s", r)
                     except Exception:
                         logger.exception("Error emitting reaction to room %s", r)
@@ -449,11 +514,10 @@ def register_chat_events(socketio):
         sticker_url = data.get('sticker_url')  # URL for sticker image
         client_message_id = data.get('client_message_id')
         
-        print(f"[CHAT][NHẬN] [STICKER] sender={sender_id} receiver={receiver_id} sticker_id={sticker_id}")
+        logger.debug("[CHAT][RECV] send_sticker sender=%s receiver=%s sticker_id=%s", sender_id, receiver_id, sticker_id)
         
         if not sender_id or not receiver_id or not sticker_url:
-            print(f"[ERROR] Missing required fields for sticker")
-            print("[STICKER] END - FAILED\n")
+            logger.warning("Missing required fields for send_sticker: sender=%s receiver=%s sticker_url=%s", sender_id, receiver_id, sticker_url)
             return
         
         try:
@@ -468,11 +532,10 @@ def register_chat_events(socketio):
             )
             db.session.add(msg)
             db.session.commit()
-            print(f"[CHAT][GỬI] ✅ Sticker saved to DB: message_id={msg.id}")
+            logger.debug("Sticker saved to DB: message_id=%s", msg.id)
         except Exception as e:
-            print(f"[ERROR] ❌ ERROR saving sticker to DB: {e}")
+            logger.exception("Error saving sticker to DB: %s", str(e))
             db.session.rollback()
-            print("[STICKER] END - FAILED (DB save)\n")
             return
         
         # Prepare sticker message data
@@ -494,19 +557,16 @@ def register_chat_events(socketio):
                 'message_id': msg.id,
                 'status': 'sent',
             }
-            print(f"[CHAT][GỬI] 📋 Sending ACK for sticker to sender: {ack_data}")
             socketio.emit('message_sent_ack', ack_data, room=request.sid)
+            logger.debug("Sent ACK for sticker to sender: %s", ack_data)
         
         # Broadcast to receiver's room
         receiver_room = f'user-{receiver_id}'
-        print(f"[CHAT][GỬI] 📤 Emitting sticker to receiver room '{receiver_room}'...")
         try:
             socketio.emit('receive_message', sticker_data, room=receiver_room)
-            print(f"[CHAT][GỬI] ✅ Sticker emitted to {receiver_room}")
+            logger.debug("Emitted sticker message_id=%s to %s", msg.id, receiver_room)
         except Exception as e:
-            print(f"[ERROR] ❌ ERROR emitting sticker to {receiver_room}: {e}")
-        
-        print("[CHAT][GỬI] [STICKER] END - SUCCESS")
+            logger.exception("Error emitting sticker to %s: %s", receiver_room, str(e))
 
     @socketio.on('send_file_message')
     def handle_send_file_message(data):
@@ -562,7 +622,7 @@ def register_chat_events(socketio):
             )
             db.session.add(msg)
             db.session.commit()
-            logger.info("File message saved to DB: message_id=%s file=%s", msg.id, file_name)
+            logger.debug("File message saved to DB: message_id=%s file=%s", msg.id, file_name)
         except Exception as e:
             logger.exception("Error saving file message to DB: %s", str(e))
             db.session.rollback()
@@ -597,7 +657,7 @@ def register_chat_events(socketio):
         logger.debug("Emitting file message to receiver room '%s'", receiver_room)
         try:
             socketio.emit('receive_message', message_data, room=receiver_room)
-            logger.info("Emitted file message_id=%s to %s", msg.id, receiver_room)
+            logger.debug("Emitted file message_id=%s to %s", msg.id, receiver_room)
         except Exception as e:
             logger.exception("Error emitting file message to %s: %s", receiver_room, str(e))
 
@@ -610,15 +670,12 @@ def register_chat_events(socketio):
         receiver_id = data.get('receiver_id')
         is_typing = data.get('is_typing', False)
         
-        print(f"[CHAT][NHẬN] [TYPING] sender={sender_id} receiver={receiver_id} typing={is_typing}")
-        
         # Send to receiver only
         receiver_room = f'user-{receiver_id}'
         socketio.emit('user_typing', {
             'sender_id': sender_id,
             'is_typing': is_typing
         }, room=receiver_room)
-        print(f"[CHAT][GỬI] user_typing -> room={receiver_room}")
 
     @socketio.on('command')
     def handle_command(payload):
@@ -627,7 +684,8 @@ def register_chat_events(socketio):
         Responds with event 'command_response' and a JSON body containing status/action/data.
         """
         try:
-            print(f"[CHAT][NHẬN] [COMMAND] from sid={request.sid} payload={payload}")
+            # Never log the whole payload: it carries the JWT and contact lists.
+            logger.debug("[CHAT][RECV] command sid=%s action=%s", request.sid, payload.get('action') if isinstance(payload, dict) else None)
             if not payload or not isinstance(payload, dict):
                 socketio.emit('command_response', {'status': 'ERROR', 'action': None, 'error': 'Invalid payload'}, room=request.sid)
                 return
@@ -642,7 +700,6 @@ def register_chat_events(socketio):
                 user_id = auth.get('user_id')
                 contacts = GetContactsList(user_id)
                 socketio.emit('command_response', {'status': 'SUCCESS', 'action': 'CONTACTS_LIST_RESULT', 'data': contacts}, room=request.sid)
-                print(f"[CHAT][GỬI] [COMMAND] CONTACTS_LIST_RESULT sent to sid={request.sid}")
                 return
 
             if action == 'FRIEND_REQUEST':
@@ -668,9 +725,8 @@ def register_chat_events(socketio):
                 try:
                     target_room = f'user-{target_id}'
                     socketio.emit('friend_request_received', {'event': 'FRIEND_REQUEST_RECEIVED', 'from_user': str(sender_id)}, room=target_room)
-                    print(f"[CHAT][GỬI] Friend request real-time -> room={target_room}")
                 except Exception as e:
-                    print(f"[FRIENDS] Error emitting real-time notify: {e}")
+                    logger.exception("[FRIENDS] Error emitting real-time notify: %s", e)
 
                 return
 
@@ -702,7 +758,7 @@ def register_chat_events(socketio):
                     target_room = f'user-{target_id}'
                     socketio.emit('user_blocked', {'event': 'USER_BLOCKED', 'by_user': str(user_id)}, room=target_room)
                 except Exception as e:
-                    print(f"[BLOCK] error notifying target: {e}")
+                    logger.exception("[BLOCK] error notifying target: %s", e)
                 return
 
             if action == 'UNBLOCK_USER':
@@ -753,9 +809,8 @@ def register_chat_events(socketio):
                     try:
                         requester_room = f'user-{requester_id}'
                         socketio.emit('friend_request_accepted', {'event': 'FRIEND_ACCEPTED', 'user_id': str(actor_id)}, room=requester_room)
-                        print(f"[CHAT][GỬI] Friend accepted notify -> room={requester_room}")
                     except Exception as e:
-                        print(f"[FRIENDS] Error emitting accepted notify: {e}")
+                        logger.exception("[FRIENDS] Error emitting accepted notify: %s", e)
                     return
 
                 if action == 'FRIEND_REJECT':
@@ -767,9 +822,8 @@ def register_chat_events(socketio):
                     try:
                         requester_room = f'user-{requester_id}'
                         socketio.emit('friend_request_rejected', {'event': 'FRIEND_REJECTED', 'user_id': str(actor_id)}, room=requester_room)
-                        print(f"[CHAT][GỬI] Friend rejected notify -> room={requester_room}")
                     except Exception as e:
-                        print(f"[FRIENDS] Error emitting rejected notify: {e}")
+                        logger.exception("[FRIENDS] Error emitting rejected notify: %s", e)
                     return
 
             if action == 'CONTACTS_SYNC':
@@ -780,21 +834,29 @@ def register_chat_events(socketio):
                     return
                 user_id = auth.get('user_id')
                 data = payload.get('data') or {}
-                contacts = data.get('contacts') or []
-                matches, changed = SyncContacts(user_id, contacts)
-                socketio.emit('command_response', {'status': 'SUCCESS', 'action': 'CONTACTS_SYNC_RESULT', 'friends': matches}, room=request.sid)
+                # full list: {contacts: [...]}; deltas: {hash, added: [...], removed: [...]}
+                if data.get('contacts') is not None or not data.get('hash'):
+                    matches, changed, digest = SyncContacts(user_id, contacts=data.get('contacts') or [])
+                else:
+                    matches, changed, digest = SyncContacts(user_id, added=data.get('added'), removed=data.get('removed'),
+                                                            base_hash=data.get('hash'))
+                if matches is None:
+                    socketio.emit('command_response', {'status': 'ERROR', 'action': 'CONTACTS_SYNC_RESULT', 'error': 'hash_mismatch',
+                                                       'resync': True, 'hash': digest}, room=request.sid)
+                    return
+                socketio.emit('command_response', {'status': 'SUCCESS', 'action': 'CONTACTS_SYNC_RESULT', 'friends': matches, 'hash': digest}, room=request.sid)
                 if changed:
                     # emit contact updated event to user room
                     try:
                         socketio.emit('contact_updated', {'event': 'CONTACT_UPDATED', 'data': matches}, room=request.sid)
                     except Exception as e:
-                        print(f"[CONTACTS] Error emitting update: {e}")
+                        logger.exception("[CONTACTS] Error emitting update: %s", e)
                 return
 
             # Unknown action
             socketio.emit('command_response', {'status': 'ERROR', 'action': action, 'error': 'Unknown action'}, room=request.sid)
         except Exception as e:
-            print(f"[COMMAND] Error handling command: {e}")
+            logger.exception("[COMMAND] Error handling command: %s", e)
             socketio.emit('command_response', {'status': 'ERROR', 'action': None, 'error': 'Server error'}, room=request.sid)
 
     @socketio.on('edit_message')
@@ -803,21 +865,23 @@ def register_chat_events(socketio):
         message_id = data.get('message_id')
         user_id = data.get('user_id')
         new_content = data.get('new_content')
-        print(f"[CHAT][NHẬN] [EDIT] message_id={message_id} user={user_id}")
+        logger.debug("[CHAT][RECV] edit_message message_id=%s user=%s", message_id, user_id)
         if not message_id or not user_id or new_content is None:
-            print('[EDIT] Missing fields')
+            logger.warning("[EDIT] Missing fields: message_id=%s user_id=%s", message_id, user_id)
             return
         try:
-            msg = Message.query.get(message_id)
+            # may be an archived row; update_message writes it back to its partition
+            msg = find_message(message_id)
             if not msg:
-                print('[EDIT] Message not found')
+                logger.warning("[EDIT] Message not found: message_id=%s", message_id)
                 return
             if int(msg.sender_id) != int(user_id):
-                print('[EDIT] User not owner of message')
+                logger.warning("[EDIT] User %s not owner of message %s", user_id, message_id)
+                return
+            if msg.recalled:
+                logger.warning("[EDIT] Message %s was recalled", message_id)
                 return
-            msg.content = new_content
-            from datetime import datetime
-            msg.timestamp = datetime.utcnow()
+            msg = update_message(msg, content=new_content, timestamp=datetime.utcnow())
             db.session.commit()
             # Emit update to participants
             target_rooms = [f'user-{msg.sender_id}', f'user-{msg.receiver_id}']
@@ -830,75 +894,92 @@ def register_chat_events(socketio):
                 try:
                     socketio.emit('message_edited', payload, room=r)
                 except Exception as e:
-                    print(f'[EDIT] Error emitting to {r}: {e}')
-            print('[EDIT] Success')
+                    logger.exception("[EDIT] Error emitting to %s: %s", r, e)
+            logger.debug("[EDIT] Success message_id=%s", message_id)
         except Exception as e:
             db.session.rollback()
-            print('[EDIT] Error:', e)
+            logger.exception("[EDIT] Error: %s", e)
 
     @socketio.on('recall_message')
     def handle_recall_message(data):
-        """Allow sender to recall (delete) a message. data: { message_id, user_id }"""
+        """Allow sender to recall a message. data: { message_id, user_id }
+
+        The row stays as a tombstone (`recalled`, `recalled_at`, blank content)
+        so history and `GET /messages?since=` tell clients that were offline;
+        its reactions and attachment are removed later by the recall sweeper
+        (services/message_sweeper.py).
+        """
         message_id = data.get('message_id')
         user_id = data.get('user_id')
-        print(f"[CHAT][NHẬN] [RECALL] message_id={message_id} user={user_id}")
+        logger.debug("[CHAT][RECV] recall_message message_id=%s user=%s", message_id, user_id)
         if not message_id or not user_id:
-            print('[RECALL] Missing fields')
+            logger.warning("[RECALL] Missing fields: message_id=%s user_id=%s", message_id, user_id)
             return
         try:
-            msg = Message.query.get(message_id)
+            msg = find_message(message_id)
             if not msg:
-                print('[RECALL] Message not found')
+                logger.warning("[RECALL] Message not found: message_id=%s", message_id)
                 return
             if int(msg.sender_id) != int(user_id):
-                print('[RECALL] User not owner of message')
+                logger.warning("[RECALL] User %s not owner of message %s", user_id, message_id)
                 return
-            # Simple recall: delete row from DB
-            db.session.delete(msg)
-            db.session.commit()
-            payload = {'message_id': message_id}
+            if not msg.recalled:
+                msg = update_message(msg, recalled=True, recalled_at=datetime.utcnow(), content='',
+                                     sticker_id=None, sticker_url=None)
+                db.session.commit()
+            payload = {'message_id': msg.id, 'recalled_at': msg.recalled_at.isoformat()}
             target_rooms = [f'user-{user_id}', f'user-{msg.receiver_id}']
             for r in set(target_rooms):
                 try:
                     socketio.emit('message_recalled', payload, room=r)
                 except Exception as e:
-                    print(f'[RECALL] Error emitting to {r}: {e}')
-            print('[RECALL] Success')
+                    logger.exception("[RECALL] Error emitting to %s: %s", r, e)
+            logger.debug("[RECALL] Success message_id=%s", message_id)
         except Exception as e:
             db.session.rollback()
-            print('[RECALL] Error:', e)
+            logger.exception("[RECALL] Error: %s", e)
+
+    @socketio.on('presence_subscribe')
+    def handle_presence_subscribe(data):
+        """Watch friends' presence. data: { ids: [user ids] }; needs an authenticated `join` first.
+
+        Replies with one `presence_snapshot` { presence: { "<id>": {online, last_seen} } }
+        and then sends `presence_diff` { user_id, online, last_seen } on every change.
+        """
+        caller = presence.user_of(request.sid)
+        if caller is None:
+            socketio.emit('presence_snapshot', {'presence': {}, 'error': 'join first'}, room=request.sid)
+            return
+        raw = (data or {}).get('ids')
+        friends = social_graph.friends_of(caller)
+        ids = [uid for uid in map(as_user_id, raw if isinstance(raw, list) else [])
+               if isinstance(uid, int) and uid in friends]
+        watching = presence.subscribe(request.sid, ids)
+        socketio.emit('presence_snapshot', {'presence': presence.snapshot(watching)}, room=request.sid)
+        logger.debug("[PRESENCE] sid=%s subscribed to %s users", request.sid, len(watching))
+
+    @socketio.on('presence_unsubscribe')
+    def handle_presence_unsubscribe(data=None):
+        """Stop watching. data: { ids: [user ids] } or nothing to drop every subscription."""
+        ids = (data or {}).get('ids')
+        if ids and isinstance(ids, list):
+            presence.unsubscribe(request.sid, [uid for uid in map(as_user_id, ids) if isinstance(uid, int)])
+        else:
+            presence.unsubscribe(request.sid)
 
     @socketio.on('disconnect')
     def handle_disconnect(data=None):
-        print(f"[CHAT][NHẬN] [DISCONNECT] sid={request.sid}")
-        # Remove user_id from mapping on disconnect
-        for uid, sid in list(user_sockets.items()):
-            if sid == request.sid:
-                # remove mapping and remember uid for notifying friends
-                del user_sockets[uid]
-                removed_uid = uid
-                print(f"[CHAT][NHẬN] ✅ Removed user_id={uid} from mapping")
-                break
-        # Notify friends that the user went offline (if we know which user was removed)
-        try:
-            if 'removed_uid' in locals():
-                # Find friends in both directions
-                outgoing = Friend.query.filter_by(user_id=removed_uid, status='accepted').all() or []
-                incoming = Friend.query.filter_by(friend_id=removed_uid, status='accepted').all() or []
-                friend_ids = set()
-                for f in outgoing:
-                    friend_ids.add(f.friend_id)
-                for f in incoming:
-                    friend_ids.add(f.user_id)
-                for fid in friend_ids:
-                    try:
-                        # emit to each friend's personal room
-                        socketio.emit('user_offline', {'user_id': removed_uid}, room=f'user-{fid}')
-                        print(f"[CHAT][GỬI] user_offline emitted for {removed_uid} to user-{fid}")
-                    except Exception:
-                        print(f"[CHAT][GỬI] Error emitting user_offline to user-{fid}")
-            # also broadcast a generic offline event for compatibility
-            emit('user_offline', {'sid': request.sid}, broadcast=True)
-        except Exception:
-            print('[CHAT] Error while emitting user_offline to friends')
-        print("[CHAT][GỬI] [DISCONNECT] END")
\ No newline at end of file
+        logger.debug("[CHAT][DISCONNECT] sid=%s", request.sid)
+        emit_buffer.forget(request.sid)
+        leave_calls_of_sid(socketio, request.sid)
+        presence.unsubscribe(request.sid)
+        removed_uid, last = presence.detach(request.sid)
+        if removed_uid is None or not last:
+            return
+        if presence.grace > 0:
+            # tentative: a reconnect within the grace period cancels the offline notice
+            presence.start_sweeper(socketio, current_app._get_current_object(), _notify_offline)
+            logger.debug("User %s offline pending (%ss grace)", removed_uid, presence.grace)
+        else:
+            presence.mark_offline_now(removed_uid)
+            _notify_offline([removed_uid])
@@ -1,7 +1,183 @@
+"""WebRTC call lifecycle and targeted `signal` relay (see services/call_sessions.py).
+
+Sockets must have sent `join` with their user id and token first; the
+caller's identity comes from the presence registry, not from the payload.
+1:1 calls only ring friends, and never across a block in either direction.
+
+Client -> server:
+  call_start   { to: user_id } or { group_id }    -> call_started { call_id, invited, ... } to the caller
+  call_accept  { call_id }
+  call_reject  { call_id }
+  call_leave   { call_id }
+  signal       { call_id, to?: user_id, ... }   offer / answer / ICE candidate
+
+Server -> client:
+  call_incoming  { call_id, initiator, group_id, participants, invited } to each rung user's room
+  call_accepted  { call_id, user_id }  to the participants and the accepting user's other tabs
+  call_rejected  { call_id, user_id }  likewise, for rejections and ring timeouts (`timeout: true`)
+  call_left      { call_id, user_id }  to the remaining participants
+  call_ended     { call_id, reason }   to everyone still in or being rung for the call
+  call_error     { call_id, error }    to the requesting socket
+  signal         { ...frame, call_id, from_user_id }  to the other participants, or only `to`
+"""
+import logging
+
+from flask import request
 from flask_socketio import emit
 
+from services.call_sessions import CallError, call_registry
+from services.emit_buffer import emit_buffer
+from services.presence import as_user_id, presence
+
+logger = logging.getLogger(__name__)
+
+
+def _group_invitees(group_id, caller_id):
+    from models.group_model import GroupMember
+    members = [uid for (uid,) in GroupMember.query.with_entities(GroupMember.user_id).filter_by(group_id=group_id)]
+    if caller_id not in members:
+        raise CallError('not_a_member')
+    return members
+
+
+def _peer_invitee(caller_id, to):
+    from models.block_model import Block
+    from services.social_graph import social_graph
+    peer = as_user_id(to)
+    if not isinstance(peer, int) or peer == caller_id:
+        raise CallError('bad_peer')
+    if Block.query.filter(((Block.user_id == caller_id) & (Block.target_id == peer)) |
+                          ((Block.user_id == peer) & (Block.target_id == caller_id))).first():
+        raise CallError('blocked')
+    if not social_graph.is_friend(caller_id, peer):
+        raise CallError('not_a_friend')
+    return peer
+
+
+def _announce_end(socketio, call, reason):
+    payload = {'call_id': call.id, 'reason': reason}
+    for sid in call.participants.values():
+        socketio.emit('call_ended', payload, room=sid)
+    for uid in call.invited:
+        socketio.emit('call_ended', payload, room=f'user-{uid}')
+    logger.debug('[CALLS] call %s ended (%s)', call.id, reason)
+
+
+def _announce_left(socketio, call, user_id, ended, reason):
+    if ended:
+        _announce_end(socketio, call, reason)
+        return
+    for sid in call_registry.participant_sids(call):
+        socketio.emit('call_left', {'call_id': call.id, 'user_id': user_id}, room=sid)
+
+
+def leave_calls_of_sid(socketio, sid):
+    """Disconnect hook: take a socket out of its calls and tell the peers."""
+    for call, user_id, ended in call_registry.drop_sid(sid):
+        _announce_left(socketio, call, user_id, ended, 'disconnected')
+
+
 def register_signaling_events(socketio):
+    def _expired(results):
+        for call, user_ids, ended in results:
+            for uid in user_ids:
+                payload = {'call_id': call.id, 'user_id': uid, 'timeout': True}
+                socketio.emit('call_rejected', payload, room=f'user-{uid}')
+                for sid in call_registry.participant_sids(call):
+                    socketio.emit('call_rejected', payload, room=sid)
+            if ended:
+                _announce_end(socketio, call, 'no_answer')
+
+    def _caller():
+        user_id = presence.user_of(request.sid)
+        if user_id is None:
+            raise CallError('join_first')
+        return user_id
+
+    def _error(data, e):
+        emit('call_error', {'call_id': (data or {}).get('call_id'), 'error': e.code})
+
+    @socketio.on('call_start')
+    def handle_call_start(data):
+        """Ring a user ({ to }) or the members of a group ({ group_id })."""
+        data = data or {}
+        try:
+            caller_id = _caller()
+            group_id = data.get('group_id')
+            if group_id:
+                group_id = as_user_id(group_id)
+                if not isinstance(group_id, int):
+                    raise CallError('bad_group')
+                invitees = _group_invitees(group_id, caller_id)
+            else:
+                invitees = [_peer_invitee(caller_id, data['to'])] if data.get('to') is not None else []
+            call = call_registry.start(caller_id, request.sid, invitees, group_id=group_id)
+        except CallError as e:
+            _error(data, e)
+            return
+        call_registry.start_sweeper(socketio, _expired)
+        info = call.to_dict()
+        for uid in call.invited:
+            socketio.emit('call_incoming', info, room=f'user-{uid}')
+        emit('call_started', info)
+        logger.debug('[CALLS] %s rings %s (call %s)', caller_id, sorted(call.invited), call.id)
+
+    @socketio.on('call_accept')
+    def handle_call_accept(data):
+        data = data or {}
+        try:
+            user_id = _caller()
+            call = call_registry.accept(data.get('call_id'), user_id, request.sid)
+        except CallError as e:
+            _error(data, e)
+            return
+        payload = {'call_id': call.id, 'user_id': user_id}
+        for sid in call_registry.participant_sids(call, exclude=user_id):
+            socketio.emit('call_accepted', payload, room=sid)
+        # the user's other tabs stop ringing
+        socketio.emit('call_accepted', payload, room=f'user-{user_id}', skip_sid=request.sid)
+        emit('call_started', call.to_dict())
+
+    @socketio.on('call_reject')
+    def handle_call_reject(data):
+        data = data or {}
+        try:
+            user_id = _caller()
+            call, ended = call_registry.reject(data.get('call_id'), user_id)
+        except CallError as e:
+            _error(data, e)
+            return
+        payload = {'call_id': call.id, 'user_id': user_id}
+        socketio.emit('call_rejected', payload, room=f'user-{user_id}')
+        if ended:
+            _announce_end(socketio, call, 'rejected')
+            return
+        for sid in call_registry.participant_sids(call):
+            socketio.emit('call_rejected', payload, room=sid)
+
+    @socketio.on('call_leave')
+    def handle_call_leave(data):
+        data = data or {}
+        try:
+            user_id = _caller()
+            call, ended = call_registry.leave(data.get('call_id'), user_id)
+        except CallError as e:
+            _error(data, e)
+            return
+        _announce_left(socketio, call, user_id, ended, 'hangup')
+        emit('call_ended', {'call_id': call.id, 'reason': 'hangup'})
+
     @socketio.on('signal')
     def handle_signal(data):
-        # For future WebRTC or signaling events
-        emit('signal', data, broadcast=True)
+        """Relay a WebRTC frame to the peers of the sender's call only."""
+        data = data or {}
+        try:
+            user_id = _caller()
+            to = as_user_id(data['to']) if data.get('to') is not None else None
+            rooms = call_registry.signal_rooms(data.get('call_id'), user_id, to)
+        except CallError as e:
+            _error(data, e)
+            return
+        frame = dict(data, from_user_id=user_id)
+        for room in rooms:
+            emit_buffer.emit('signal', frame, room=room)
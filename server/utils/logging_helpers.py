@@ -1,49 +1,226 @@
-"""Logging helpers: deduplication filter to reduce repeated log noise.
+"""Logging helpers: deduplication, sampling and a non-blocking queue pipeline.
 
-This module provides a LoggingDedupFilter which suppresses identical
-log records that occur within a short timeframe (window seconds).
+This module provides:
+- LoggingDedupFilter which suppresses identical log records that occur
+  within a short timeframe (window seconds), using a bounded LRU store.
+- SamplingFilter which lets through only a fraction of the records of a
+  (high volume) diagnostics logger, and diag_sampled() to take that decision
+  before building expensive log arguments.
+- configure_logging() which routes every record through a QueueHandler so
+  the calling thread (socket handlers, request handlers) only pays for a
+  queue put; a QueueListener thread does the actual stdout/file writes.
 
-Usage: attach filter to the root logger in `server/app.py`:
-    from utils.logging_helpers import LoggingDedupFilter
-    root_logger.addFilter(LoggingDedupFilter(window_seconds=5))
+Usage: call once from `server/app.py`:
+    from utils.logging_helpers import configure_logging
+    configure_logging(level='INFO', dedup_seconds=5)
 
-Configuration via env var `LOG_DEDUP_SECONDS` (default 5).
+Configuration via env vars `LOG_LEVEL`, `LOG_DEDUP_SECONDS` (default 5),
+`LOG_FILE` (optional), `LOG_QUEUE_SIZE` (default 10000) and
+`LOG_DIAG_SAMPLE_EVERY` (default 100, 1 logs every diagnostic record) and
+`LOG_DEDUP_MAX_ENTRIES` (default 2048).
 """
 from __future__ import annotations
 
-import time
+import atexit
+import itertools
 import logging
+import logging.handlers
+import queue
+import time
 import threading
+from collections import OrderedDict
 from typing import Dict
 
+# Logger used for per-message diagnostics on the socket hot path. Records
+# sent here are sampled (see SamplingFilter) so they never flood the queue.
+DIAG_LOGGER_NAME = 'chat.diag'
+# `extra` for records whose sampling decision was already taken by diag_sampled()
+DIAG_SAMPLED = {'diag_sampled': True}
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_listener: logging.handlers.QueueListener | None = None
+_queue_handler: NonBlockingQueueHandler | None = None
+_dedup_filter: LoggingDedupFilter | None = None
+
 
 class LoggingDedupFilter(logging.Filter):
     """Suppress identical log messages that recur within window_seconds.
 
-    The filter key is built from (levelno, name, pathname, lineno, msg).
-    Identical records within the window are suppressed (return False).
+    The filter key is a hash of (levelno, name, lineno, msg template, args);
+    the message is never formatted here. Keys live in a size bounded LRU
+    (`max_entries`) and expire after the window, so unique messages (ids,
+    sids, content) cannot grow the store without limit. The number of
+    suppressed records is available via `suppressed` and `stats()`.
     """
 
-    def __init__(self, name: str | None = None, window_seconds: int = 5):
+    def __init__(self, name: str | None = None, window_seconds: int = 5, max_entries: int = 2048):
         # logging.Filter expects a string name ('' for root); ensure we pass a string
         super().__init__(name or "")
         self.window_seconds = float(window_seconds)
-        self._last_seen: Dict[str, float] = {}
+        self.max_entries = max(1, int(max_entries))
+        self.suppressed = 0
+        self._last_seen: OrderedDict[int, float] = OrderedDict()
         self._lock = threading.Lock()
 
+    @staticmethod
+    def _key(record: logging.LogRecord) -> int:
+        try:
+            return hash((record.levelno, record.name, record.lineno, record.msg, record.args))
+        except TypeError:
+            # unhashable args (dicts/lists): fall back to their repr
+            return hash((record.levelno, record.name, record.lineno, str(record.msg), repr(record.args)))
+
     def filter(self, record: logging.LogRecord) -> bool:
+        if self.window_seconds <= 0:
+            return True
         try:
-            key = f"{record.levelno}:{record.name}:{record.pathname}:{record.lineno}:{record.getMessage()}"
+            key = self._key(record)
         except Exception:
             # If building key fails, allow the record through
             return True
 
-        now = time.time()
+        now = time.monotonic()
+        # The critical section is a couple of O(1) dict operations.
         with self._lock:
             last = self._last_seen.get(key)
-            if last is None or (now - last) >= self.window_seconds:
-                # update last seen and allow
-                self._last_seen[key] = now
-                return True
-            # suppressed
-            return False
+            if last is not None and (now - last) < self.window_seconds:
+                self.suppressed += 1
+                return False
+            self._last_seen[key] = now
+            self._last_seen.move_to_end(key)
+            # evict the oldest entries once over capacity, and expired ones at the head
+            while self._last_seen:
+                oldest_key, oldest_ts = next(iter(self._last_seen.items()))
+                if len(self._last_seen) > self.max_entries or (now - oldest_ts) >= self.window_seconds:
+                    self._last_seen.popitem(last=False)
+                else:
+                    break
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        """Return counters for reporting: suppressed records and tracked keys."""
+        return {'suppressed': self.suppressed, 'tracked': len(self._last_seen)}
+
+
+class SamplingFilter(logging.Filter):
+    """Let through one record out of every `every` records.
+
+    WARNING and above are never sampled away. `every <= 1` disables sampling.
+    Records logged with `extra=DIAG_SAMPLED` were sampled up front (see
+    diag_sampled) and pass. `next()` on an itertools.count is atomic under
+    the GIL, so no lock is needed.
+    """
+
+    def __init__(self, name: str | None = None, every: int = 100):
+        super().__init__(name or "")
+        self.every = max(1, int(every))
+        self._counter = itertools.count()
+
+    def sample(self) -> bool:
+        return self.every == 1 or next(self._counter) % self.every == 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or getattr(record, 'diag_sampled', False):
+            return True
+        return self.sample()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full.
+
+    The number of dropped records is kept in `dropped` so it can be reported.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def get_diag_logger() -> logging.Logger:
+    """Return the sampled diagnostics logger for per-message hot path logging."""
+    return logging.getLogger(DIAG_LOGGER_NAME)
+
+
+def diag_sampled(level: int = logging.INFO) -> bool:
+    """Whether a diag record at `level` would be kept; check it before computing costly arguments.
+
+    A True answer consumes the sample, so log that record with `extra=DIAG_SAMPLED`.
+    """
+    diag_logger = get_diag_logger()
+    if not diag_logger.isEnabledFor(level):
+        return False
+    if level >= logging.WARNING:
+        return True
+    for f in diag_logger.filters:
+        if isinstance(f, SamplingFilter):
+            return f.sample()
+    return True
+
+
+def configure_logging(level: str = 'INFO', dedup_seconds: int = 5, log_file: str | None = None,
+                      queue_size: int = 10000, sample_every: int = 100,
+                      dedup_max_entries: int = 2048) -> logging.handlers.QueueListener:
+    """Install the queue based logging pipeline on the root logger.
+
+    Existing root handlers are replaced by a single NonBlockingQueueHandler; the
+    stream (and optional file) handlers run on a QueueListener thread. Calling
+    this again stops the previous listener first, so it is safe in reloaders.
+    """
+    global _listener, _queue_handler, _dedup_filter
+    _stop_listener()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    sinks = [logging.StreamHandler()]
+    if log_file:
+        sinks.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for h in sinks:
+        h.setFormatter(formatter)
+
+    q = queue.Queue(maxsize=max(0, int(queue_size)))
+    queue_handler = NonBlockingQueueHandler(q)
+    # Dedup before enqueueing so suppressed records never cost a queue slot.
+    dedup_filter = LoggingDedupFilter(window_seconds=dedup_seconds, max_entries=dedup_max_entries)
+    queue_handler.addFilter(dedup_filter)
+    _queue_handler, _dedup_filter = queue_handler, dedup_filter
+
+    root_logger = logging.getLogger()
+    for h in list(root_logger.handlers):
+        root_logger.removeHandler(h)
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(level)
+
+    diag_logger = get_diag_logger()
+    for f in list(diag_logger.filters):
+        if isinstance(f, SamplingFilter):
+            diag_logger.removeFilter(f)
+    diag_logger.addFilter(SamplingFilter(every=sample_every))
+
+    _listener = logging.handlers.QueueListener(q, *sinks, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def get_logging_stats() -> Dict[str, int]:
+    """Return pipeline counters: records suppressed by dedup and dropped on a full queue."""
+    stats = {'suppressed': 0, 'tracked': 0, 'dropped': 0}
+    if _dedup_filter is not None:
+        stats.update(_dedup_filter.stats())
+    if _queue_handler is not None:
+        stats['dropped'] = _queue_handler.dropped
+    return stats
+
+
+@atexit.register
+def _stop_listener() -> None:
+    """Flush and stop the active QueueListener (no-op when none is running)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
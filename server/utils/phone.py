@@ -0,0 +1,65 @@
+"""Phone number normalization (E.164, Vietnamese numbering by default).
+
+Numbers are stored and compared in one canonical form so the unique
+`user.phone_number` index can answer lookups directly:
+
+    normalize_phone('090 123 4567')   -> '+84901234567'
+    normalize_phone('84901234567')    -> '+84901234567'
+    normalize_phone('+84 (90) 123-4567') -> '+84901234567'
+    normalize_phone('0084901234567')  -> '+84901234567'
+    normalize_phone('+1 415 555 0100') -> '+14155550100'
+    normalize_phone('abc')            -> None
+
+Numbers with a leading `+` or `00` keep their own country code; national
+numbers (leading 0) and bare `84...` numbers are treated as Vietnamese.
+"""
+import hashlib
+import re
+
+DEFAULT_COUNTRY_CODE = '84'
+
+_SEPARATORS = re.compile(r'[\s().\-/]')
+# E.164: up to 15 digits after the +; 8 is the shortest plausible subscriber number here
+_MIN_DIGITS = 8
+_MAX_DIGITS = 15
+
+
+def normalize_phone(raw, country_code=DEFAULT_COUNTRY_CODE):
+    """Return `raw` as an E.164 string ('+84...'), or None when it is not a phone number."""
+    if raw is None:
+        return None
+    value = _SEPARATORS.sub('', str(raw).strip())
+    if not value:
+        return None
+    if value.startswith('+'):
+        digits = value[1:]
+    elif value.startswith('00'):
+        digits = value[2:]
+    elif value.startswith('0'):
+        digits = country_code + value[1:]
+    elif value.startswith(country_code) and len(value) > len(country_code) + _MIN_DIGITS - 1:
+        digits = value
+    else:
+        digits = country_code + value
+    if not digits.isdigit() or not _MIN_DIGITS <= len(digits) <= _MAX_DIGITS:
+        return None
+    if digits.startswith(country_code + '0'):
+        # '+84 0901...' is a common way of writing the national prefix twice
+        digits = country_code + digits[len(country_code) + 1:]
+    return '+' + digits
+
+
+def normalize_phones(values):
+    """Normalize an iterable of raw numbers into a set, dropping the invalid ones."""
+    phones = set()
+    for value in values or ():
+        phone = normalize_phone(value)
+        if phone:
+            phones.add(phone)
+    return phones
+
+
+def contacts_hash(phones):
+    """Order-independent digest of a set of normalized numbers (what clients echo back)."""
+    digest = hashlib.sha256('\n'.join(sorted(phones)).encode('utf-8'))
+    return digest.hexdigest()